@@ -0,0 +1,4 @@
+"""
+Package containing benchmarks for the import and API code paths.
+Each module can be run on its own, e.g. python -m benchmarks.memory_footprint
+"""
@@ -0,0 +1,373 @@
+"""
+Load test for the /emails and /emails/<id> endpoints.  A synthetic mailbox is seeded
+into an in-process stand-in for Mongo (or a real instance with --mongo-uri), the API
+is served by a threaded WSGI server, and concurrent clients work through deep pages,
+every sort field and every search filter.  Latency percentiles and requests per
+second for each scenario are printed as JSON.
+"""
+
+import sys
+import json
+import time
+import random
+import urllib
+import urllib2
+import platform
+import argparse
+import threading
+from datetime import datetime, timedelta
+from flask import abort
+from flask_pymongo.wrappers import MongoClient as FlaskMongoClient
+from werkzeug.serving import make_server, WSGIRequestHandler
+from common.config import AppConfig
+from common.email_message import EmailMessage, search_terms, normalize_search_value
+from common.data_facade import (
+    DataFacade,
+    DEFAULT_PAGE_SIZE,
+    SNIPPET_LENGTH,
+    SORTABLE_FIELDS,
+    SUBSTRING_SEARCH,
+    encode_cursor,
+    decode_cursor,
+    ensure_indexes,
+    MINIMUM_SERVER_VERSION
+)
+from web import api
+from web.cache import ByteSizedLRUCache
+from benchmarks.synthetic import words
+
+BENCHMARK_DATABASE = 'topsecret_benchmark'
+
+_people = ['Ben Peterson <killthrush@hotmail.com>', 'Mary Anne Lee <simitatores@yahoo.com>',
+           'Mihyun Lee <mihyun-_-vv@hanmail.net>', 'Mary Anne Lerma <ergoliterati@yahoo.com>']
+
+# Filters exercised by the search scenarios, as (name, query arguments)
+_filters = [
+    ('sender', {'sender': 'mary'}),
+    ('recipient', {'recipient': 'killthrush'}),
+    ('body', {'body': 'tempor'}),
+    ('sender_substring', {'sender': 'Lee', 'search': SUBSTRING_SEARCH}),
+    ('recipient_substring', {'recipient': 'yahoo', 'search': SUBSTRING_SEARCH}),
+    ('body_substring', {'body': 'dolor sit', 'search': SUBSTRING_SEARCH})
+]
+
+
+def synthetic_documents(count, seed=0):
+    """
+    Generate email documents as the importer stores them
+    :param count: The number of documents to generate
+    :param seed: The random seed, so runs are comparable
+    :return: A list of dicts
+    """
+    rng = random.Random(seed)
+    start = datetime(2001, 1, 1)
+    documents = []
+    for number in range(count):
+        sender, recipient = rng.sample(_people, 2)
+        message = EmailMessage(sender=sender, recipient=recipient, subject=words(rng, rng.randint(2, 12)),
+                               body=words(rng, rng.randint(20, 400)),
+                               date=(start + timedelta(minutes=rng.randint(0, 5000000))).isoformat())
+        for n in range(rng.choice([0, 0, 0, 1, 2])):
+            message.add_attachment(words(rng, 50), 'text/plain', filename='file{}.txt'.format(n))
+        document = message.to_dict()
+        document['_id'] = document['content_hash']
+        documents.append(document)
+    return documents
+
+
+class StandInCollection(object):
+    """
+    Answers the collection lookups the API makes, from memory
+    """
+    def __init__(self, documents):
+        self._by_id = dict((document['_id'], document) for document in documents)
+
+    def find_one_or_404(self, query):
+        document = self._by_id.get(query['_id'])
+        if document is None:
+            abort(404)
+        return document
+
+
+class StandInDatabase(object):
+    def __init__(self, documents):
+        self.email = StandInCollection(documents)
+
+
+class StandInFacade(object):
+    """
+    In-process stand-in for DataFacade that answers the same queries from a list of documents,
+    with collection scans in place of indexes.  It measures everything the API does around the
+    database, and gives load tests a baseline when no Mongo instance is available.
+    """
+    def __init__(self, documents):
+        self.db = StandInDatabase(documents)
+        self._sorted = dict((sort, sorted(documents, key=self._sort_key(sort)))
+                            for sort in SORTABLE_FIELDS + (None,))
+
+    @staticmethod
+    def _sort_key(sort):
+        if sort is None or sort == '_id':
+            return lambda document: document['_id']
+        return lambda document: (document.get(sort), document['_id'])
+
+    def ensure_indexes(self, collection_name, indexes=None):
+        return []
+
+    def import_generation(self):
+        return 0
+
+    def server_version(self):
+        return MINIMUM_SERVER_VERSION
+
+    def instrumentation_settings(self):
+        return {}
+
+    def load_page(self, collection_name, page=None, page_size=None, sort=None, cursor=None, search=None, fields=None,
+                  **kwargs):
+        if page_size is None:
+            page_size = DEFAULT_PAGE_SIZE
+        documents = self._matching(page, page_size, sort, cursor, search, kwargs)
+        next_cursor = encode_cursor(documents[page_size - 1], sort) if len(documents) > page_size else None
+        return (self._project(document, fields) for document in documents[:page_size]), next_cursor
+
+    def _matching(self, page, page_size, sort, cursor, search, parameters):
+        documents = [document for document in self._sorted[sort] if self._matches(document, search, parameters)]
+        if cursor is not None:
+            after = decode_cursor(cursor, sort)
+            key = self._sort_key(sort)
+            last = tuple(after) if sort and sort != '_id' else after[-1]
+            return [document for document in documents if key(document) > last]
+        return documents[((page or 1) - 1) * page_size:]
+
+    @staticmethod
+    def _matches(document, search, parameters):
+        for name, value in parameters.items():
+            if search == SUBSTRING_SEARCH:
+                if value not in document.get(name, u''):
+                    return False
+            elif name == 'body':
+                terms = normalize_search_value(value).split()
+                text = normalize_search_value(document['body'] + u' ' + document['subject']).split()
+                if not any(term in text for term in terms):
+                    return False
+            elif name in ('sender', 'recipient'):
+                prefix = normalize_search_value(value)
+                if not any(term.startswith(prefix) for term in search_terms(document.get(name))):
+                    return False
+            elif value not in document.get(name, u''):
+                return False
+        return True
+
+    @staticmethod
+    def _project(document, fields):
+        if fields is None:
+            return document
+        computed = {
+            'snippet': document.get('body', u'')[:SNIPPET_LENGTH],
+            'total_attachments': len(document.get('attachments') or [])
+        }
+        projected = {'_id': document['_id']}
+        for field in fields:
+            projected[field] = computed[field] if field in computed else document.get(field)
+        return projected
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class BenchmarkMongoClient(object):
+    """
+    Presents the benchmark database as a bound facade's `db`, with Flask-PyMongo's collection helpers
+    """
+    def __init__(self, mongo_uri):
+        self.cx = FlaskMongoClient(mongo_uri)
+        self.db = self.cx[BENCHMARK_DATABASE]
+
+
+def mongo_facade(mongo_uri, documents):
+    """
+    Seed the benchmark database of a real Mongo instance and bind a facade to it
+    :param mongo_uri: A URI of the mongo instance
+    :param documents: The documents to seed
+    :return: A bound DataFacade
+    """
+    client = BenchmarkMongoClient(mongo_uri)
+    collection = client.db[AppConfig.email_collection]
+    collection.delete_many({})
+    for start in range(0, len(documents), 1000):
+        collection.insert_many(documents[start:start + 1000])
+    ensure_indexes(collection)
+    facade = DataFacade()
+    facade._client = client
+    return facade
+
+
+def scenarios(documents, page_size, rng):
+    """
+    Build the request mix of each scenario
+    :param documents: The seeded documents
+    :param page_size: The page size of list requests
+    :param rng: A random.Random instance
+    :return: A list of (name, function returning a request path) tuples
+    """
+    ids = [document['_id'] for document in documents]
+    last_page = max(1, len(documents) // page_size)
+
+    def path(arguments):
+        arguments = dict(arguments, page_size=page_size)
+        return '/emails?' + urllib.urlencode(sorted(arguments.items()))
+
+    mix = [
+        ('emails_by_id', lambda: '/emails/' + rng.choice(ids)),
+        ('emails_first_page', lambda: path({})),
+        ('emails_deep_page', lambda: path({'page': rng.randint(last_page // 2, last_page)}))
+    ]
+    for sort in SORTABLE_FIELDS:
+        mix.append(('emails_sort_' + sort, lambda sort=sort: path({'sort': sort, 'page': rng.randint(1, last_page)})))
+    for name, arguments in _filters:
+        mix.append(('emails_filter_' + name, lambda arguments=arguments: path(arguments)))
+    return mix
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest-rank percentile of an ordered list
+    :param ordered: The sorted values
+    :param fraction: The percentile, e.g. 0.95
+    :return: The value at that rank
+    """
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def drive(base_url, make_path, requests, concurrency):
+    """
+    Send a number of requests with several concurrent clients
+    :param base_url: The URL the API is served at
+    :param make_path: A function returning the path of the next request
+    :param requests: The total number of requests to send
+    :param concurrency: The number of concurrent clients
+    :return: A dict of latency percentiles in milliseconds, throughput and error counts
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                path = make_path()
+            start = time.time()
+            try:
+                urllib2.urlopen(base_url + path).read()
+            except urllib2.URLError:
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.time() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.time() - start
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / wall, 1) if wall else None,
+        'mean_ms': round(sum(ordered) * 1000 / len(ordered), 3) if ordered else None,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3) if ordered else None
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--messages', type=int, default=10000, help='number of seeded messages')
+    arg_parser.add_argument('--requests', type=int, default=500, help='requests sent in each scenario')
+    arg_parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    arg_parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='page size of list requests')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed for the mailbox and request mix')
+    arg_parser.add_argument('--mongo-uri', default=None, help='seed and query this mongo instance instead of the stand-in')
+    arg_parser.add_argument('--cache', action='store_true', help="keep the API's response caches enabled")
+    arg_parser.add_argument('--output', default=None, help='write the JSON results to this file instead of stdout')
+    args = arg_parser.parse_args()
+
+    documents = synthetic_documents(args.messages, args.seed)
+    if args.mongo_uri:
+        facade = mongo_facade(args.mongo_uri, documents)
+    else:
+        facade = StandInFacade(documents)
+    api.data_facade = facade
+    if not args.cache:
+        # measure the data path on every request rather than the response caches
+        api.email_cache = ByteSizedLRUCache(0)
+        api.page_cache = ByteSizedLRUCache(0)
+    api.app.logger.disabled = True
+
+    server = make_server('127.0.0.1', 0, api.app, threaded=True, request_handler=QuietRequestHandler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    results = []
+    try:
+        for name, make_path in scenarios(documents, args.page_size, random.Random(args.seed)):
+            result = drive(base_url, make_path, args.requests, args.concurrency)
+            result['scenario'] = name
+            results.append(result)
+            print >> sys.stderr, '{:<30} {:>8} req/s  p50 {:>8} ms  p95 {:>8} ms  p99 {:>8} ms  {} errors'.format(
+                name, result['requests_per_second'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['errors'])
+    finally:
+        server.shutdown()
+        if args.mongo_uri:
+            facade.db.client.drop_database(BENCHMARK_DATABASE)
+
+    report = {
+        'benchmark': 'api_load',
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'parameters': {
+            'messages': args.messages,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'page_size': args.page_size,
+            'seed': args.seed,
+            'backend': 'mongo' if args.mongo_uri else 'stand-in',
+            'cache': args.cache
+        },
+        'scenarios': results
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print output
+
+    failed = [result for result in results if result['errors']]
+    for result in failed:
+        print >> sys.stderr, 'ERRORS {}: {} of {} requests failed'.format(
+            result['scenario'], result['errors'], result['errors'] + result['requests'])
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
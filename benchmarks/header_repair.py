@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for the header-repair stage, comparing the single-pass precompiled
+header matcher against the previous per-line scan of the header list.
+"""
+
+import timeit
+import argparse
+from data_import import email_parsing_helpers
+from data_import.email_parsing_helpers import fix_broken_hotmail_headers, fix_broken_yahoo_headers
+from benchmarks.synthetic import broken_messages
+
+
+def legacy_merge_broken_header_lines(accumulator, item):
+    """
+    Copy of the previous reduce-based header merge, kept for comparison
+    """
+    cleaned_item = item.strip()
+    for header in email_parsing_helpers._header_list:
+        if item.startswith(header):
+            accumulator.append(cleaned_item)
+            return accumulator
+    try:
+        accumulator[len(accumulator)-1] = accumulator[len(accumulator)-1] + ' ' + cleaned_item
+    except IndexError:
+        accumulator.append(cleaned_item)
+    return accumulator
+
+
+def legacy_merge(lines):
+    return reduce(legacy_merge_broken_header_lines, lines, [])
+
+
+def header_blocks(messages):
+    """
+    Extract the raw header lines of each message, as the repair functions see them
+    """
+    blocks = []
+    for kind, text in messages:
+        if kind == 'hotmail':
+            end = email_parsing_helpers._end_of_simple_header_pattern.search(text).end()
+            blocks.append(text[:end].strip().splitlines()[1:])
+        else:
+            end = email_parsing_helpers._end_of_multipart_header_pattern.search(text).end()
+            blocks.append(text[:end].strip().splitlines())
+    return blocks
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--messages', type=int, default=2000, help='number of synthetic messages')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='number of timed runs; the best is reported')
+    args = arg_parser.parse_args()
+
+    messages = broken_messages(args.messages)
+    blocks = header_blocks(messages)
+    merge = email_parsing_helpers._merge_broken_header_lines
+    for block in blocks:
+        assert merge(block) == legacy_merge(block), 'merge results differ'
+
+    def run(function):
+        return lambda: [function(block) for block in blocks]
+
+    def repair():
+        for kind, text in messages:
+            if kind == 'hotmail':
+                fix_broken_hotmail_headers(text)
+            else:
+                fix_broken_yahoo_headers(text)
+
+    total_lines = sum(len(block) for block in blocks)
+    print '{} messages, {} header lines'.format(len(messages), total_lines)
+    for name, function in (('legacy merge', run(legacy_merge)), ('matcher merge', run(merge)), ('full repair', repair)):
+        best = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print '{:<14} {:>8.1f} ms {:>8.2f} us/line'.format(name, best * 1000, best * 1e6 / total_lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Benchmark for each stage of the import, run against a synthetic mailbox made of an
+Outlook XML dump and an .eml directory.  Results are printed as JSON, and can be
+checked against an earlier run to catch regressions before a real import.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import xml.etree.ElementTree as ElementTree
+from StringIO import StringIO
+from email.parser import Parser
+from datetime import datetime
+from pymongo.errors import PyMongoError
+from common.config import AppConfig
+from common.connection import get_client
+from common.attachment_store import AttachmentStore
+from data_import.xml_dump_processor import XMLDumpProcessor
+from data_import.eml_directory_processor import EMLDirectoryProcessor
+from data_import.email_parsing_helpers import fix_broken_hotmail_headers, fix_broken_yahoo_headers, get_nested_payload
+from data_import.batch_writer import BatchWriter
+from benchmarks.synthetic import write_xml_dump, write_eml_directory
+
+BENCHMARK_DATABASE = 'topsecret_benchmark'
+
+
+def timed(function, repeat, setup=None):
+    """
+    Time a function, keeping the best of several runs
+    :param function: The function to time.  Its result from the last run is returned.
+    :param repeat: The number of timed runs
+    :param setup: Optional function run untimed before each run
+    :return: A tuple of the best time in seconds and the last result
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def raw_messages(xml_path, eml_directory):
+    """
+    Read the raw MIME texts back out of the synthetic sources, as the processors see them
+    :param xml_path: The synthetic XML dump
+    :param eml_directory: The synthetic .eml directory
+    :return: A list of (kind, text) tuples where kind is 'hotmail' or 'yahoo'
+    """
+    texts = []
+    for node in ElementTree.parse(xml_path).getroot():
+        text = unicode(node.find('text').text).lstrip(u'>')
+        if 'Content-Length:' in text:
+            texts.append(('hotmail', text))
+    for file_name in sorted(os.listdir(eml_directory)):
+        with open(os.path.join(eml_directory, file_name), 'rb') as eml_file:
+            texts.append(('yahoo', unicode(eml_file.read(), 'windows-1252')))
+    return texts
+
+
+def repair(texts):
+    return [fix_broken_hotmail_headers(text) if kind == 'hotmail' else fix_broken_yahoo_headers(text)
+            for kind, text in texts]
+
+
+def parse_mime(texts):
+    return [Parser().parse(StringIO(text)) for text in texts]
+
+
+def extract_payloads(mime_messages):
+    return [get_nested_payload(mime_message) for mime_message in mime_messages]
+
+
+def reset_hashes(messages):
+    for message in messages:
+        message._content_hash = None
+
+
+def hash_messages(messages):
+    return [message.content_hash for message in messages]
+
+
+def serialize(messages):
+    return [message.to_dict() for message in messages]
+
+
+def write_to_mongo(db, messages, batch_size):
+    """
+    Write messages the way the importer does: attachments to the store, documents through a batch writer
+    :param db: The benchmark database
+    :param messages: The EmailMessage instances to write
+    :param batch_size: The batch writer's batch size
+    :return: The number of documents inserted
+    """
+    store = AttachmentStore(db)
+    writer = BatchWriter(db[AppConfig.email_collection], batch_size)
+    for message in messages:
+        document = message.to_dict()
+        document['_id'] = document['content_hash']
+        for attachment in message.attachments:
+            store.put(attachment)
+        writer.add(document)
+    writer.flush()
+    return writer.inserted_count
+
+
+def run_stages(args, work_directory):
+    """
+    Generate the synthetic mailbox and time every stage of the import against it
+    :param args: The parsed command line arguments
+    :param work_directory: A scratch directory for the synthetic sources
+    :return: A list of stage result dicts
+    """
+    timezone = 'US/Eastern'
+    xml_path = write_xml_dump(os.path.join(work_directory, 'dump.xml'), args.xml_messages, args.seed)
+    eml_directory = write_eml_directory(os.path.join(work_directory, 'eml'), args.eml_messages, args.seed,
+                                        args.attachments)
+    texts = raw_messages(xml_path, eml_directory)
+    results = []
+
+    def stage(name, items, function, setup=None):
+        seconds, result = timed(function, args.repeat, setup)
+        results.append({
+            'stage': name,
+            'items': items,
+            'seconds': round(seconds, 6),
+            'us_per_item': round(seconds * 1e6 / items, 3) if items else None
+        })
+        print >> sys.stderr, '{:<22} {:>8} items {:>10.1f} ms {:>10.1f} us/item'.format(
+            name, items, seconds * 1000, seconds * 1e6 / items if items else 0)
+        return result
+
+    stage('xml_dump_processor', args.xml_messages, lambda: XMLDumpProcessor(xml_path, timezone).process())
+    stage('eml_directory', args.eml_messages, lambda: EMLDirectoryProcessor(eml_directory, timezone).process())
+    if args.eml_workers > 1:
+        stage('eml_directory_pool', args.eml_messages,
+              lambda: EMLDirectoryProcessor(eml_directory, timezone, workers=args.eml_workers).process())
+    fixed_texts = stage('header_repair', len(texts), lambda: repair(texts))
+    mime_messages = stage('mime_parse', len(texts), lambda: parse_mime(fixed_texts))
+    messages = stage('get_nested_payload', len(texts), lambda: extract_payloads(mime_messages))
+    stage('content_hash', len(messages), lambda: hash_messages(messages), lambda: reset_hashes(messages))
+    stage('to_dict', len(messages), lambda: serialize(messages))
+    if not args.skip_mongo:
+        db = get_client(args.mongo_uri)[BENCHMARK_DATABASE]
+        try:
+            stage('mongo_write', len(messages), lambda: write_to_mongo(db, messages, args.batch_size),
+                  lambda: db.client.drop_database(BENCHMARK_DATABASE))
+            db.client.drop_database(BENCHMARK_DATABASE)
+        except PyMongoError as e:
+            print >> sys.stderr, 'Skipping mongo_write: {}'.format(e)
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Find the stages that got slower than an earlier run by more than a tolerance
+    :param results: The stage results of this run
+    :param baseline: The parsed JSON output of an earlier run
+    :param tolerance: The allowed slowdown, as a fraction of the baseline time per item
+    :return: A list of (stage, baseline us/item, current us/item) tuples
+    """
+    previous = dict((result['stage'], result) for result in baseline['stages'])
+    slower = []
+    for result in results:
+        before = previous.get(result['stage'])
+        if not before or not before['us_per_item'] or not result['us_per_item']:
+            continue
+        if result['us_per_item'] > before['us_per_item'] * (1 + tolerance):
+            slower.append((result['stage'], before['us_per_item'], result['us_per_item']))
+    return slower
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--xml-messages', type=int, default=1000, help='number of messages in the XML dump')
+    arg_parser.add_argument('--eml-messages', type=int, default=1000, help='number of .eml files')
+    arg_parser.add_argument('--attachments', type=int, default=1, help='attachments in each .eml file')
+    arg_parser.add_argument('--eml-workers', type=int, default=1, help='also time a pool of this many parsers')
+    arg_parser.add_argument('--batch-size', type=int, default=500, help='batch size of the mongo write stage')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='number of timed runs; the best is reported')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic mailbox')
+    arg_parser.add_argument('--mongo-uri', default=None, help='mongo instance for the write stage')
+    arg_parser.add_argument('--skip-mongo', action='store_true', help='do not time the mongo write stage')
+    arg_parser.add_argument('--output', default=None, help='write the JSON results to this file instead of stdout')
+    arg_parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare against')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = arg_parser.parse_args()
+
+    work_directory = tempfile.mkdtemp(prefix='import_benchmark_')
+    try:
+        stages = run_stages(args, work_directory)
+    finally:
+        shutil.rmtree(work_directory)
+
+    report = {
+        'benchmark': 'import_stages',
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'parameters': {
+            'xml_messages': args.xml_messages,
+            'eml_messages': args.eml_messages,
+            'attachments': args.attachments,
+            'eml_workers': args.eml_workers,
+            'batch_size': args.batch_size,
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'stages': stages
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print output
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            slower = regressions(stages, json.load(baseline_file), args.tolerance)
+        for name, before, after in slower:
+            print >> sys.stderr, 'REGRESSION {}: {:.1f} -> {:.1f} us/item'.format(name, before, after)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark that measures how many bytes of memory each EmailMessage (including its
+attachments) occupies on a synthetic corpus, comparing the compact slotted
+representation against the previous dict-backed one.
+"""
+
+import sys
+import base64
+import hashlib
+import random
+import argparse
+from datetime import datetime
+from common.email_message import EmailMessage
+
+_words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+          'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore']
+
+
+class LegacyAttachment:
+    """
+    Replica of the previous Attachment layout: a per-instance __dict__
+    holding the attachment as base64 text.
+    """
+    def __init__(self, content, content_type, filename=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.base64_content = unicode(base64.b64encode(content))
+
+
+class LegacyEmailMessage:
+    """
+    Replica of the previous EmailMessage layout: a per-instance __dict__
+    and an md5 hasher allocated for every message.
+    """
+    def __init__(self, sender, recipient, subject, date, body):
+        self.attachments = []
+        self.ordinal_number = None
+        self._date = None
+        self.source = None
+        self.hasher = hashlib.md5()
+        self.sender = sender
+        self.recipient = recipient
+        self.subject = subject
+        self.date = date
+        self.body = body
+
+
+def deep_size(obj, seen=None):
+    """
+    Approximates the memory held by an object and everything it references
+    :param obj: The object to measure
+    :param seen: ids of objects already counted
+    :return: The size in bytes
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_size(getattr(obj, slot), seen)
+    return size
+
+
+def generate_fields(count, seed=0):
+    """
+    Generates the raw fields of a synthetic corpus
+    :param count: The number of messages to generate
+    :param seed: The random seed, so runs are comparable
+    :return: A list of (fields, attachments) tuples
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        fields = {
+            'sender': u'Sender {} <sender{}@example.com>'.format(i % 17, i % 17),
+            'recipient': u'Recipient {} <recipient{}@example.com>'.format(i % 13, i % 13),
+            'subject': u'Subject {}'.format(i),
+            'date': datetime(2003, 1 + i % 12, 1 + i % 28),
+            'body': u' '.join(rng.choice(_words) for _ in range(rng.randint(50, 400)))
+        }
+        attachments = [(str(bytearray(rng.getrandbits(8) for _ in range(rng.randint(512, 8192)))),
+                        'application/octet-stream', 'file{}.bin'.format(n))
+                       for n in range(rng.randint(0, 2))]
+        corpus.append((fields, attachments))
+    return corpus
+
+
+def build_current(corpus):
+    messages = []
+    for fields, attachments in corpus:
+        message = EmailMessage()
+        for name, value in fields.items():
+            setattr(message, name, value)
+        for content, content_type, filename in attachments:
+            message.add_attachment(content, content_type, filename=filename)
+        messages.append(message)
+    return messages
+
+
+def build_legacy(corpus):
+    messages = []
+    for fields, attachments in corpus:
+        message = LegacyEmailMessage(**fields)
+        for content, content_type, filename in attachments:
+            message.attachments.append(LegacyAttachment(content, content_type, filename=filename))
+        messages.append(message)
+    return messages
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--messages', type=int, default=2000, help='number of synthetic messages')
+    args = arg_parser.parse_args()
+
+    corpus = generate_fields(args.messages)
+    for name, builder in (('legacy', build_legacy), ('current', build_current)):
+        messages = builder(corpus)
+        total = sum(deep_size(message) for message in messages)
+        print '{:<8} {:>12,} bytes total {:>10,.0f} bytes/message'.format(name, total, float(total) / len(messages))
+
+
+if __name__ == '__main__':
+    main()
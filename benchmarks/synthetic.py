@@ -0,0 +1,171 @@
+"""
+Module that generates synthetic email content for benchmarks, including
+the broken header layouts produced by the Hotmail and Yahoo exports.
+"""
+
+import os
+import random
+from xml.sax.saxutils import escape
+
+_words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+          'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore']
+
+
+def words(rng, count):
+    """
+    Generate filler text
+    :param rng: A random.Random instance
+    :param count: The number of words to generate
+    :return: string
+    """
+    return ' '.join(rng.choice(_words) for _ in range(count))
+
+
+def _break_line(rng, line):
+    """
+    Break a header line at random spaces the way the broken exports do
+    :param rng: A random.Random instance
+    :param line: The header line to break
+    :return: A list of lines
+    """
+    pieces = []
+    while rng.random() < 0.6:
+        spaces = [i for i, char in enumerate(line) if char == ' ' and i > 10]
+        if not spaces:
+            break
+        split_at = rng.choice(spaces)
+        pieces.append(line[:split_at])
+        line = ' ' * rng.randint(0, 4) + line[split_at + 1:]
+    pieces.append(line)
+    return pieces
+
+
+def _header_lines(rng, number, extra_headers, end_of_header):
+    headers = [
+        'From: "Ben Peterson" <killthrush@hotmail.com>',
+        'To: Mary Anne Lee <simitatores@yahoo.com>',
+        'Subject: {} {}'.format(number, words(rng, rng.randint(2, 12))),
+        'Date: Mon, {} Jan 2003 10:{:02d}:00 -0500'.format(1 + number % 28, number % 60),
+        'Message-ID: <{}.{}@mail.example.com>'.format(number, rng.getrandbits(32)),
+        'Received: from {} by mail.example.com with SMTP; {}'.format(words(rng, 4), words(rng, 6)),
+        'X-Originating-IP: [10.0.{}.{}]'.format(number % 255, rng.randint(0, 255)),
+        'X-Message-Info: {}'.format(words(rng, rng.randint(4, 20)))
+    ] + extra_headers
+    lines = []
+    for header in headers:
+        lines += _break_line(rng, header)
+    return lines + [end_of_header]  # the repair functions locate this line, so it is never broken
+
+
+def broken_hotmail_message(rng, number):
+    """
+    Generate the text of a Hotmail export with broken header lines
+    :param rng: A random.Random instance
+    :param number: A sequence number used to vary the content
+    :return: string
+    """
+    body = words(rng, rng.randint(20, 300))
+    lines = ['>From killthrush@hotmail.com Mon Jan 1 2003'] + _header_lines(rng, number, [
+        'Mime-Version: 1.0',
+        'Content-Type: text/plain; format=flowed'
+    ], 'Content-Length: {}'.format(len(body)))
+    return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+
+def broken_yahoo_message(rng, number, attachments=0):
+    """
+    Generate the text of a multipart Yahoo export with broken header lines
+    :param rng: A random.Random instance
+    :param number: A sequence number used to vary the content
+    :param attachments: The number of base64 attachments to include
+    :return: string
+    """
+    boundary = '0-{}-{}'.format(number, rng.getrandbits(24))
+    # use_full_parser() looks for the Content-Length line, so it is kept whole as well
+    lines = _header_lines(rng, number, [
+        'MIME-Version: 1.0',
+        'Content-Type: multipart/mixed; boundary="{}"'.format(boundary)
+    ], 'Content-Length: {}'.format(rng.randint(100, 9999))) + [
+        'X-OriginalArrivalTime: 01 Jan 2003 15:{:02d}:00.0000 (UTC) FILETIME=[{}]'.format(number % 60, rng.getrandbits(32))
+    ]
+    parts = [
+        'Content-Type: text/plain; charset=us-ascii\r\n\r\n{}\r\n\r\nDo You Yahoo!?\r\n{}'.format(
+            words(rng, rng.randint(20, 300)), words(rng, 10)),
+        'Content-Type: text/html; charset=us-ascii\r\n\r\n<p>{}</p>'.format(words(rng, 40))
+    ]
+    for n in range(attachments):
+        content = ''.join(chr(rng.getrandbits(8)) for _ in range(rng.randint(256, 4096))).encode('base64')
+        parts.append('Content-Type: application/octet-stream; name="file{0}.bin"\r\n'
+                     'Content-Transfer-Encoding: base64\r\n'
+                     'Content-Disposition: attachment; filename="file{0}.bin"\r\n\r\n{1}'.format(n, content))
+    body = ''.join('--{}\r\n{}\r\n'.format(boundary, part) for part in parts) + '--{}--\r\n'.format(boundary)
+    return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+
+def broken_messages(count, seed=0):
+    """
+    Generate an even mix of broken Hotmail and Yahoo message texts
+    :param count: The number of messages to generate
+    :param seed: The random seed, so runs are comparable
+    :return: A list of (kind, text) tuples where kind is 'hotmail' or 'yahoo'
+    """
+    rng = random.Random(seed)
+    return [('hotmail', broken_hotmail_message(rng, i)) if i % 2 == 0 else ('yahoo', broken_yahoo_message(rng, i))
+            for i in range(count)]
+
+
+def plain_message_text(rng):
+    """
+    Generate the text of an XML dump message that has no MIME headers,
+    so the processor takes its fields from the XML nodes instead
+    :param rng: A random.Random instance
+    :return: string
+    """
+    return '{}\r\n\r\n{}'.format(words(rng, rng.randint(20, 300)), words(rng, rng.randint(5, 50)))
+
+
+def write_xml_dump(path, count, seed=0, plain_ratio=0.25):
+    """
+    Write a synthetic Outlook XML dump.  Most messages carry a broken Hotmail MIME text;
+    the rest are plain texts whose fields live in the XML nodes.
+    :param path: The path of the XML file to write
+    :param count: The number of messages to write
+    :param seed: The random seed, so runs are comparable
+    :param plain_ratio: The share of messages without MIME headers
+    :return: The path written
+    """
+    rng = random.Random(seed)
+    with open(path, 'wb') as xml_file:
+        xml_file.write('<?xml version="1.0" encoding="utf-8"?>\n<messages>\n')
+        for number in range(count):
+            if rng.random() < plain_ratio:
+                text = plain_message_text(rng)
+            else:
+                text = broken_hotmail_message(rng, number)
+            xml_file.write(
+                '<message id="{0}"><subject>{1}</subject>'
+                '<from><name>Ben Peterson</name><email>killthrush@hotmail.com</email></from>'
+                '<to><name>Mary Anne Lee</name><email>simitatores@yahoo.com</email></to>'
+                '<receivedat><date>1/{2}/2003</date><time>10:{3:02d} AM</time></receivedat>'
+                '<text>{4}</text></message>\n'.format(
+                    number, escape(words(rng, rng.randint(2, 12))), 1 + number % 28, number % 60, escape(text)))
+        xml_file.write('</messages>\n')
+    return path
+
+
+def write_eml_directory(path, count, seed=0, attachments=1):
+    """
+    Write a directory of synthetic multipart Yahoo .eml files with broken header lines
+    :param path: The directory to write, which is created if needed
+    :param count: The number of files to write
+    :param seed: The random seed, so runs are comparable
+    :param attachments: The number of base64 attachments in each message
+    :return: The path written
+    """
+    rng = random.Random(seed)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for number in range(count):
+        with open(os.path.join(path, '{:08d}.eml'.format(number)), 'wb') as eml_file:
+            eml_file.write(broken_yahoo_message(rng, number, attachments))
+    return path
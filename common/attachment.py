@@ -1,24 +1,56 @@
-class Attachment:
+import base64
+import hashlib
+
+
+class Attachment(object):
     """
     Encapsulates an abstraction of an email attachment that's useful
     for processing and storage
     """
+    __slots__ = ('filename', 'content_type', 'content', '_digest')
+
     def __init__(self, content, content_type, filename=None):
         """
         Initializer for the Attachment class
+        :param content: the decoded bytes of the attachment
+        :param content_type: the MIME type of the attachment
+        :param filename: the original filename of the attachment
         :return: None
         """
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
         self.filename = filename
         self.content_type = content_type
-        self.base64_content = content
+        self.content = content or ''
+        self._digest = None
+
+    @property
+    def digest(self):
+        """
+        Calculates an MD5 hash of the attachment content, used as its address in the attachment store
+        :return: string
+        """
+        if self._digest is None:
+            self._digest = hashlib.md5(self.content).hexdigest()
+        return self._digest
+
+    @property
+    def base64_content(self):
+        """
+        Returns the attachment content encoded as base64 text
+        :return: string
+        """
+        return base64.b64encode(self.content)
 
     def to_dict(self):
         """
-        Returns a dict representation of the attachment
+        Returns a dict representation of the attachment.  The content itself is
+        kept in the attachment store and only referenced here by its digest.
         :return: dict
         """
         return {
             'filename': self.filename,
             'content_type': self.content_type,
-            'content': self.base64_content
+            'digest': self.digest,
+            'length': len(self.content)
         }
@@ -0,0 +1,51 @@
+import gridfs
+from gridfs.errors import FileExists
+from common.config import AppConfig
+
+
+class AttachmentStore(object):
+    """
+    Content-addressed store for attachment content, kept in GridFS chunks
+    outside of the email documents that reference it
+    """
+    def __init__(self, db, collection_name=None):
+        """
+        Initializer for the AttachmentStore class
+        :param db: The pymongo database holding the store
+        :param collection_name: The GridFS collection prefix to use.  Defaults to the configured one.
+        :return: None
+        """
+        collection_name = collection_name or AppConfig.attachment_collection
+        self._fs = gridfs.GridFS(db, collection_name)
+        self._collection = db[collection_name]
+
+    def put(self, attachment):
+        """
+        Store the content of an attachment, unless content with the same digest is already stored
+        :param attachment: The Attachment instance to store
+        :return: The digest the content is stored under
+        """
+        if not self._fs.exists(attachment.digest):
+            try:
+                self._fs.put(attachment.content, _id=attachment.digest,
+                             content_type=attachment.content_type, filename=attachment.filename)
+            except FileExists:
+                pass  # stored concurrently by another writer
+        return attachment.digest
+
+    def clear(self):
+        """
+        Remove all stored content
+        :return: None
+        """
+        self._collection.files.delete_many({})
+        self._collection.chunks.delete_many({})
+
+    def open(self, digest):
+        """
+        Open stored attachment content for reading.  The returned file reads
+        its chunks lazily and can be iterated chunk by chunk.
+        :param digest: The digest of the content
+        :return: A GridOut file.  Raises gridfs.errors.NoFile if nothing is stored under the digest.
+        """
+        return self._fs.get(digest)
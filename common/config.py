@@ -10,13 +10,57 @@ def _create_config(env):
             "app_name": "topsecret",
             "mongo_uri": "mongodb://localhost:27017",
             "email_collection": "email",
-            "source_collection": "source"
+            "source_collection": "source",
+            "attachment_collection": "attachment",
+            "meta_collection": "meta",
+            "email_cache_bytes": 64 * 1024 * 1024,
+            "page_cache_bytes": 64 * 1024 * 1024,
+            "page_cache_entry_bytes": 1024 * 1024,
+            "facet_cache_bytes": 16 * 1024 * 1024,
+            "cache_check_interval": 10,
+            "mongo_max_pool_size": 50,
+            "mongo_connect_timeout_ms": 5000,
+            "mongo_socket_timeout_ms": 30000,
+            "mongo_server_selection_timeout_ms": 10000,
+            "mongo_wait_queue_timeout_ms": 5000,
+            "mongo_write_concern": 1,
+            "mongo_read_preference": "PRIMARY",
+            "api_read_preference": "SECONDARY_PREFERRED",
+            "web_bind": "localhost:8080",
+            "web_workers": 0,
+            "web_threads": 8,
+            "request_timing": False,
+            "slow_query_ms": None,
+            "profile_sample_rate": 0.0,
+            "profile_directory": "/tmp/topsecret_profiles"
         },
         "build_buddy": {
             "app_name": "topsecret",
             "mongo_uri": "mongodb://mongo:27017",
             "email_collection": "email",
-            "source_collection": "source"
+            "source_collection": "source",
+            "attachment_collection": "attachment",
+            "meta_collection": "meta",
+            "email_cache_bytes": 64 * 1024 * 1024,
+            "page_cache_bytes": 64 * 1024 * 1024,
+            "page_cache_entry_bytes": 1024 * 1024,
+            "facet_cache_bytes": 16 * 1024 * 1024,
+            "cache_check_interval": 10,
+            "mongo_max_pool_size": 50,
+            "mongo_connect_timeout_ms": 5000,
+            "mongo_socket_timeout_ms": 30000,
+            "mongo_server_selection_timeout_ms": 10000,
+            "mongo_wait_queue_timeout_ms": 5000,
+            "mongo_write_concern": 1,
+            "mongo_read_preference": "PRIMARY",
+            "api_read_preference": "SECONDARY_PREFERRED",
+            "web_bind": "0.0.0.0:8080",
+            "web_workers": 0,
+            "web_threads": 8,
+            "request_timing": False,
+            "slow_query_ms": None,
+            "profile_sample_rate": 0.0,
+            "profile_directory": "/tmp/topsecret_profiles"
         }
     }
     config_type = namedtuple('Config', config[env].keys())
@@ -0,0 +1,109 @@
+import os
+import threading
+from pymongo import MongoClient
+from pymongo.read_preferences import ReadPreference
+from common.config import AppConfig
+
+# Shared clients, keyed by (process id, uri, read preference name)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def read_preference(name=None):
+    """
+    Looks up a pymongo read preference by name
+    :param name: The ReadPreference name, e.g. 'SECONDARY_PREFERRED'.  Defaults to the configured one.
+    :return: The matching read preference
+    """
+    name = name or AppConfig.mongo_read_preference
+    preference = getattr(ReadPreference, name.upper(), None)
+    if preference is None:
+        raise ValueError("Unknown read preference {}".format(name))
+    return preference
+
+
+def client_options(read_preference_name=None):
+    """
+    Builds the MongoClient keyword arguments for the configured pool, timeout and write concern settings
+    :param read_preference_name: The ReadPreference name to use.  Defaults to the configured one.
+    :return: dict
+    """
+    return {
+        'maxPoolSize': AppConfig.mongo_max_pool_size,
+        'connectTimeoutMS': AppConfig.mongo_connect_timeout_ms,
+        'socketTimeoutMS': AppConfig.mongo_socket_timeout_ms,
+        'serverSelectionTimeoutMS': AppConfig.mongo_server_selection_timeout_ms,
+        'waitQueueTimeoutMS': AppConfig.mongo_wait_queue_timeout_ms,
+        'w': AppConfig.mongo_write_concern,
+        'read_preference': read_preference(read_preference_name)
+    }
+
+
+def flask_options(read_preference_name=None):
+    """
+    Builds the Flask-PyMongo config keys for the configured pool, timeout and write concern settings.
+    Flask-PyMongo passes the pool size under a name pymongo 3 rejects and has no keys for
+    server selection or write concern, so those travel as options on the host URI instead.
+    :param read_preference_name: The ReadPreference name to use.  Defaults to the configured one.
+    :return: dict
+    """
+    return {
+        'MONGO_HOST': uri_with_options(AppConfig.mongo_uri, {
+            'maxPoolSize': AppConfig.mongo_max_pool_size,
+            'serverSelectionTimeoutMS': AppConfig.mongo_server_selection_timeout_ms,
+            'waitQueueTimeoutMS': AppConfig.mongo_wait_queue_timeout_ms,
+            'w': AppConfig.mongo_write_concern
+        }),
+        'MONGO_CONNECT_TIMEOUT_MS': AppConfig.mongo_connect_timeout_ms,
+        'MONGO_SOCKET_TIMEOUT_MS': AppConfig.mongo_socket_timeout_ms,
+        'MONGO_READ_PREFERENCE': read_preference(read_preference_name),
+        # connect on first use, so a client created before a fork is never shared with the children
+        'MONGO_CONNECT': False
+    }
+
+
+def uri_with_options(mongo_uri, options):
+    """
+    Appends connection options to the query string of a mongodb URI
+    :param mongo_uri: The URI, e.g. 'mongodb://localhost:27017'
+    :param options: A dict of option names and values
+    :return: The URI with the options appended
+    """
+    query = '&'.join('{}={}'.format(name, value) for name, value in sorted(options.items()))
+    if '?' in mongo_uri:
+        separator = '&'
+    elif '/' in mongo_uri.split('://', 1)[-1]:
+        separator = '?'
+    else:
+        separator = '/?'
+    return mongo_uri + separator + query
+
+
+def get_client(mongo_uri=None, read_preference_name=None):
+    """
+    Returns the shared MongoClient for this process, creating it on first use.
+    A forked process gets a client of its own rather than the one inherited from its parent.
+    :param mongo_uri: A URI of a mongo instance.  Defaults to the configured one.
+    :param read_preference_name: The ReadPreference name to use.  Defaults to the configured one.
+    :return: MongoClient
+    """
+    mongo_uri = mongo_uri or AppConfig.mongo_uri
+    read_preference_name = (read_preference_name or AppConfig.mongo_read_preference).upper()
+    key = (os.getpid(), mongo_uri, read_preference_name)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = MongoClient(mongo_uri, connect=False, **client_options(read_preference_name))
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """
+    Closes and forgets every shared client created by this process
+    :return: None
+    """
+    with _clients_lock:
+        pid = os.getpid()
+        for key in [key for key in _clients if key[0] == pid]:
+            _clients.pop(key).close()
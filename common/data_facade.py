@@ -1,10 +1,96 @@
 from flask_pymongo import PyMongo
-from pymongo import MongoClient
+from pymongo import IndexModel, ASCENDING, TEXT, ReadPreference
+from bson import json_util
+from bson.son import SON
 from functools import wraps
+from collections import deque
+from datetime import datetime
+from pymongo.errors import PyMongoError
+import base64
+import logging
 import re
+import time
+import threading
+from common.config import AppConfig
+from common.email_message import normalize_search_value
+from common.attachment_store import AttachmentStore
+from common.connection import get_client, flask_options
 
 DEFAULT_PAGE_SIZE = 10
 
+# ID of the document in the meta collection that records completed imports
+IMPORT_STATUS_ID = 'import'
+
+# ID of the document in the meta collection holding instrumentation settings that override config at runtime
+INSTRUMENTATION_ID = 'instrumentation'
+INSTRUMENTATION_SETTINGS = ('request_timing', 'slow_query_ms', 'profile_sample_rate')
+
+slow_query_logger = logging.getLogger(AppConfig.app_name + '.slow_queries')
+
+# Slow pipelines of the same shape are explained at most once per this many seconds
+SLOW_QUERY_EXPLAIN_INTERVAL = 60
+
+INDEXED_SEARCH = 'indexed'
+SUBSTRING_SEARCH = 'substring'
+
+# Query arguments answered by the text index (which covers both body and subject)
+_text_search_fields = ('body',)
+
+# Query arguments answered by prefix lookups on indexed arrays of normalized terms
+_prefix_search_fields = {
+    'sender': 'sender_terms',
+    'recipient': 'recipient_terms'
+}
+
+# Query arguments answered by exact lookups on indexed fields
+_exact_search_fields = ('_id', 'content_hash')
+
+SNIPPET_LENGTH = 200
+
+# The oldest MongoDB release the API's queries run on.  The snippet of the summary view uses $substrCP,
+# so that bodies are cut on a character rather than a byte boundary, and count() uses $facet and $bucket.
+MINIMUM_SERVER_VERSION = (3, 4)
+
+# Fields that can be requested when loading documents, and the expressions that compute them
+FIELD_EXPRESSIONS = {
+    "subject": "$subject",
+    "body": "$body",
+    "snippet": {"$substrCP": [{"$ifNull": ["$body", ""]}, 0, SNIPPET_LENGTH]},
+    "date": "$date",
+    "sender": "$sender",
+    "recipient": "$recipient",
+    "content_hash": "$content_hash",
+    "attachments": "$attachments",
+    "total_attachments": {"$size": {"$ifNull": ["$attachments", []]}}
+}
+
+# The lightweight view of a document used for lists of emails
+SUMMARY_FIELDS = ('subject', 'sender', 'recipient', 'date', 'total_attachments', 'snippet')
+
+# Fields that pages can be sorted by.  Each has a matching (field, _id) index below.
+SORTABLE_FIELDS = ('_id', 'date', 'sender', 'recipient', 'subject')
+
+# Field load_page() carries the sort value of a page in when it isn't one of the requested fields
+_SORT_VALUE_FIELD = '_sort_value'
+
+# Fields that count() lists the most common values of, and how many values it lists by default
+TOP_VALUE_FACETS = ('sender', 'recipient')
+DEFAULT_FACET_LIMIT = 10
+
+# Lower bounds of the buckets of the attachment count histogram; the last bucket is open-ended
+ATTACHMENT_COUNT_BOUNDARIES = (0, 1, 2, 5, 10)
+
+# Declarative specification of every index the email collection should have
+EMAIL_INDEXES = [
+    {'name': 'text_search', 'keys': [('body', TEXT), ('subject', TEXT)]},
+    {'name': 'sender_terms', 'keys': [('sender_terms', ASCENDING)]},
+    {'name': 'recipient_terms', 'keys': [('recipient_terms', ASCENDING)]},
+    {'name': 'content_hash', 'keys': [('content_hash', ASCENDING)]}
+] + [
+    {'name': 'sort_' + field, 'keys': [(field, ASCENDING), ('_id', ASCENDING)]}
+    for field in SORTABLE_FIELDS if field != '_id'
+]
+
 
 def requires_client(fn):
     """
@@ -19,41 +105,209 @@ def requires_client(fn):
     return wraps(fn)(wrapper)
 
 
+def encode_cursor(document, sort=None):
+    """
+    Builds an opaque pagination cursor pointing just past the given document
+    :param document: The last document of a page
+    :param sort: The sort key the page was loaded with.  Defaults to the document ID
+    :return: A url-safe cursor string
+    """
+    key = {'sort': sort, 'after': [document.get(sort), document['_id']] if sort else [document['_id']]}
+    return base64.urlsafe_b64encode(json_util.dumps(key))
+
+
+def decode_cursor(cursor, sort=None):
+    """
+    Unpacks a pagination cursor created by encode_cursor()
+    :param cursor: The cursor string
+    :param sort: The sort key the next page is being loaded with.  Must match the cursor's.
+    :return: A list holding the sort value (if any) and the ID of the last document seen
+    """
+    try:
+        key = json_util.loads(base64.urlsafe_b64decode(str(cursor)))
+        after = key['after']
+        if not isinstance(after, list):
+            raise ValueError('Cursor position is not a list.')
+    except (TypeError, ValueError, KeyError):
+        raise ValueError('Invalid cursor.')
+    if key.get('sort') != sort or len(after) != (2 if sort else 1):
+        raise ValueError('Cursor does not match the requested sort order.')
+    return after
+
+
+def mark_import_finished(db):
+    """
+    Records that an import run has finished, so that API processes know to drop cached responses
+    :param db: The pymongo database the import wrote to
+    :return: None
+    """
+    db[AppConfig.meta_collection].update_one(
+        {'_id': IMPORT_STATUS_ID},
+        {'$inc': {'generation': 1}, '$set': {'finished': datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def set_instrumentation(db, **settings):
+    """
+    Changes instrumentation settings for every API process, without a restart
+    :param db: The pymongo database the API reads from
+    :param settings: Values for any of INSTRUMENTATION_SETTINGS.  None turns slow query logging off.
+    :return: None
+    """
+    unknown = [name for name in settings if name not in INSTRUMENTATION_SETTINGS]
+    if unknown:
+        raise ValueError("Unknown instrumentation setting(s): {}".format(', '.join(unknown)))
+    db[AppConfig.meta_collection].update_one({'_id': INSTRUMENTATION_ID}, {'$set': settings}, upsert=True)
+
+
+def summarize_explain(explain):
+    """
+    Condenses the explain output of an aggregation into one line naming each pipeline
+    stage and the winning query plan, e.g. 'IXSCAN(sort_date) <- FETCH'
+    :param explain: The result of an aggregate command run with explain
+    :return: string
+    """
+    stage_names = []
+    plans = []
+    for stage in explain.get('stages', []):
+        name = stage.keys()[0]
+        stage_names.append(name)
+        planner = stage[name].get('queryPlanner') if name == '$cursor' else None
+        if planner:
+            plans.append(_summarize_plan(planner.get('winningPlan', {})))
+    return 'plan: {}; stages: {}'.format(' | '.join(plans) or 'unknown', ', '.join(stage_names))
+
+
+def pipeline_shape(pipe):
+    """
+    Reduces an aggregation pipeline to its shape: its stages, operators and field names,
+    without the values being matched, so that pipelines differing only in values compare equal
+    :param pipe: The aggregation pipeline
+    :return: string
+    """
+    def shape(value):
+        if isinstance(value, dict):
+            return [[name, shape(value[name])] for name in value]
+        if isinstance(value, list):
+            return [shape(item) for item in value]
+        return type(value).__name__
+    return json_util.dumps(shape(pipe))
+
+
+def explain_slow_query(collection, pipe):
+    """
+    Explains an aggregation on the same kind of member it ran on and logs its query plan
+    :param collection: The pymongo collection the aggregation ran on
+    :param pipe: The aggregation pipeline
+    :return: None
+    """
+    try:
+        explain = collection.database.command('aggregate', collection.name, pipeline=pipe, explain=True,
+                                              allowDiskUse=True, read_preference=collection.read_preference)
+        plan = summarize_explain(explain)
+    except PyMongoError as e:
+        plan = 'explain failed: {}'.format(e)
+    slow_query_logger.warning('Plan of slow query on %s: pipeline=%s %s', collection.name, json_util.dumps(pipe), plan)
+
+
+def _summarize_plan(plan):
+    steps = []
+    while plan:
+        index_name = plan.get('indexName')
+        steps.append(plan['stage'] + ('({})'.format(index_name) if index_name else ''))
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return ' <- '.join(reversed(steps))
+
+
+def attachment_bucket_label(lower):
+    """
+    Names a bucket of the attachment count histogram, e.g. '2-4' or '10+'
+    :param lower: The lower bound of the bucket, from ATTACHMENT_COUNT_BOUNDARIES
+    :return: string
+    """
+    position = ATTACHMENT_COUNT_BOUNDARIES.index(lower)
+    if position == len(ATTACHMENT_COUNT_BOUNDARIES) - 1:
+        return '{}+'.format(lower)
+    upper = ATTACHMENT_COUNT_BOUNDARIES[position + 1] - 1
+    return str(lower) if upper == lower else '{}-{}'.format(lower, upper)
+
+
+def missing_indexes(collection, indexes=None):
+    """
+    Compares an index specification against the indexes a collection actually has
+    :param collection: The pymongo collection to inspect
+    :param indexes: The index specification.  Defaults to EMAIL_INDEXES
+    :return: A list of the names of specified indexes the collection is missing
+    """
+    if indexes is None:
+        indexes = EMAIL_INDEXES
+    existing = collection.index_information()
+    return [index['name'] for index in indexes if index['name'] not in existing]
+
+
+def ensure_indexes(collection, indexes=None):
+    """
+    Creates any index from the specification that a collection is missing
+    :param collection: The pymongo collection to index
+    :param indexes: The index specification.  Defaults to EMAIL_INDEXES
+    :return: A list of the names of the indexes that had to be created
+    """
+    if indexes is None:
+        indexes = EMAIL_INDEXES
+    missing = missing_indexes(collection, indexes)
+    if missing:
+        collection.create_indexes([IndexModel(index['keys'], name=index['name'], **index.get('options', {}))
+                                   for index in indexes if index['name'] in missing])
+    return missing
+
+
 class DataFacade:
     """
     Facade to wrap select mongodb operations to keep the
     calling code nice, clean, and testable
     """
-    def __init__(self, app=None, mongo_uri=None):
+    def __init__(self, app=None, mongo_uri=None, read_preference_name=None):
         """
         Initializer for the DataFacade class
         :param app: A flask app to provide context to the facade
+        :param read_preference_name: The ReadPreference name reads should use, e.g. 'SECONDARY_PREFERRED'
         :return: None
         """
         self._client = None
+        self.slow_query_ms = None
+        self._explained = {}
+        self._explained_lock = threading.Lock()
         if app:
-          self.bind_flask(app)
+          self.bind_flask(app, mongo_uri, read_preference_name)
 
-    def bind_flask(self, app, mongo_uri=None):
+    def bind_flask(self, app, mongo_uri=None, read_preference_name=None):
         """
-        Creates a bound PyMongo client based on a flask context
+        Creates a bound PyMongo client based on a flask context.
+        Pool and timeout settings come from config unless the app's MONGO_* keys already set them.
         :param app: A flask app to provide context to the facade
         :param mongo_uri: A URI of a mongo instance to use with a connected client
+        :param read_preference_name: The ReadPreference name reads should use.  Defaults to the configured one.
         :return: None
         """
         if self.is_bound:
             raise TypeError("Client already bound.")
+        for key, value in flask_options(read_preference_name).items():
+            app.config.setdefault(key, value)
+        if mongo_uri:
+            app.config['MONGO_HOST'] = mongo_uri
         self._client = PyMongo(app)
 
-    def bind(self, mongo_uri):
+    def bind(self, mongo_uri, read_preference_name=None):
         """
-        Creates a bound PyMongo client based on a uri
+        Binds the process-wide shared client for a uri
         :param mongo_uri: A URI of a mongo instance to use with a connected client
+        :param read_preference_name: The ReadPreference name reads should use.  Defaults to the configured one.
         :return: None
         """
         if self.is_bound:
             raise TypeError("Client already bound.")
-        self._client = MongoClient(mongo_uri)
+        self._client = get_client(mongo_uri, read_preference_name)
 
     @property
     @requires_client
@@ -65,6 +319,16 @@ class DataFacade:
         """
         return self._client.db
 
+    @requires_client
+    def close(self):
+        """
+        Closes the bound client's connections.  The client reconnects on its next use,
+        which makes this safe to call in a freshly forked process.
+        :return: None
+        """
+        client = self._client.cx if isinstance(self._client, PyMongo) else self._client
+        client.close()
+
     @property
     def is_bound(self):
         """
@@ -83,52 +347,237 @@ class DataFacade:
         self._client.db[collection_name].delete_many({})
 
     @requires_client
-    def load(self, collection_name, page=None, page_size=None, sort=None, **kwargs):
+    def load(self, collection_name, page=None, page_size=None, sort=None, cursor=None, search=None, fields=None,
+             **kwargs):
         """
-        Loads documents from the given collection given a set of query arguments
+        Loads documents from the given collection given a set of query arguments.
+        Pages can either be addressed by number, or by a cursor returned from encode_cursor()
+        which seeks directly to the next page instead of skipping over all earlier documents.
         :param collection_name: The name of the collection to query
-        :param page: The ordinal number of the page of data to load
+        :param page: The ordinal number of the page of data to load.  Ignored if a cursor is given.
         :param page_size: The number of documents to load for the page
         :param sort: A sort key to use.  Defaults to the document ID
+        :param cursor: A cursor pointing just past the last document of the previous page
+        :param search: INDEXED_SEARCH (the default) to answer query arguments from indexes where
+        possible, or SUBSTRING_SEARCH to match every argument as an unanchored substring
+        :param fields: A list of names from FIELD_EXPRESSIONS to return.  Defaults to the whole document.
         :param kwargs: Query arguments
         :return: A list containing the matching documents (or an empty list)
         """
-        if page is None:
-            page = 1
+        return list(self.iter_load(collection_name, page, page_size, sort, cursor, search, fields, **kwargs))
+
+    @requires_client
+    def iter_load(self, collection_name, page=None, page_size=None, sort=None, cursor=None, search=None, fields=None,
+                  **kwargs):
+        """
+        Same as load(), but returns the live database cursor so that callers can
+        consume the documents one at a time instead of holding the whole page in memory.
+        :return: An iterable of the matching documents
+        """
         if page_size is None:
             page_size = DEFAULT_PAGE_SIZE
+        pipe = self._build_pipeline(page, page_size, sort, cursor, search, kwargs)
+        pipe.append({"$limit": page_size})
+        if fields is not None:
+            pipe.append({"$project": self._build_projection(fields)})
+
+        collection = self._client.db[collection_name]
+        return self._aggregate(collection, pipe)
+
+    @requires_client
+    def load_page(self, collection_name, page=None, page_size=None, sort=None, cursor=None, search=None, fields=None,
+                  **kwargs):
+        """
+        Same as load(), but also builds the cursor for the following page.  One document past the
+        end of the page is fetched to find out whether there is a following page, so that the
+        cursor comes from the same query as the page instead of a second one.  The cursor has to be
+        known before a response is started, so the page is read ahead, but each document is let go
+        of as soon as it has been consumed, and the extra document is never held past the read.
+        :return: A tuple of an iterator of the matching documents and a cursor string, or None if this is the last page
+        """
+        if page_size is None:
+            page_size = DEFAULT_PAGE_SIZE
+        pipe = self._build_pipeline(page, page_size, sort, cursor, search, kwargs)
+        pipe.append({"$limit": page_size + 1})
+        # the cursor needs the last document's sort value, even if it wasn't one of the requested fields
+        hide_sort_value = fields is not None and sort not in (None, "_id") and sort not in fields
+        if fields is not None:
+            projection = self._build_projection(fields)
+            if hide_sort_value:
+                projection[_SORT_VALUE_FIELD] = "$" + sort
+            pipe.append({"$project": projection})
+
+        collection = self._client.db[collection_name]
+        documents = deque(self._aggregate(collection, pipe))
+        next_cursor = None
+        if len(documents) > page_size:
+            documents.pop()
+            last_document = documents[-1]
+            if hide_sort_value:
+                last_document = {"_id": last_document["_id"], sort: last_document.get(_SORT_VALUE_FIELD)}
+            next_cursor = encode_cursor(last_document, sort)
+        return self._drain_page(documents, hide_sort_value), next_cursor
+
+    @staticmethod
+    def _drain_page(documents, hide_sort_value):
+        while documents:
+            document = documents.popleft()
+            if hide_sort_value:
+                document.pop(_SORT_VALUE_FIELD, None)
+            yield document
+
+    @requires_client
+    def count(self, collection_name, search=None, facet_limit=None, **kwargs):
+        """
+        Counts the documents matching a set of query arguments, along with the most common senders
+        and recipients among them, how many there are per month and a histogram of their attachment
+        counts.  Everything is computed by a single $facet aggregation.
+        :param collection_name: The name of the collection to query
+        :param search: INDEXED_SEARCH or SUBSTRING_SEARCH, as for load()
+        :param facet_limit: The number of senders and recipients to list.  Defaults to DEFAULT_FACET_LIMIT
+        :param kwargs: Query arguments
+        :return: A dict holding the total, and a list of {'value': ..., 'count': ...} dicts for each facet
+        """
+        if facet_limit is None:
+            facet_limit = DEFAULT_FACET_LIMIT
+        pipe = []
+        match = self._build_filter(search, kwargs)
+        if len(match["$match"]) > 0:
+            pipe.append(match)
+        pipe.append({"$facet": self._build_facets(facet_limit)})
+
+        collection = self._client.db[collection_name]
+        for result in self._aggregate(collection, pipe):
+            return self._unpack_facets(result)
+
+    @staticmethod
+    def _build_facets(facet_limit):
+        facets = {
+            "total": [{"$count": "count"}],
+            "month": [
+                {"$group": {"_id": {"$substrCP": [{"$ifNull": ["$date", ""]}, 0, 7]}, "count": {"$sum": 1}}},
+                {"$sort": SON([("_id", 1)])}
+            ],
+            "attachments": [
+                {"$bucket": {
+                    "groupBy": FIELD_EXPRESSIONS["total_attachments"],
+                    "boundaries": list(ATTACHMENT_COUNT_BOUNDARIES) + [float('inf')],
+                    "output": {"count": {"$sum": 1}}
+                }}
+            ]
+        }
+        for field in TOP_VALUE_FACETS:
+            facets[field] = [
+                {"$group": {"_id": "$" + field, "count": {"$sum": 1}}},
+                {"$sort": SON([("count", -1), ("_id", 1)])},
+                {"$limit": facet_limit}
+            ]
+        return facets
+
+    @staticmethod
+    def _unpack_facets(result):
+        total = result["total"]
+        counts = {"total": total[0]["count"] if total else 0}
+        for facet in TOP_VALUE_FACETS + ("month",):
+            counts[facet] = [{"value": group["_id"], "count": group["count"]} for group in result[facet]]
+        bucket_counts = dict((bucket["_id"], bucket["count"]) for bucket in result["attachments"])
+        counts["attachments"] = [{"value": attachment_bucket_label(lower), "count": bucket_counts.get(lower, 0)}
+                                 for lower in ATTACHMENT_COUNT_BOUNDARIES]
+        return counts
+
+    def _aggregate(self, collection, pipe):
+        """
+        Runs an aggregation, logging its pipeline if it takes longer than slow_query_ms.  The query plan
+        is logged separately, by a background thread, so the slow request isn't held up by a second run
+        of the aggregation.
+        :param collection: The pymongo collection to aggregate
+        :param pipe: The aggregation pipeline
+        :return: The result cursor
+        """
+        started = time.time()
+        cursor = collection.aggregate(pipeline=pipe, allowDiskUse=True)
+        elapsed_ms = (time.time() - started) * 1000
+        if self.slow_query_ms is not None and elapsed_ms >= self.slow_query_ms:
+            slow_query_logger.warning('Slow query on %s (%.1fms): pipeline=%s',
+                                      collection.name, elapsed_ms, json_util.dumps(pipe))
+            if self._should_explain(pipeline_shape(pipe), started):
+                explainer = threading.Thread(target=explain_slow_query, args=(collection, pipe),
+                                             name='slow-query-explain')
+                explainer.daemon = True
+                explainer.start()
+        return cursor
+
+    def _should_explain(self, shape, now):
+        with self._explained_lock:
+            if now - self._explained.get(shape, 0) < SLOW_QUERY_EXPLAIN_INTERVAL:
+                return False
+            self._explained[shape] = now
+            return True
+
+    def _build_pipeline(self, page, page_size, sort, cursor, search, parameters):
+        if page is None:
+            page = 1
         if sort is None:
-            sort_clause = { "_id": 1 }
+            sort_clause = SON([("_id", 1)])
         else:
-            sort_clause = { sort: 1 }
-
-        projection = {
-            "subject": "$subject",
-            "body": "$body",
-            "date": "$date",
-            "sender": "$sender",
-            "recipient": "$recipient",
-            "attachments": "$attachments",
-            "total_attachments": {
-                "$size": "$attachments"
-            }
-        }
+            sort_clause = SON([(sort, 1), ("_id", 1)])
 
-        pipe = [
-            # {"$project": projection}
-        ]
+        pipe = []
 
-        if len(kwargs) > 0:
-            pipe.append(self._build_match(kwargs))
+        match = self._build_filter(search, parameters)
+        if cursor is not None:
+            match["$match"].update(self._build_seek(decode_cursor(cursor, sort), sort))
+        if len(match["$match"]) > 0:
+            pipe.append(match)
         pipe.append({"$sort": sort_clause})
-        pipe.append({"$skip": (page - 1) * page_size})
-        pipe.append({"$limit": page_size})
+        if cursor is None:
+            pipe.append({"$skip": (page - 1) * page_size})
+        return pipe
 
-        collection = self._client.db[collection_name]
-        result = list(collection.aggregate(pipeline=pipe, allowDiskUse=True))
-        return result
+    def _build_filter(self, search, parameters):
+        if search is None:
+            search = INDEXED_SEARCH
+        if search == SUBSTRING_SEARCH:
+            return self._build_substring_match(parameters)
+        elif search == INDEXED_SEARCH:
+            return self._build_match(parameters)
+        raise ValueError("Unknown search type '{}'.".format(search))
+
+    @staticmethod
+    def _build_projection(fields):
+        try:
+            return dict((field, FIELD_EXPRESSIONS[field]) for field in fields)
+        except KeyError as e:
+            raise ValueError("Unknown field '{}'.".format(e.args[0]))
+
+    @staticmethod
+    def _build_seek(after, sort):
+        if not sort:
+            return {"_id": {"$gt": after[0]}}
+        return {
+            "$or": [
+                {sort: {"$gt": after[0]}},
+                {sort: after[0], "_id": {"$gt": after[1]}}
+            ]
+        }
 
     def _build_match(self, parameters):
+        match_dict = {}
+        for name, value in parameters.items():
+            if name in _text_search_fields:
+                match_dict["$text"] = {"$search": value}
+            elif name in _prefix_search_fields:
+                prefix = re.compile('^' + re.escape(normalize_search_value(value)))
+                match_dict[_prefix_search_fields[name]] = {"$regex": prefix}
+            elif name in _exact_search_fields:
+                match_dict[name] = value
+            else:
+                match_dict[name] = {"$regex": re.compile(re.escape(value))}
+        return {
+            "$match": match_dict
+        }
+
+    def _build_substring_match(self, parameters):
         match_dict = {}
         for parameter in parameters.items():
             value = re.compile(re.escape(parameter[1]))
@@ -137,6 +586,63 @@ class DataFacade:
             "$match": match_dict
         }
 
+    @requires_client
+    def ensure_indexes(self, collection_name, indexes=None):
+        """
+        Creates any specified index the collection is missing.  Safe to call repeatedly.
+        :param collection_name: The name of the collection to index
+        :param indexes: The index specification.  Defaults to EMAIL_INDEXES
+        :return: A list of the names of the indexes that had to be created
+        """
+        return ensure_indexes(self._client.db[collection_name], indexes)
+
+    @requires_client
+    def missing_indexes(self, collection_name, indexes=None):
+        """
+        Reports the specified indexes that the collection is missing
+        :param collection_name: The name of the collection to inspect
+        :param indexes: The index specification.  Defaults to EMAIL_INDEXES
+        :return: A list of the names of the missing indexes
+        """
+        return missing_indexes(self._client.db[collection_name], indexes)
+
+    @requires_client
+    def server_version(self):
+        """
+        Returns the version of the MongoDB server the facade is bound to
+        :return: A tuple of the major, minor and patch version numbers
+        """
+        return tuple(self._client.db.command('buildInfo')['versionArray'][:3])
+
+    @requires_client
+    def import_generation(self):
+        """
+        Returns a number that changes every time an import run finishes.  It is read from the primary,
+        so that a lagging secondary can't report a generation whose data it doesn't have yet.
+        :return: The generation number, or 0 if no import has been recorded
+        """
+        meta = self._client.db[AppConfig.meta_collection].with_options(read_preference=ReadPreference.PRIMARY)
+        status = meta.find_one({'_id': IMPORT_STATUS_ID})
+        return status['generation'] if status else 0
+
+    @requires_client
+    def instrumentation_settings(self):
+        """
+        Reads the instrumentation settings stored with set_instrumentation()
+        :return: A dict of the stored settings, which is empty if none were stored
+        """
+        settings = self._client.db[AppConfig.meta_collection].find_one({'_id': INSTRUMENTATION_ID}) or {}
+        return dict((name, settings[name]) for name in INSTRUMENTATION_SETTINGS if name in settings)
+
+    @requires_client
+    def open_attachment(self, digest):
+        """
+        Open stored attachment content for lazy, chunked reading
+        :param digest: The digest the attachment content is stored under
+        :return: A GridOut file.  Raises gridfs.errors.NoFile if nothing is stored under the digest.
+        """
+        return AttachmentStore(self._client.db).open(digest)
+
     @requires_client
     def store(self, collection_name, document):
         """
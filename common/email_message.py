@@ -1,40 +1,125 @@
 import re
 import hashlib
-import json
 from datetime import datetime
 from dateutil import parser
 from common.attachment import Attachment
 
 _junk_line_pattern = re.compile('^(\.|\s+)$')
+# Lines that mark the start of the ad footers hotmail and yahoo like to append to the content
+_junk_section_markers = [
+    '_________________________________________________________________',
+    '-----Original Message-----',
+    '---------------------------------',
+    '__________________________________________________',
+    '__________________________________',
+    'Do You Yahoo!?',
+    'Do you Yahoo!?'
+]
+# The characters splitlines() breaks lines on, which differ between unicode and byte strings
+_unicode_line_breaks = u'\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+_byte_line_breaks = '\n\r'
 
 
-class EmailMessage:
+def _whole_line_pattern(alternatives, line_breaks):
+    """
+    Compiles a pattern that matches any of several strings, but only as a whole line
+    as splitlines() would split it
+    :param alternatives: The strings to match
+    :param line_breaks: The characters that end a line
+    :return: A compiled regular expression
+    """
+    line_break = u'[' + re.escape(line_breaks) + u']'
+    return re.compile(u'(?:^|(?<={0}))(?:{1})(?={0}|\Z)'.format(
+        line_break, u'|'.join(re.escape(alternative) for alternative in alternatives)))
+
+_unicode_junk_section_pattern = _whole_line_pattern(_junk_section_markers, _unicode_line_breaks)
+_byte_junk_section_pattern = _whole_line_pattern(_junk_section_markers, _byte_line_breaks)
+_hashed_fields = frozenset(['sender', 'recipient', 'subject', 'date', '_date', 'body', 'attachments'])
+_search_term_separator_pattern = re.compile(r'[\s<>"\',;]+')
+
+
+def search_terms(address):
+    """
+    Breaks a sender or recipient string down into normalized terms that can be
+    stored in an indexed array and answered with exact or prefix lookups.
+    :param address: The address string, e.g. 'Ben Peterson <killthrush@hotmail.com>'
+    :return: A sorted list of lower-case terms, including the whole normalized string
+    """
+    normalized = normalize_search_value(address)
+    if not normalized:
+        return []
+    terms = set(term for term in _search_term_separator_pattern.split(normalized) if term)
+    terms.add(normalized)
+    return sorted(terms)
+
+
+def normalize_search_value(value):
+    """
+    Normalizes a value the same way search terms are normalized
+    :param value: The value to normalize
+    :return: The lower-cased, stripped value
+    """
+    return unicode(value or u'').strip().lower()
+
+
+class EmailMessage(object):
     """
     Encapsulates an abstraction of an email message that's useful
     for processing and storage
     """
+    __slots__ = ('_content_hash', 'attachments', 'source_number', 'ordinal_number', '_date', 'source',
+                 'recipient', 'sender', '_body', '_body_parts', 'subject')
+
     def __init__(self, **kwargs):
         """
         Initializer for the EmailMessage class
         :return: None
         """
+        self._content_hash = None
+        self._body_parts = []
         self.attachments = []
+        self.source_number = None
         self.ordinal_number = None
         self._date = None
         self.source = None
-        self.hasher = hashlib.md5()
         self.from_dict(kwargs)
 
+    def __setattr__(self, name, value):
+        """
+        Override for attribute assignment that discards the cached content hash
+        whenever a field that contributes to it changes
+        :param name: The name of the attribute being set
+        :param value: The value being set
+        :return: None
+        """
+        if name in _hashed_fields:
+            object.__setattr__(self, '_content_hash', None)
+        object.__setattr__(self, name, value)
+
     @property
     def content_hash(self):
         """
-        Calculates an MD5 hash of the current contents of the message object
+        Calculates an MD5 hash of the current contents of the message object.
+        The hash is computed in a single pass over the fields and the attachment digests,
+        and is cached until one of those fields changes.
         :return: string
         """
-        content = self._get_content()
-        md5 = hashlib.md5()
-        md5.update(json.dumps(content))
-        return md5.hexdigest()
+        if self._content_hash is None:
+            md5 = hashlib.md5()
+            fields = (
+                (u'sender', self.sender),
+                (u'recipient', self.recipient),
+                (u'subject', self.subject),
+                (u'date', datetime.isoformat(self.date)),
+                (u'body', self.body)
+            )
+            for name, value in fields:
+                md5.update(u'{}\0{}\0'.format(name, value).encode('utf-8'))
+            for attachment in self.attachments:
+                md5.update(u'attachment\0{}\0{}\0'.format(attachment.filename, attachment.content_type).encode('utf-8'))
+                md5.update(attachment.digest)
+            self._content_hash = md5.hexdigest()
+        return self._content_hash
 
     def _get_content(self):
         """
@@ -53,11 +138,13 @@ class EmailMessage:
     def to_dict(self):
         """
         Returns a dict representation of the email message, including a content hash
-        used to de-dupe messages.
+        used to de-dupe messages and normalized sender/recipient terms used for searching.
         :return: dict
         """
         return_dict = self._get_content()
         return_dict[u'content_hash'] = unicode(self.content_hash)
+        return_dict[u'sender_terms'] = search_terms(self.sender)
+        return_dict[u'recipient_terms'] = search_terms(self.recipient)
         return return_dict
 
     def from_dict(self, input):
@@ -78,7 +165,7 @@ class EmailMessage:
         :param other: Another instance to compare
         :return: True if equal, False otherwise
         """
-        return type(self) == type(other) and self.to_dict() == other.to_dict()
+        return type(self) == type(other) and self.content_hash == other.content_hash
 
     def __ne__(self, other):
         """
@@ -86,7 +173,7 @@ class EmailMessage:
         :param other: Another instance to compare
         :return: True if not equal, False otherwise
         """
-        return type(self) != type(other) or self.to_dict() != other.to_dict()
+        return type(self) != type(other) or self.content_hash != other.content_hash
 
     @property
     def date(self):
@@ -105,54 +192,63 @@ class EmailMessage:
         """
         if isinstance(value, str) or isinstance(value, unicode):
             self._date = parser.parse(value)
-        elif isinstance(datetime) or value is None:
+        elif isinstance(value, datetime) or value is None:
             self._date = value
         else:
             raise ValueError("Type {} is not supported.".format(type(value)))
 
+    @property
+    def body(self):
+        """
+        Getter for the body property.  Text accumulated by append_body() is
+        assembled into the body here, once, the first time it is needed.
+        :return: the message body
+        """
+        if self._body_parts:
+            pieces = []
+            leading_text = self._body
+            for part in self._body_parts:
+                # equivalent to stripping the whole body after every append, without the repeated copies
+                piece = (leading_text + part).strip() if not pieces else part.rstrip()
+                if piece:
+                    pieces.append(piece)
+            self._body = ''.join(pieces)
+            self._body_parts = []
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        """
+        Setter for the body property
+        :param value: The body text
+        :return: None
+        """
+        self._body = value
+        self._body_parts = []
+
     def append_body(self, input_body_text):
         """
         Removes junk from email message body text and appends it to the current body.
+        Everything from the first line that starts an ad footer onwards is dropped.
         :param input_body_text: The body text to process
         :return: None
         """
-        body_accumulator = []
-        ignore_lines = False
-        lines = input_body_text.splitlines()
-        for line in lines:
-            if self._is_start_of_junk_section(line):
-                ignore_lines = True
-            if not ignore_lines:
-                body_accumulator.append(line)
-        self.body += '\n'.join(body_accumulator)
-        self.body = self.body.strip()
+        if isinstance(input_body_text, unicode):
+            junk_match = _unicode_junk_section_pattern.search(input_body_text)
+        else:
+            junk_match = _byte_junk_section_pattern.search(input_body_text)
+        if junk_match:
+            input_body_text = input_body_text[:junk_match.start()]
+        self._body_parts.append('\n'.join(input_body_text.splitlines()))
+        self._content_hash = None
 
     def add_attachment(self, content, content_type, filename=None):
         """
         Adds an attachment
-        :param content: base64 content for the attachment
+        :param content: the decoded content of the attachment
         :param content_type: the MIME type of the attachment
         :param filename: the original filename of the attachment
         :return: None
         """
         self.attachments.append(Attachment(content, content_type, filename=filename))
-
-    @staticmethod
-    def _is_start_of_junk_section(text):
-        """
-        Given a line of text from an email, determine whether it's the start of one of
-        those annoying ad footers that hotmail and yahoo like to append to the content.
-        This allows us to strip out this stuff from the message.
-        :param text: A line of text that will be evaluated to see if it's junk
-        :return: True if the line is evaluated as junk, else false
-        """
-        junk_patterns = {
-            '_________________________________________________________________',
-            '-----Original Message-----',
-            '---------------------------------',
-            '__________________________________________________',
-            '__________________________________',
-            'Do You Yahoo!?',
-            'Do you Yahoo!?'
-        }
-        return text in junk_patterns
+        self._content_hash = None
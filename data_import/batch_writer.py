@@ -0,0 +1,92 @@
+"""
+Module that manages buffering documents and writing them
+to a mongo collection in unordered bulk inserts.
+"""
+
+import time
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+_duplicate_key_error_code = 11000
+
+
+class BatchWriter(object):
+    """
+    Class that buffers documents and writes them to a collection in
+    batches, keeping track of how many were inserted and how many were
+    rejected as duplicates.
+    """
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, upsert=False,
+                 metrics=None, stage='mongo_write'):
+        """
+        Initializer for the BatchWriter class
+        :param collection: The pymongo collection that documents will be written to
+        :param batch_size: The number of buffered documents that triggers a write
+        :param flush_interval: The number of seconds after which buffered documents are written regardless of count
+        :param upsert: If True, documents are upserted by _id and existing documents are counted as duplicates
+        :param metrics: Optional ImportMetrics instance that records the time taken by each write
+        :param stage: The name writes are recorded under in the metrics
+        :return: None
+        """
+        self._collection = collection
+        self._upsert = upsert
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._metrics = metrics
+        self._stage = stage
+        self._pending = []
+        self._last_flush = time.time()
+        self.inserted_count = 0
+        self.duplicate_count = 0
+
+    def add(self, document):
+        """
+        Buffer a document, writing the buffer out if it is full or stale
+        :param document: The document to write
+        :return: None
+        """
+        self._pending.append(document)
+        if len(self._pending) >= self._batch_size or time.time() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered documents in a single unordered bulk insert (or upsert).
+        Duplicate key errors are counted; any other write error is re-raised.
+        :return: A tuple of (inserted, duplicates) for this flush
+        """
+        self._last_flush = time.time()
+        if not self._pending:
+            return 0, 0
+        documents, self._pending = self._pending, []
+        if self._metrics is None:
+            return self._write(documents)
+        with self._metrics.timer(self._stage):
+            return self._write(documents)
+
+    def _write(self, documents):
+        if self._upsert:
+            return self._upsert_documents(documents)
+        try:
+            result = self._collection.insert_many(documents, ordered=False)
+            inserted, duplicates = len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            duplicates = len([error for error in write_errors if error['code'] == _duplicate_key_error_code])
+            if duplicates != len(write_errors) or e.details.get('writeConcernErrors'):
+                raise
+            inserted = e.details['nInserted']
+        self.inserted_count += inserted
+        self.duplicate_count += duplicates
+        return inserted, duplicates
+
+    def _upsert_documents(self, documents):
+        requests = [ReplaceOne({'_id': document['_id']}, document, upsert=True) for document in documents]
+        result = self._collection.bulk_write(requests, ordered=False)
+        inserted, duplicates = result.upserted_count, len(documents) - result.upserted_count
+        self.inserted_count += inserted
+        self.duplicate_count += duplicates
+        return inserted, duplicates
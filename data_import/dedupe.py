@@ -0,0 +1,102 @@
+"""
+Module that remembers which message content hashes an import has already seen,
+so that duplicates can be dropped before they reach the database.
+"""
+
+import math
+import struct
+import binascii
+
+DEFAULT_EXPECTED_MESSAGES = 1000000
+DEFAULT_ERROR_RATE = 0.001
+
+
+class SeenHashes(object):
+    """
+    Exact set of seen content hashes, held as 16-byte binary digests
+    rather than 32-character hex strings to halve their footprint.
+    """
+    exact = True
+
+    def __init__(self):
+        """
+        Initializer for the SeenHashes class
+        :return: None
+        """
+        self._digests = set()
+
+    def add(self, content_hash):
+        """
+        Record a content hash
+        :param content_hash: The hex content hash of a message
+        :return: True if the hash had not been seen before, else False
+        """
+        digest = binascii.unhexlify(content_hash)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def preload(self, content_hashes):
+        """
+        Record many content hashes at once, e.g. the IDs of documents already stored
+        :param content_hashes: An iterable of hex content hashes
+        :return: None
+        """
+        for content_hash in content_hashes:
+            self.add(content_hash)
+
+    def __contains__(self, content_hash):
+        return binascii.unhexlify(content_hash) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+
+class SeenHashesFilter(SeenHashes):
+    """
+    Compact, probabilistic alternative to SeenHashes backed by a bloom filter of fixed size.
+    A False result from add() is only a probable duplicate, so callers must still let
+    the database confirm it; a True result is always correct.
+    """
+    exact = False
+
+    def __init__(self, expected=DEFAULT_EXPECTED_MESSAGES, error_rate=DEFAULT_ERROR_RATE):
+        """
+        Initializer for the SeenHashesFilter class
+        :param expected: The number of distinct hashes the filter is sized for
+        :param error_rate: The false positive rate expected once that many hashes have been added
+        :return: None
+        """
+        self._size = int(math.ceil(-expected * math.log(error_rate) / math.log(2) ** 2))
+        self._hash_count = max(1, int(round(float(self._size) / expected * math.log(2))))
+        self._bits = bytearray((self._size + 7) // 8)
+        self._count = 0
+
+    def add(self, content_hash):
+        """
+        Record a content hash
+        :param content_hash: The hex content hash of a message
+        :return: True if the hash had definitely not been seen before, False if it probably had
+        """
+        seen = True
+        for byte, mask in self._bit_positions(content_hash):
+            if not self._bits[byte] & mask:
+                seen = False
+                self._bits[byte] |= mask
+        if not seen:
+            self._count += 1
+        return not seen
+
+    def _bit_positions(self, content_hash):
+        # the content hash is already uniformly distributed, so derive the bit positions from it directly
+        first, second = struct.unpack('>QQ', binascii.unhexlify(content_hash))
+        for i in range(self._hash_count):
+            position = (first + i * second) % self._size
+            yield position >> 3, 1 << (position & 7)
+
+    def __contains__(self, content_hash):
+        return all(self._bits[byte] & mask for byte, mask in self._bit_positions(content_hash))
+
+    def __len__(self):
+        return self._count
@@ -52,6 +52,9 @@ _header_list = [
     'X-UIDL'
 ]
 
+# Single matcher for the start of any known header, longest names first
+_header_start_pattern = re.compile('|'.join(re.escape(header) for header in sorted(_header_list, key=len, reverse=True)))
+
 # Content types that we never want to keep around permanently
 _ignored_content_types = [
     'text/html',
@@ -141,7 +144,7 @@ def fix_broken_hotmail_headers(text):
     end_of_header_match = _end_of_simple_header_pattern.search(text)
     temp_header_text = text[:end_of_header_match.end()].strip()
     lines = temp_header_text.splitlines()[1:]  # first line is not a header...
-    fixed_header_lines = reduce(_merge_broken_header_lines, lines, [])
+    fixed_header_lines = _merge_broken_header_lines(lines)
     return_text = os.linesep.join(fixed_header_lines) + text[end_of_header_match.end():]
     return return_text
 
@@ -156,7 +159,7 @@ def fix_broken_yahoo_headers(text):
     end_of_header_match = _end_of_multipart_header_pattern.search(text)
     temp_header_text = text[:end_of_header_match.end()].strip()
     lines = temp_header_text.splitlines()
-    fixed_header_lines = reduce(_merge_broken_header_lines, lines, [])
+    fixed_header_lines = _merge_broken_header_lines(lines)
     return_text = os.linesep.join(fixed_header_lines) + '\r\n\r\n' + text[end_of_header_match.end():]
     return return_text
 
@@ -166,7 +169,7 @@ def get_nested_payload(mime_message):
     Returns a single message object from a list of text content and attachments in a MIME message,
     after filtering out unwanted content. Also handles nested content like forwarded messages.
     :param mime_message: The MIME message to traverse looking for content
-    :return: A list of plain-text email bodies and a list of base-64 attachments (if any)
+    :return: A list of plain-text email bodies and a list of decoded attachments (if any)
     """
     return_message = EmailMessage()
     return_message.subject = mime_message.get('Subject')
@@ -182,7 +185,10 @@ def get_nested_payload(mime_message):
         elif content_type in _ignored_content_types and disposition is None:
             pass  # throw away contents we don't want
         else:
-            return_message.add_attachment(sub_message.get_payload(), content_type=content_type, filename=disposition)
+            content = sub_message.get_payload(decode=True)
+            if content is None:  # nested messages have no payload of their own to decode
+                content = sub_message.as_string()
+            return_message.add_attachment(content, content_type=content_type, filename=disposition)
     return return_message
 
 
@@ -200,23 +206,24 @@ def normalize_to_utc(date, timezone):
     return new_date
 
 
-def _merge_broken_header_lines(accumulator, item):
+def _merge_broken_header_lines(lines):
     """
-    Processing function used to reassemble corrected MIME header lines back into
-    a block of text at the beginning of an email message.
-    :param accumulator: The array of header lines being incrementally built.
-    :param item: The current header item being processed
-    :return: The updated accumulator array
+    Reassembles corrected MIME header lines back into a block of text at the beginning
+    of an email message, in a single pass.  Lines that don't start with a known header
+    are continuations of the previous header and get joined onto it.
+    :param lines: The raw header lines
+    :return: A list of the merged header lines
     """
-    cleaned_item = item.strip()
-    for header in _header_list:
-        if item.startswith(header):
-            accumulator.append(cleaned_item)
-            return accumulator
-    try:
-        accumulator[len(accumulator)-1] = accumulator[len(accumulator)-1] + ' ' + cleaned_item
-    except IndexError:  # edge case where the first line doesn't start with a header
-        accumulator.append(cleaned_item)
-    return accumulator
-
-
+    merged_lines = []
+    current_parts = None
+    for line in lines:
+        cleaned_line = line.strip()
+        if current_parts is None or _header_start_pattern.match(line):
+            if current_parts is not None:
+                merged_lines.append(' '.join(current_parts))
+            current_parts = [cleaned_line]  # also covers a first line that doesn't start with a header
+        else:
+            current_parts.append(cleaned_line)
+    if current_parts is not None:
+        merged_lines.append(' '.join(current_parts))
+    return merged_lines
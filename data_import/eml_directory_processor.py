@@ -5,8 +5,11 @@ files into structured EmailMessage instances.
 
 import os
 import codecs
+import multiprocessing
+from itertools import izip
 from StringIO import StringIO
 from email.parser import Parser
+from metrics import StageTimings
 from email_parsing_helpers import (
     fix_broken_yahoo_headers,
     get_nested_payload,
@@ -16,22 +19,48 @@ from email_parsing_helpers import (
     clean_recipient
 )
 
+DEFAULT_CHUNK_SIZE = 8
+
+
+def _parse_eml_file(task):
+    """
+    Worker entry point used to parse a single EML file in a process pool.
+    Defined at module level so that it can be pickled.
+    :param task: A tuple of the file path to parse and the pytz timezone string of the source
+    :return: A tuple of a structured EmailMessage instance and the StageTimings of its parse
+    """
+    file_path, timezone = task
+    timings = StageTimings()
+    message = EMLDirectoryProcessor._process_multipart_eml(file_path, timings)
+    message.date = normalize_to_utc(message.date, timezone)
+    return message, timings
+
 
 class EMLDirectoryProcessor:
     """
     Class that manages processing a directory full of .eml
     files into structured EmailMessage instances.
     """
-    def __init__(self, process_directory, timezone):
+    def __init__(self, process_directory, timezone, workers=1, file_filter=None, metrics=None, pool=None):
         """
         Initializer for the EMLDirectoryProcessor class
         :param process_directory: Directory where EML files will be loaded.
         :param timezone: pytz timezone string used to convert dates to UTC
+        :param workers: Number of processes used to parse files.  1 parses in the calling process.
+        :param file_filter: Optional function taking a file path, returning False for files that should be skipped
+        :param metrics: Optional ImportMetrics instance that records the time spent in each stage
+        :param pool: Optional multiprocessing pool to parse files in, in place of one created for the directory.
+        Callers that run other threads should pass a pool forked before those threads started.
         :return: None
         """
         self._callbacks = dict()
         self._process_directory = process_directory
         self._timezone = timezone
+        self._workers = workers
+        self._pool = pool
+        self._file_filter = file_filter
+        self._metrics = metrics
+        self.bytes_read = 0
         if not os.path.exists(self._process_directory):
             raise ValueError(str.format("Directory '{0}' does not exist.", self._process_directory))
 
@@ -49,31 +78,89 @@ class EMLDirectoryProcessor:
         Processes EML file content found in the instance's directory.
         :return: A list of EmailMessage objects parsed from the directory contents
         """
-        output_contents = []
-        for file_name in os.listdir(self._process_directory):
-            if file_name == '.DS_Store':
-                continue  # Skip these files on OSX systems
-            message = self._process_multipart_eml(os.path.join(self._process_directory, file_name))
-            message.date = normalize_to_utc(message.date, self._timezone)
-            output_contents.append(message)
-            for callback in self._callbacks.values():
-                callback(message)
-        return output_contents
+        return list(self.iter_messages())
+
+    def iter_messages(self):
+        """
+        Lazily processes EML file content found in the instance's directory,
+        yielding each message as soon as its file has been parsed.  When more than
+        one worker is configured, files are parsed in a process pool but messages
+        are still yielded in directory order.  bytes_read counts the files handled so far,
+        including any the file filter skipped.
+        :return: A generator of EmailMessage objects parsed from the directory contents
+        """
+        file_paths = [os.path.join(self._process_directory, file_name)
+                      for file_name in os.listdir(self._process_directory)
+                      if file_name != '.DS_Store']  # Skip these files on OSX systems
+        self.bytes_read = 0
+        if self._file_filter is not None:
+            kept_paths = []
+            for file_path in file_paths:
+                if self._file_filter(file_path):
+                    kept_paths.append(file_path)
+                else:
+                    self.bytes_read += os.path.getsize(file_path)
+            file_paths = kept_paths
+        tasks = [(file_path, self._timezone) for file_path in file_paths]
+        if self._pool is not None:
+            for task, result in izip(tasks, self._pool.imap(_parse_eml_file, tasks, DEFAULT_CHUNK_SIZE)):
+                yield self._handle_result(task, result)
+        elif self._workers > 1:
+            pool = multiprocessing.Pool(self._workers)
+            try:
+                for task, result in izip(tasks, pool.imap(_parse_eml_file, tasks, DEFAULT_CHUNK_SIZE)):
+                    yield self._handle_result(task, result)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for task in tasks:
+                yield self._handle_result(task, _parse_eml_file(task))
+
+    def _handle_result(self, task, result):
+        """
+        Record the progress and timings of a parsed file and run the callbacks for its message
+        :param task: The (file path, timezone) tuple that was parsed
+        :param result: The (message, timings) tuple returned by the parse
+        :return: The parsed EmailMessage instance
+        """
+        message, timings = result
+        self.bytes_read += os.path.getsize(task[0])
+        if self._metrics is not None:
+            self._metrics.record(timings)
+        self._run_callbacks(message)
+        return message
+
+    def _run_callbacks(self, message):
+        """
+        Execute every registered callback for a processed message
+        :param message: The EmailMessage instance that was processed
+        :return: None
+        """
+        for callback in self._callbacks.values():
+            callback(message)
 
     @staticmethod
-    def _process_multipart_eml(file_path):
+    def _process_multipart_eml(file_path, timings=None):
         """
         Given an EML file, clean it up, parse it, and extract
         the contents we want to keep.
         :param file_path: The path to the EML file to process
+        :param timings: Optional StageTimings instance that records the time spent in each stage
         :return: A structured EmailMessage instance
         """
-        with codecs.open(file_path, 'rb', 'windows-1252') as text_file:
-            text = unicode(''.join(text_file.readlines()))
-            if use_full_parser(text):
+        if timings is None:
+            timings = StageTimings()
+        with timings.stage('file_read'):
+            with codecs.open(file_path, 'rb', 'windows-1252') as text_file:
+                text = unicode(''.join(text_file.readlines()))
+        if use_full_parser(text):
+            with timings.stage('header_repair'):
                 text = fix_broken_yahoo_headers(text)
+        with timings.stage('mime_parse'):
             parser = Parser()
             mime_message = parser.parse(StringIO(text))
+        with timings.stage('payload_walk'):
             return_message = get_nested_payload(mime_message)
-            return_message.source = "EML File {}".format(file_path)
+        return_message.source = "EML File {}".format(file_path)
         return return_message
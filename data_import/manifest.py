@@ -0,0 +1,134 @@
+"""
+Module that keeps track of which import sources have already been
+processed, so that incremental imports can skip unchanged input.
+"""
+
+import os
+import hashlib
+import xml.etree.ElementTree as ElementTree
+from bson.binary import Binary
+from pymongo import ReplaceOne, DeleteMany, InsertOne, ASCENDING
+
+_read_chunk_size = 1024 * 1024
+_node_digest_size = 16
+# 64k digests make 1MB documents, well clear of MongoDB's 16MB document limit
+_node_digests_per_document = 64 * 1024
+
+
+def file_digest(path):
+    """
+    Calculates an MD5 hash of a file's contents, reading it in chunks
+    :param path: The path of the file
+    :return: string
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(_read_chunk_size), ''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class SourceManifest(object):
+    """
+    Class that records the path, size, modification time and digest of every
+    source file, and the digest of every message node within XML dumps,
+    as of the last import.  Node digests are kept in their own collection, split
+    across as many documents as a dump needs.
+    """
+    def __init__(self, collection, node_collection, record_digests=True):
+        """
+        Initializer for the SourceManifest class.  Loads the file records into memory.
+        :param collection: The pymongo collection the file records are kept in
+        :param node_collection: The pymongo collection the node digests are kept in
+        :param record_digests: Whether to digest the contents of new and changed files.  Without a digest,
+        a file whose modification time changes is treated as changed even if its contents are not.
+        :return: None
+        """
+        self._collection = collection
+        self._node_collection = node_collection
+        self._record_digests = record_digests
+        # manifests written before node digests had their own collection kept them in the file records
+        self._entries = dict((entry['_id'], entry) for entry in collection.find({}, {'node_digests': False}))
+        self._pending = {}
+        self._pending_nodes = {}
+
+    def clear(self):
+        """
+        Forget every recorded source
+        :return: None
+        """
+        self._collection.delete_many({})
+        self._node_collection.delete_many({})
+        self._entries = {}
+        self._pending = {}
+        self._pending_nodes = {}
+
+    def check_file(self, path):
+        """
+        Determine whether a file is unchanged since it was last recorded, and stage a fresh
+        record of it if it isn't.  The digest is only calculated when the size or modification time differ,
+        and only if digests are being recorded.
+        :param path: The path of the file
+        :return: True if the file is unchanged, else False
+        """
+        entry = self._entries.get(path)
+        stat = os.stat(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return True
+        digest = file_digest(path) if self._record_digests else None
+        self._pending[path] = {'_id': path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'digest': digest}
+        return entry is not None and digest is not None and entry.get('digest') == digest
+
+    def file_filter(self, skip_unchanged=True):
+        """
+        Builds a filter for EMLDirectoryProcessor that records every file it sees
+        :param skip_unchanged: Whether files that are unchanged since they were last recorded should be skipped
+        :return: A function taking a file path that returns True if the file should be processed
+        """
+        def should_process(path):
+            return not self.check_file(path) or not skip_unchanged
+        return should_process
+
+    def node_filter(self, path, skip_unchanged=True):
+        """
+        Builds a filter for XMLDumpProcessor that records the digest of every message node
+        by its position in the dump.  check_file() must have been called for the path first.
+        :param path: The path of the XML dump
+        :param skip_unchanged: Whether nodes that are unchanged since they were last recorded should be skipped
+        :return: A function taking a node position and node that returns True if the node should be processed
+        """
+        previous_digests = ''.join(str(document['digests']) for document in
+                                   self._node_collection.find({'path': path}, sort=[('chunk', ASCENDING)]))
+        digests = []
+        self._pending.setdefault(path, dict(self._entries.get(path, {})))
+        self._pending_nodes[path] = digests
+
+        def should_process(position, node):
+            digest = hashlib.md5(ElementTree.tostring(node)).digest()
+            digests.append(digest)
+            offset = position * _node_digest_size
+            return not skip_unchanged or previous_digests[offset:offset + _node_digest_size] != digest
+        return should_process
+
+    def save(self):
+        """
+        Write every staged record to the manifest collections.  Node digests are written first,
+        so that an interrupted save leaves the old file records in place and the files are processed again.
+        :return: None
+        """
+        records, self._pending = self._pending, {}
+        node_records, self._pending_nodes = self._pending_nodes, {}
+        node_requests = []
+        for path, digests in node_records.items():
+            node_requests.append(DeleteMany({'path': path}))
+            for chunk, start in enumerate(range(0, len(digests), _node_digests_per_document)):
+                chunk_digests = Binary(''.join(digests[start:start + _node_digests_per_document]))
+                node_requests.append(InsertOne({'path': path, 'chunk': chunk, 'digests': chunk_digests}))
+        if node_requests:
+            self._node_collection.bulk_write(node_requests)  # ordered, so old digests are deleted first
+        requests = []
+        for path, record in records.items():
+            self._entries[path] = record
+            requests.append(ReplaceOne({'_id': path}, record, upsert=True))
+        if requests:
+            self._collection.bulk_write(requests, ordered=False)
@@ -0,0 +1,213 @@
+"""
+Module that records how long each stage of the import takes, and exports
+the timings and counters in the Prometheus text format.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the histogram buckets used for stage timings
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+DEFAULT_METRIC_PREFIX = 'topsecret_import'
+
+
+class StageTimings(dict):
+    """
+    Plain record of the seconds spent in each stage while handling a single item.
+    It can be pickled, so timings taken in a worker process can be returned to the parent.
+    """
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code as part of a stage
+        :param name: The name of the stage
+        :return: A context manager
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self[name] = self.get(name, 0.0) + time.time() - start
+
+
+class Histogram(object):
+    """
+    Class that counts observed values into fixed buckets and keeps their count and sum
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initializer for the Histogram class
+        :param buckets: The sorted upper bounds of the buckets
+        :return: None
+        """
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Record a value
+        :param value: The value to record
+        :return: None
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        """
+        The number of values at or below each bucket bound, as Prometheus reports them
+        :return: A list of (bound, count) tuples
+        """
+        total = 0
+        counts = []
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+
+class ImportMetrics(object):
+    """
+    Thread-safe registry of stage timing histograms, counters and gauges for an import run
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix=DEFAULT_METRIC_PREFIX):
+        """
+        Initializer for the ImportMetrics class
+        :param buckets: The bucket bounds used for every stage histogram
+        :param prefix: The prefix of every exported metric name
+        :return: None
+        """
+        self._buckets = buckets
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds):
+        """
+        Record the time taken by one run of a stage
+        :param stage: The name of the stage
+        :param seconds: The time taken
+        :return: None
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self._buckets)
+            histogram.observe(seconds)
+
+    def record(self, timings):
+        """
+        Record every stage of a StageTimings instance
+        :param timings: A dict of stage names and seconds
+        :return: None
+        """
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Time a block of code as one run of a stage
+        :param stage: The name of the stage
+        :return: A context manager
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - start)
+
+    def increment(self, name, amount=1):
+        """
+        Add to a counter
+        :param name: The name of the counter
+        :param amount: The amount to add
+        :return: None
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        """
+        Set a gauge to the current value of something
+        :param name: The name of the gauge
+        :param value: The value
+        :return: None
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def histogram(self, stage):
+        """
+        Returns the histogram of a stage, or None if the stage has not been observed
+        :param stage: The name of the stage
+        :return: Histogram
+        """
+        return self._histograms.get(stage)
+
+    def counter(self, name):
+        """
+        Returns the value of a counter
+        :param name: The name of the counter
+        :return: int
+        """
+        return self._counters.get(name, 0)
+
+    def to_prometheus(self):
+        """
+        Renders every metric in the Prometheus text exposition format
+        :return: string
+        """
+        lines = []
+        with self._lock:
+            if self._histograms:
+                name = '{}_stage_seconds'.format(self._prefix)
+                lines.append('# HELP {} Time spent in each stage of the import.'.format(name))
+                lines.append('# TYPE {} histogram'.format(name))
+                for stage, histogram in sorted(self._histograms.items()):
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, stage, bound, count))
+                    lines.append('{}_bucket{{stage="{}",le="+Inf"}} {}'.format(name, stage, histogram.count))
+                    lines.append('{}_sum{{stage="{}"}} {!r}'.format(name, stage, histogram.sum))
+                    lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, histogram.count))
+            for counter, value in sorted(self._counters.items()):
+                name = '{}_{}_total'.format(self._prefix, counter)
+                lines.append('# TYPE {} counter'.format(name))
+                lines.append('{} {}'.format(name, value))
+            for gauge, value in sorted(self._gauges.items()):
+                name = '{}_{}'.format(self._prefix, gauge)
+                lines.append('# TYPE {} gauge'.format(name))
+                lines.append('{} {!r}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Write the metrics to a file, e.g. for the node exporter's textfile collector.
+        The file is replaced in one step so readers never see a partial write.
+        :param path: The path of the file to write
+        :return: None
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.rename(temp_path, path)
+
+    def summary(self):
+        """
+        Returns one line per stage with its count, total and mean time
+        :return: A list of strings
+        """
+        with self._lock:
+            return ["{}: {} runs, {:.2f}s total, {:.3f}ms mean".format(
+                stage, histogram.count, histogram.sum, histogram.sum * 1000 / max(histogram.count, 1))
+                for stage, histogram in sorted(self._histograms.items())]
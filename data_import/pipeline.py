@@ -0,0 +1,88 @@
+"""
+Module that provides helpers for chaining the stages of an import
+together without materializing whole message lists in memory.
+"""
+
+import sys
+import threading
+from Queue import Queue, Empty, Full
+import six
+
+DEFAULT_BUFFER_SIZE = 100
+DEFAULT_SOURCE_WORKERS = 4
+
+_end_of_stream = object()
+_end_of_wait = object()
+_poll_interval = 0.1
+
+
+def merged(iterables, workers=DEFAULT_SOURCE_WORKERS, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Consumes several iterables concurrently on a bounded pool of background threads, yielding
+    their items as they arrive.  Items of the same iterable keep their order, but items of different
+    iterables are interleaved, so a slow iterable doesn't hold back the others.  Iterables are started
+    in order, and the producers run ahead of the consumer by at most buffer_size items each.
+    The first error raised by any producer stops the merge and is re-raised in the consumer.
+    :param iterables: The iterables producing items (typically one message generator per source)
+    :param workers: The maximum number of iterables consumed at the same time
+    :param buffer_size: The maximum number of items held for each producer
+    :return: A generator yielding the items of all iterables
+    """
+    iterables = list(iterables)
+    workers = max(1, min(workers, len(iterables)))
+    queue = Queue(maxsize=buffer_size * workers)
+    pending = Queue()
+    for iterable in iterables:
+        pending.put(iterable)
+    failure = []
+    stopped = threading.Event()
+
+    def put(item):
+        # give up once the merge has stopped, so a producer can't be left blocked on a full queue
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=_poll_interval)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            while not stopped.is_set():
+                try:
+                    iterable = pending.get_nowait()
+                except Empty:
+                    return
+                for item in iterable:
+                    if not put(item):
+                        return
+        except Exception:
+            failure.append(sys.exc_info())
+            stopped.set()
+        finally:
+            put(_end_of_stream)
+
+    producers = [threading.Thread(target=produce, name='import-producer-{}'.format(i)) for i in range(workers)]
+    for producer in producers:
+        producer.daemon = True
+        producer.start()
+    running = len(producers)
+    try:
+        while running:
+            try:
+                item = queue.get(timeout=_poll_interval)
+            except Empty:
+                item = _end_of_wait
+            if failure:
+                six.reraise(*failure[0])
+            if item is _end_of_wait:
+                continue
+            if item is _end_of_stream:
+                running -= 1
+            else:
+                yield item
+    finally:
+        stopped.set()
+    for producer in producers:
+        producer.join()
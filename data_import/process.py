@@ -1,102 +1,241 @@
 import os
 import codecs
-from common.config import AppConfig
-from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError
+import multiprocessing
+from itertools import izip, repeat
+from common.connection import get_client
+from common.data_facade import ensure_indexes, mark_import_finished
+from common.attachment_store import AttachmentStore
 from eml_directory_processor import EMLDirectoryProcessor
 from xml_dump_processor import XMLDumpProcessor
+from pipeline import merged, DEFAULT_BUFFER_SIZE, DEFAULT_SOURCE_WORKERS
+from progress import SourceProgress, ImportProgress, source_size, DEFAULT_PROGRESS_INTERVAL
+from metrics import ImportMetrics
+from batch_writer import BatchWriter, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from manifest import SourceManifest
+from dedupe import SeenHashes, SeenHashesFilter, DEFAULT_EXPECTED_MESSAGES
 
 TIMEZONES = {
     "ben": "US/Eastern",
     "mary": "Asia/Seoul"
 }
 
+# Every source that makes up a full import, as (type, path, timezone) tuples
+SOURCES = [
+    ('xml', './email project/asimov/email_new/from_ben.xml', TIMEZONES['ben']),
+    ('xml', './email project/asimov/email_new/from_mary.xml', TIMEZONES['mary']),
+    ('eml', './email project/asimov/emails_mary/2/Mary/', TIMEZONES['mary']),
+    ('eml', './email project/asimov/emails_mary/mary00000001/', TIMEZONES['mary']),
+    ('eml', './email project/asimov/emails_mary/mary/', TIMEZONES['mary']),
+    ('xml', './email project/baxter/email_new/Copy of from_ben.xml', TIMEZONES['ben']),
+    ('xml', './email project/baxter/email_new/from_ben.xml', TIMEZONES['ben']),
+    ('xml', './email project/baxter/email_new/from_mary.xml', TIMEZONES['mary']),
+    ('eml', './email project/baxter/emails_mary/2/Mary/', TIMEZONES['mary']),
+    ('eml', './email project/baxter/emails_mary/mary00000001/', TIMEZONES['mary']),
+    ('eml', './email project/baxter/emails_mary/mary/', TIMEZONES['mary'])
+]
+
 
 class Processor(object):
-    def __init__(self, process_directory=None):
+    def __init__(self, process_directory=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, eml_workers=None,
+                 source_workers=DEFAULT_SOURCE_WORKERS, incremental=False, compact_dedupe=False,
+                 expected_messages=DEFAULT_EXPECTED_MESSAGES, metrics_path=None,
+                 progress_interval=DEFAULT_PROGRESS_INTERVAL, record_digests=True):
         if not process_directory:
             process_directory = './email project/temp_processed'
+        if not eml_workers:
+            eml_workers = multiprocessing.cpu_count()
         self._process_directory = process_directory
+        self._eml_workers = eml_workers
+        self._eml_pool = None
+        self._source_workers = source_workers
+        self._buffer_size = buffer_size
+        self._incremental = incremental
         self._overall_counter = 0
-        self._document_counter = 0
-        self._duplicate_counter = 0
-        self._mongo_client = MongoClient(AppConfig.mongo_uri)
+        self._source_counters = {}
+        self._dropped_duplicate_counter = 0
+        self._seen_hashes = SeenHashesFilter(expected_messages) if compact_dedupe else SeenHashes()
+        self._progress = ImportProgress(progress_interval)
+        self._metrics = ImportMetrics()
+        self._metrics_path = metrics_path
+        self._mongo_client = get_client()
         self._email_collection = self._mongo_client['topsecret']['email']
         self._source_collection = self._mongo_client['topsecret']['source']
-        self._email_collection.delete_many({})
-        self._source_collection.delete_many({})
+        self._attachment_store = AttachmentStore(self._mongo_client['topsecret'])
+        self._manifest = SourceManifest(self._mongo_client['topsecret']['manifest'],
+                                        self._mongo_client['topsecret']['manifest_nodes'], record_digests)
+        if incremental:
+            # keep what earlier runs imported and carry on counting after it
+            self._overall_counter = self._source_collection.count()
+            self._seen_hashes.preload(document['_id'] for document in self._email_collection.find({}, {'_id': True}))
+        else:
+            self._email_collection.delete_many({})
+            self._source_collection.delete_many({})
+            self._attachment_store.clear()
+            self._manifest.clear()
+        self._email_writer = BatchWriter(self._email_collection, batch_size, flush_interval, upsert=incremental,
+                                         metrics=self._metrics, stage='email_write')
+        self._source_writer = BatchWriter(self._source_collection, batch_size, flush_interval,
+                                          metrics=self._metrics, stage='source_write')
 
-    def process_email_xml_dump(self, path, timezone):
-        processor = XMLDumpProcessor(path, timezone)
+    def xml_dump_processor(self, path, timezone):
+        if self._manifest.check_file(path) and self._incremental:
+            print "Skipping unchanged file '{}'.".format(path)
+            return None
+        node_filter = self._manifest.node_filter(path, skip_unchanged=self._incremental)
+        processor = XMLDumpProcessor(path, timezone, node_filter=node_filter, metrics=self._metrics)
         processor.add_callback("logger", self.email_message_extracted_handler)
-        messages = processor.process()
-        return messages
+        return processor
 
-    def process_eml_directory(self, path, timezone):
-        processor = EMLDirectoryProcessor(path, timezone)
+    def eml_directory_processor(self, path, timezone):
+        file_filter = self._manifest.file_filter(skip_unchanged=self._incremental)
+        processor = EMLDirectoryProcessor(path, timezone, workers=self._eml_workers, file_filter=file_filter,
+                                          metrics=self._metrics, pool=self._eml_pool)
         processor.add_callback("logger", self.email_message_extracted_handler)
-        messages = processor.process()
-        return messages
-
-    def write_messages_to_files(self, messages):
-        for message in messages:
-            file_name = u'{}_{}.txt'.format(str(message.ordinal_number).zfill(4), message.sender)
-            with codecs.open(os.path.join(self._process_directory, file_name), 'w', encoding='utf-8') as text_file:
-                text_sections = [
-                    u'From: {}\n'.format(message.sender),
-                    u'To: {}\n'.format(message.recipient),
-                    u'Date: {}\n\n'.format(message.date),
-                    u'Subject: {}\n\n'.format(message.subject),
-                    message.body
-                ]
-                text_buffer = '\n'.join(text_sections)
-                text_file.write(text_buffer)
-                if len(message.attachments) > 0:
-                    text_file.write('\n')
-                    for attachment in message.attachments:
-                        text_file.write('Attachment: {}\n'.format(attachment.filename or 'No Filename'))
-            print u"Wrote file '{0}'.".format(file_name)
-            self.write_mongo_document(message)
-
-    def process_all(self):
+        return processor
+
+    def source_processor(self, source_type, path, timezone):
+        if source_type == 'xml':
+            return self.xml_dump_processor(path, timezone)
+        if source_type == 'eml':
+            return self.eml_directory_processor(path, timezone)
+        raise ValueError("Unknown source type '{}'.".format(source_type))
+
+    def iter_tracked_source(self, source_type, path, timezone, progress=None):
+        if progress is None:
+            progress = SourceProgress(path, source_size(path))
+            self._progress.add_source(progress)
+        progress.start()
+        processor = self.source_processor(source_type, path, timezone)
+        if processor is not None:
+            for message in processor.iter_messages():
+                progress.message_processed(processor.bytes_read)
+                yield message
+        progress.finish()
+        print progress.report()
+
+    def write_messages_to_files(self, numbered_messages):
+        for source_number, message in numbered_messages:
+            self.number_message(source_number, message)
+            if self.is_known_duplicate(message):
+                self._dropped_duplicate_counter += 1
+                self._metrics.increment('duplicates_dropped')
+            else:
+                self.write_message_to_file(message)
+                self.write_mongo_document(message)
+            if self._progress.report_due():
+                self.report_progress()
+
+    def report_progress(self):
+        print self._progress.report()
+        eta = self._progress.eta()
+        self._metrics.set_gauge('progress_ratio', self._progress.fraction_done)
+        self._metrics.set_gauge('eta_seconds', eta if eta is not None else -1)
+        self._metrics.set_gauge('documents_inserted', self._email_writer.inserted_count)
+        self._metrics.set_gauge('duplicates_rejected', self._email_writer.duplicate_count)
+        if self._metrics_path:
+            self._metrics.write(self._metrics_path)
+
+    def is_known_duplicate(self, message):
+        # a compact filter only knows about probable duplicates; those are left for the database to confirm
+        return not self._seen_hashes.add(message.content_hash) and self._seen_hashes.exact
+
+    def write_message_to_file(self, message):
+        file_name = u'{}_{}_{}.txt'.format(str(message.source_number).zfill(2), str(message.ordinal_number).zfill(4),
+                                           message.sender)
+        file_path = os.path.join(self._process_directory, file_name)
+        with self._metrics.timer('file_write'), codecs.open(file_path, 'w', encoding='utf-8') as text_file:
+            text_sections = [
+                u'From: {}\n'.format(message.sender),
+                u'To: {}\n'.format(message.recipient),
+                u'Date: {}\n\n'.format(message.date),
+                u'Subject: {}\n\n'.format(message.subject),
+                message.body
+            ]
+            text_buffer = '\n'.join(text_sections)
+            text_file.write(text_buffer)
+            if len(message.attachments) > 0:
+                text_file.write('\n')
+                for attachment in message.attachments:
+                    text_file.write('Attachment: {}\n'.format(attachment.filename or 'No Filename'))
+
+    def process_all(self, sources=None):
+        if sources is None:
+            sources = SOURCES
         if not os.path.exists(self._process_directory):
             os.makedirs(self._process_directory)
-        all_messages = []
-        all_messages += self.process_email_xml_dump('./email project/asimov/email_new/from_ben.xml', 'US/Eastern')
-        all_messages += self.process_email_xml_dump('./email project/asimov/email_new/from_mary.xml', 'Asia/Seoul')
-        all_messages += self.process_eml_directory('./email project/asimov/emails_mary/2/Mary/', 'Asia/Seoul')
-        all_messages += self.process_eml_directory('./email project/asimov/emails_mary/mary00000001/', 'Asia/Seoul')
-        all_messages += self.process_eml_directory('./email project/asimov/emails_mary/mary/', 'Asia/Seoul')
-        all_messages += self.process_email_xml_dump('./email project/baxter/email_new/Copy of from_ben.xml', 'US/Eastern')
-        all_messages += self.process_email_xml_dump('./email project/baxter/email_new/from_ben.xml', 'US/Eastern')
-        all_messages += self.process_email_xml_dump('./email project/baxter/email_new/from_mary.xml', 'Asia/Seoul')
-        all_messages += self.process_eml_directory('./email project/baxter/emails_mary/2/Mary/', 'Asia/Seoul')
-        all_messages += self.process_eml_directory('./email project/baxter/emails_mary/mary00000001/', 'Asia/Seoul')
-        all_messages += self.process_eml_directory('./email project/baxter/emails_mary/mary/', 'Asia/Seoul')
-        self.write_messages_to_files(all_messages)
+        # Sources are parsed concurrently and their messages are written as they arrive, interleaved.
+        # Messages are numbered by their source and their position within it, so numbering doesn't
+        # depend on thread timing.
+        source_iterators = []
+        for source_number, (source_type, path, timezone) in enumerate(sources):
+            # register every source up front, so progress and ETA cover the whole run
+            progress = SourceProgress(path, source_size(path))
+            self._progress.add_source(progress)
+            messages = self.iter_tracked_source(source_type, path, timezone, progress)
+            source_iterators.append(izip(repeat(source_number), messages))
+        if self._eml_workers > 1 and any(source_type == 'eml' for source_type, _, _ in sources):
+            # fork the parsing processes before the source threads start; a process forked while a source
+            # thread holds a lock such as the import lock can deadlock as soon as it starts.  pymongo's
+            # monitor threads are already running, but the parsing processes never use the client.
+            self._eml_pool = multiprocessing.Pool(self._eml_workers)
+        try:
+            messages = merged(source_iterators, self._source_workers, self._buffer_size)
+            self.write_messages_to_files(messages)
+        finally:
+            if self._eml_pool is not None:
+                self._eml_pool.terminate()
+                self._eml_pool.join()
+                self._eml_pool = None
+        self.flush()
+        self.report_progress()
+        self._manifest.save()  # only once everything it describes has been written
+        mark_import_finished(self._mongo_client['topsecret'])
+        created = ensure_indexes(self._email_collection)
+        if created:
+            print "Created indexes {}.".format(', '.join(created))
 
     def write_mongo_document(self, message):
+        for attachment in message.attachments:
+            with self._metrics.timer('attachment_write'):
+                self._attachment_store.put(attachment)
         document = message.to_dict()
         document['_id'] = document['content_hash']
-        try:
-            result = self._email_collection.insert_one(document)
-            print "Wrote document '{0} with hash {1}'.".format(result.inserted_id, document['content_hash'])
-            self._document_counter += 1
-        except DuplicateKeyError:
-            print "Document with ID {} already exists".format(document['_id'])
-            self._duplicate_counter += 1
+        self._email_writer.add(document)
+
+    def flush(self):
+        self._email_writer.flush()
+        self._source_writer.flush()
+        duplicates = self._email_writer.duplicate_count + self._dropped_duplicate_counter
+        print "Wrote {} documents, skipped {} duplicates.".format(self._email_writer.inserted_count, duplicates)
 
     def email_message_extracted_handler(self, message):
+        # runs on the source threads, so hashing overlaps with the writers
+        with self._metrics.timer('hashing'):
+            message.content_hash
+
+    def number_message(self, source_number, message):
+        if source_number not in self._source_counters:
+            # carry on after the messages earlier runs took from the same source
+            self._source_counters[source_number] = self._source_collection.count(
+                {"source_number": source_number}) if self._incremental else 0
+        self._source_counters[source_number] += 1
         self._overall_counter += 1
-        message.ordinal_number = self._overall_counter
-        message_source = {
-            "number": message.ordinal_number,
+        message.source_number = source_number
+        message.ordinal_number = self._source_counters[source_number]
+        self._source_writer.add({
             "source": message.source,
-            "content_hash": message.content_hash
-        }
-        self._source_collection.insert_one(message_source)
-        print "Processed Message {} from {}".format(message.ordinal_number, message.source)
+            "content_hash": message.content_hash,
+            "source_number": message.source_number,
+            "number": message.ordinal_number
+        })
+        self._metrics.increment('messages')
 
     def print_stats(self):
-        stats = (self._overall_counter, self._document_counter, self._duplicate_counter)
+        duplicates = self._email_writer.duplicate_count + self._dropped_duplicate_counter
+        stats = (self._overall_counter, self._email_writer.inserted_count, duplicates)
+        for progress in self._progress.sources:
+            print progress.report()
+        for line in self._metrics.summary():
+            print line
         print "{} messages processed, with {} unique messages found and {} duplicates.".format(*stats)
@@ -0,0 +1,156 @@
+"""
+Module that tracks how quickly each import source is being processed,
+and how long the whole import has left to run.
+"""
+
+import os
+import time
+from datetime import timedelta
+
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+
+def source_size(path):
+    """
+    Determine the number of bytes of input a source represents
+    :param path: The path to an XML dump file or a directory of EML files
+    :return: The total size in bytes
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+class SourceProgress(object):
+    """
+    Class that records the message count, input size and elapsed
+    time of a single import source.
+    """
+    def __init__(self, name, total_bytes):
+        """
+        Initializer for the SourceProgress class
+        :param name: A display name for the source
+        :param total_bytes: The size in bytes of the source's input
+        :return: None
+        """
+        self.name = name
+        self.total_bytes = total_bytes
+        self.bytes_processed = 0
+        self.message_count = 0
+        self._started = time.time()
+        self._finished = None
+
+    def start(self):
+        """
+        Record that processing of the source has begun, if it was registered ahead of time
+        :return: None
+        """
+        self._started = time.time()
+
+    def message_processed(self, bytes_processed=None):
+        """
+        Record that a message from the source was processed
+        :param bytes_processed: How many bytes of the source's input have been read so far, if known
+        :return: None
+        """
+        self.message_count += 1
+        if bytes_processed is not None:
+            self.bytes_processed = bytes_processed
+
+    def finish(self):
+        """
+        Record that the source has been fully processed
+        :return: None
+        """
+        self._finished = time.time()
+        self.bytes_processed = self.total_bytes
+
+    @property
+    def elapsed(self):
+        """
+        The number of seconds spent on the source so far
+        :return: float
+        """
+        return (self._finished or time.time()) - self._started
+
+    def report(self):
+        """
+        Returns a one-line summary of the source's throughput
+        :return: string
+        """
+        elapsed = max(self.elapsed, 1e-6)
+        stats = (self.name, self.message_count, self.total_bytes, elapsed,
+                 self.message_count / elapsed, self.total_bytes / elapsed)
+        return "{}: {} messages, {} bytes in {:.1f}s ({:.1f} messages/sec, {:.0f} bytes/sec)".format(*stats)
+
+
+class ImportProgress(object):
+    """
+    Class that combines the progress of every source of an import run into an
+    overall throughput and an estimate of the time remaining.
+    """
+    def __init__(self, interval=DEFAULT_PROGRESS_INTERVAL):
+        """
+        Initializer for the ImportProgress class
+        :param interval: The minimum number of seconds between progress reports
+        :return: None
+        """
+        self.sources = []
+        self._interval = interval
+        self._started = time.time()
+        self._last_report = self._started
+
+    def add_source(self, progress):
+        """
+        Register a source so that its input counts towards the total
+        :param progress: The SourceProgress instance of the source
+        :return: None
+        """
+        self.sources.append(progress)
+
+    @property
+    def message_count(self):
+        return sum(source.message_count for source in self.sources)
+
+    @property
+    def fraction_done(self):
+        """
+        The share of all registered input that has been read
+        :return: A float between 0 and 1
+        """
+        total_bytes = sum(source.total_bytes for source in self.sources)
+        if not total_bytes:
+            return 0.0
+        return min(1.0, float(sum(source.bytes_processed for source in self.sources)) / total_bytes)
+
+    @property
+    def elapsed(self):
+        return time.time() - self._started
+
+    def eta(self):
+        """
+        Estimates the seconds left, assuming the rest of the input is read at the rate seen so far
+        :return: float, or None before any input has been read
+        """
+        fraction_done = self.fraction_done
+        if not fraction_done:
+            return None
+        return self.elapsed * (1 - fraction_done) / fraction_done
+
+    def report_due(self):
+        """
+        Determines if the report interval has passed since the last report
+        :return: True if a report is due, else False
+        """
+        return time.time() - self._last_report >= self._interval
+
+    def report(self):
+        """
+        Returns a one-line summary of overall progress, and restarts the report interval
+        :return: string
+        """
+        self._last_report = time.time()
+        eta = self.eta()
+        stats = (self.message_count, self.message_count / max(self.elapsed, 1e-6), self.fraction_done * 100,
+                 timedelta(seconds=int(eta)) if eta is not None else 'unknown')
+        return "Progress: {} messages ({:.1f} messages/sec), {:.1f}% of input read, ETA {}".format(*stats)
@@ -4,11 +4,13 @@ into structured EmailMessage instances.
 """
 
 import os
+import time
 from StringIO import StringIO
 from dateutil.parser import parse
 import xml.etree.ElementTree as ElementTree
 from email.parser import Parser
 from common.email_message import EmailMessage
+from metrics import StageTimings
 from email_parsing_helpers import (
     fix_broken_hotmail_headers,
     get_nested_payload,
@@ -24,16 +26,22 @@ class XMLDumpProcessor:
     Class that manages processing an XML extract of an outlook mailbox
     into structured EmailMessage instances.
     """
-    def __init__(self, process_path, timezone):
+    def __init__(self, process_path, timezone, node_filter=None, metrics=None):
         """
         Initializer for the XMLDumpProcessor class
         :param process_path: Path at which we will find an XML dump file to process
         :param timezone: pytz timezone string used to convert dates to UTC
+        :param node_filter: Optional function taking a message node's position and the node,
+        returning False for nodes that should be skipped
+        :param metrics: Optional ImportMetrics instance that records the time spent in each stage
         :return: None
         """
         self._callbacks = dict()
         self._process_path = process_path
         self._timezone = timezone
+        self._node_filter = node_filter
+        self._metrics = metrics
+        self.bytes_read = 0
         if not os.path.exists(self._process_path):
             raise ValueError(str.format("File '{0}' does not exist.", self._process_path))
 
@@ -51,29 +59,61 @@ class XMLDumpProcessor:
         Processes XML file content found in the instance's processing path.
         :return: A list of EmailMessage objects parsed from the directory contents
         """
-        output_contents = []
-        tree = ElementTree.parse(self._process_path)
-        root = tree.getroot()
-        for messageNode in root.iter('message'):
-            message = self._process_single_node(messageNode)
-            output_contents.append(message)
-            for callback in self._callbacks.values():
-                callback(message)
-        return output_contents
+        return list(self.iter_messages())
 
-    def _process_single_node(self, node):
+    def iter_messages(self):
+        """
+        Incrementally parses the XML file found in the instance's processing path,
+        yielding each message as soon as its node has been read.  Processed nodes
+        are cleared from the tree so memory use does not grow with the size of the dump.
+        bytes_read follows how far into the file parsing has got.
+        :return: A generator of EmailMessage objects parsed from the file contents
+        """
+        root = None
+        position = -1
+        self.bytes_read = 0
+        with open(self._process_path, 'rb') as source:
+            read_started = time.time()
+            for event, node in ElementTree.iterparse(source, events=('start', 'end')):
+                if root is None:
+                    root = node  # the first start event belongs to the document root
+                if event != 'end' or node.tag != 'message':
+                    continue
+                position += 1
+                timings = StageTimings(file_read=time.time() - read_started)
+                message = None
+                if self._node_filter is None or self._node_filter(position, node):
+                    message = self._process_single_node(node, timings)
+                node.clear()
+                root.clear()  # drop references to already-processed siblings
+                self.bytes_read = source.tell()
+                if self._metrics is not None:
+                    self._metrics.record(timings)
+                if message is not None:
+                    for callback in self._callbacks.values():
+                        callback(message)
+                    yield message
+                read_started = time.time()
+
+    def _process_single_node(self, node, timings=None):
         """
         Extract the contents of a single XML dump node
         :param node: The XML node corresponding to a message
+        :param timings: Optional StageTimings instance that records the time spent in each stage
         :return: An EmailMessage instance containing the message contents
         """
+        if timings is None:
+            timings = StageTimings()
         text = unicode(node.find('text').text)
         text = unicode.lstrip(text, u'>')  # remove leading char that got into the text somehow
         if use_full_parser(text):
-            text = fix_broken_hotmail_headers(text)
-            parser = Parser()
-            mime_message = parser.parse(StringIO(text))
-            return_message = get_nested_payload(mime_message)
+            with timings.stage('header_repair'):
+                text = fix_broken_hotmail_headers(text)
+            with timings.stage('mime_parse'):
+                parser = Parser()
+                mime_message = parser.parse(StringIO(text))
+            with timings.stage('payload_walk'):
+                return_message = get_nested_payload(mime_message)
         else:
             return_message = EmailMessage()
             subject_node = node.find('subject')
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for serving wsgi:application with several threaded workers
+"""
+import multiprocessing
+from common.config import AppConfig
+
+bind = AppConfig.web_bind
+workers = AppConfig.web_workers or multiprocessing.cpu_count() * 2 + 1
+# each worker thread can hold one pooled Mongo connection, so keep threads within the pool size
+threads = min(AppConfig.web_threads, AppConfig.mongo_max_pool_size)
+worker_class = 'gthread'
+# load the app once in the master so workers fork with it already imported
+preload_app = True
+
+
+def post_fork(server, worker):
+    """
+    Give each forked worker its own Mongo connections instead of the master's
+    :param server: The gunicorn arbiter
+    :param worker: The worker that was just forked
+    :return: None
+    """
+    from web.api import reset_connections
+    reset_connections()
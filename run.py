@@ -1,13 +1,24 @@
 import sys
+import json
 import getopt
-from data_import.process import Processor
-from web.api import app
 
 if __name__ == '__main__':
-    opts = getopt.getopt(sys.argv[1:], 'rp')
+    opts = getopt.getopt(sys.argv[1:], 'rpifm:s:')
+    settings = [value.split('=', 1) for name, value in opts[0] if name == '-s']
+    if settings:
+        # e.g. -s slow_query_ms=100 -s profile_sample_rate=0.01; running API processes pick these up
+        from common.config import AppConfig
+        from common.connection import get_client
+        from common.data_facade import set_instrumentation
+        set_instrumentation(get_client()[AppConfig.app_name], **dict((name, json.loads(value)) for name, value in settings))
     if ('-p', '') in opts[0]:
-        processor = Processor()
+        from data_import.process import Processor
+        # -f skips digesting whole files, so a later -i run re-imports files that were only touched
+        processor = Processor(incremental=('-i', '') in opts[0], metrics_path=dict(opts[0]).get('-m'),
+                              record_digests=('-f', '') not in opts[0])
         processor.process_all()
         processor.print_stats()
     if ('-r', '') in opts[0]:
+        # development server only; serve wsgi:application with gunicorn_config.py in production
+        from web.api import app
         app.run('localhost', 8080, debug=True)
\ No newline at end of file
@@ -1,10 +1,14 @@
 import unittest
 import json
+import base64
 from web import api
 from common.email_message import EmailMessage
 from common.config import AppConfig
-from mock import patch, call, Mock
+from common.data_facade import SUMMARY_FIELDS, decode_cursor
+from mock import patch, call, Mock, MagicMock
+from gridfs.errors import NoFile
 from flask import abort
+from pymongo.errors import PyMongoError
 
 
 class ApiTests(unittest.TestCase):
@@ -13,10 +17,17 @@ class ApiTests(unittest.TestCase):
         self.facade = self.data_patcher.start()
         single_message = self.get_sample_message().to_dict()
         self.test_messages = [single_message] * 5
-        self.facade.load.return_value = self.test_messages
+        self.facade.load_page.return_value = (self.test_messages, None)
+        self.facade.instrumentation_settings.return_value = {}
+        self.facade.import_generation.return_value = 1
+        api._cache_state['checked'] = 0
+        self.facade.count.return_value = {'total': 5, 'sender': [{'value': 'me', 'count': 5}]}
+        api.invalidate_caches()
         self.app = api.app.test_client()
 
     def tearDown(self):
+        api.apply_instrumentation({})
+        api._instrumentation['checked'] = 0
         self.data_patcher.stop()
 
     def test_get_single_existing_email_with_valid_id(self):
@@ -30,6 +41,191 @@ class ApiTests(unittest.TestCase):
         response = self.app.get('/emails/123')
         self.assertEquals(404, response.status_code)
 
+    def test_get_single_email_has_etag(self):
+        self.facade.db.email.find_one_or_404.return_value = self.get_sample_message().to_dict()
+        response = self.app.get('/emails/123')
+        self.assertEquals('"123"', response.headers['ETag'])
+
+    def test_get_single_email_given_matching_etag(self):
+        self.facade.db.email.find_one_or_404.return_value = self.get_sample_message().to_dict()
+        response = self.app.get('/emails/123', headers={'If-None-Match': '"123"'})
+        self.assertEquals(304, response.status_code)
+        self.assertEquals('"123"', response.headers['ETag'])
+
+    def test_cached_single_email_given_matching_etag(self):
+        self.facade.db.email.find_one_or_404.return_value = self.get_sample_message().to_dict()
+        self.app.get('/emails/123')
+        response = self.app.get('/emails/123', headers={'If-None-Match': '"123"'})
+        self.assertEquals(304, response.status_code)
+        self.assertEquals(1, self.facade.db.email.find_one_or_404.call_count)
+
+    def test_removed_email_given_matching_etag(self):
+        self.facade.db.email.find_one_or_404.side_effect = lambda x: abort(404)
+        response = self.app.get('/emails/123', headers={'If-None-Match': '"123"'})
+        self.assertEquals(404, response.status_code)
+
+    def test_get_single_email_is_cached(self):
+        message = self.get_sample_message().to_dict()
+        self.facade.db.email.find_one_or_404.return_value = message
+        self.app.get('/emails/123')
+        response = self.app.get('/emails/123')
+        self.assertEquals(json.dumps(message), response.data)
+        self.facade.db.email.find_one_or_404.assert_called_once_with({'_id': '123'})
+
+    def test_invalidated_cache_reloads_single_email(self):
+        self.facade.db.email.find_one_or_404.return_value = self.get_sample_message().to_dict()
+        self.app.get('/emails/123')
+        api.invalidate_caches()
+        self.app.get('/emails/123')
+        self.assertEquals(2, self.facade.db.email.find_one_or_404.call_count)
+
+    def test_reset_connections_after_fork(self):
+        self.facade.db.email.find_one_or_404.return_value = self.get_sample_message().to_dict()
+        self.app.get('/emails/123')
+        api.reset_connections()
+        self.facade.close.assert_called_once_with()
+        self.app.get('/emails/123')
+        self.assertEquals(2, self.facade.db.email.find_one_or_404.call_count)
+
+    @patch('web.api.request_logger')
+    def test_request_timing_is_off_by_default(self, request_logger):
+        self.app.get('/emails').get_data()
+        self.assertFalse(request_logger.info.called)
+
+    @patch('web.api.request_logger')
+    def test_request_timing_switched_on_at_runtime(self, request_logger):
+        self.facade.instrumentation_settings.return_value = {'request_timing': True}
+        api._instrumentation['checked'] = 0
+        self.app.get('/emails?page_size=5').get_data()
+        method, path, status, summary = request_logger.info.call_args[0][1:]
+        self.assertEquals(('GET', '/emails?page_size=5', 200), (method, path, status))
+        for phase in ('validate', 'cache', 'query', 'fetch', 'serialize', 'total'):
+            self.assertIn(phase + '=', summary)
+
+    @patch('web.api.profiler')
+    def test_sampled_request_is_profiled(self, profiler):
+        profile = Mock()
+        profiler.start.return_value = profile
+        self.app.get('/emails').get_data()
+        profiler.finish.assert_called_once_with(profile, 'emails_all')
+
+    def test_slow_query_threshold_switched_on_at_runtime(self):
+        self.facade.instrumentation_settings.return_value = {'slow_query_ms': 50}
+        api._instrumentation['checked'] = 0
+        self.app.get('/emails').get_data()
+        self.assertEquals(50, self.facade.slow_query_ms)
+
+    def test_get_facets(self):
+        response = self.app.get('/emails/facets?sender=me&facet_limit=3')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals(self.facade.count.return_value, json.loads(response.data))
+        self.facade.count.assert_called_once_with(AppConfig.email_collection, sender=u'me', facet_limit=3)
+
+    def test_get_facets_with_invalid_limit(self):
+        response = self.app.get('/emails/facets?facet_limit=0')
+        self.assertEquals(400, response.status_code)
+        self.assertFalse(self.facade.count.called)
+
+    def test_facets_are_cached_by_normalized_filter(self):
+        self.app.get('/emails/facets?sender=Me&search=indexed')
+        response = self.app.get('/emails/facets?sender=%20me')
+        self.assertEquals(self.facade.count.return_value, json.loads(response.data))
+        self.assertEquals(1, self.facade.count.call_count)
+
+    def test_substring_facets_are_not_normalized(self):
+        self.app.get('/emails/facets?sender=Me&search=substring')
+        self.app.get('/emails/facets?sender=me&search=substring')
+        self.assertEquals(2, self.facade.count.call_count)
+
+    def test_invalidated_cache_recounts(self):
+        self.app.get('/emails/facets')
+        api.invalidate_caches()
+        self.app.get('/emails/facets')
+        self.assertEquals(2, self.facade.count.call_count)
+
+    def test_old_server_version_is_reported(self):
+        self.facade.server_version.return_value = (3, 2, 11)
+        with patch.object(api.app.logger, 'error') as error:
+            api.check_server_version()
+        self.assertTrue(error.called)
+
+    def test_supported_server_version(self):
+        self.facade.server_version.return_value = (3, 4, 0)
+        with patch.object(api.app.logger, 'error') as error:
+            api.check_server_version()
+        self.assertFalse(error.called)
+
+    def test_page_of_emails_is_cached(self):
+        self.app.get('/emails?page_size=5&sort=sender').get_data()
+        response = self.app.get('/emails?sort=sender&page_size=5')
+        self.assertEquals(json.dumps(self.test_messages), response.get_data())
+        self.assertIn('ETag', response.headers)
+        self.assertEquals(1, self.facade.load_page.call_count)
+
+    def test_cached_page_given_matching_etag(self):
+        self.app.get('/emails').get_data()
+        etag = self.app.get('/emails').headers['ETag']
+        response = self.app.get('/emails', headers={'If-None-Match': etag})
+        self.assertEquals(304, response.status_code)
+
+    def test_uncached_page_has_same_etag_as_cached_page(self):
+        first = self.app.get('/emails')
+        first.get_data()
+        etag = first.headers['ETag']
+        self.assertEquals(etag, self.app.get('/emails').headers['ETag'])
+        self.assertEquals(1, self.facade.load_page.call_count)
+
+    def test_page_given_matching_etag_is_not_loaded(self):
+        etag = self.app.get('/emails?page_size=5').headers['ETag']
+        api.invalidate_caches()
+        response = self.app.get('/emails?page_size=5', headers={'If-None-Match': etag})
+        self.assertEquals(304, response.status_code)
+        self.assertEquals(etag, response.headers['ETag'])
+        self.assertEquals(1, self.facade.load_page.call_count)
+
+    def test_page_etag_depends_on_query(self):
+        etag = self.app.get('/emails?page_size=5').headers['ETag']
+        self.assertNotEqual(etag, self.app.get('/emails?page_size=6').headers['ETag'])
+
+    def test_page_etag_changes_after_import(self):
+        etag = self.app.get('/emails').headers['ETag']
+        self.facade.import_generation.return_value = 2
+        api._cache_state['checked'] = 0
+        response = self.app.get('/emails', headers={'If-None-Match': etag})
+        self.assertEquals(200, response.status_code)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_page_has_no_etag_before_generation_is_known(self):
+        self.facade.import_generation.side_effect = PyMongoError('down')
+        api._cache_state['generation'] = None
+        with patch.object(api.app.logger, 'error'):
+            response = self.app.get('/emails')
+        self.assertEquals(200, response.status_code)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_page_too_large_to_cache_is_reloaded(self):
+        with patch.object(api, 'AppConfig', AppConfig._replace(page_cache_entry_bytes=10)):
+            first = self.app.get('/emails')
+            second = self.app.get('/emails')
+        self.assertEquals(json.dumps(self.test_messages), second.get_data())
+        self.assertEquals(first.headers['ETag'], second.headers['ETag'])
+        self.assertEquals(2, self.facade.load_page.call_count)
+
+    def test_get_existing_attachment(self):
+        attachment = MagicMock(content_type='text/plain', length=6)
+        attachment.__iter__.return_value = iter(['foo', 'bar'])
+        self.facade.open_attachment.return_value = attachment
+        response = self.app.get('/attachments/abc')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('foobar', response.get_data())
+        self.assertEquals('text/plain', response.mimetype)
+        self.facade.open_attachment.assert_called_once_with('abc')
+
+    def test_get_missing_attachment(self):
+        self.facade.open_attachment.side_effect = NoFile
+        response = self.app.get('/attachments/abc')
+        self.assertEquals(404, response.status_code)
+
     def test_get_page_of_emails(self):
         response = self.app.get('/emails?page=10&page_size=20')
         self.assertEquals(200, response.status_code)
@@ -52,6 +248,10 @@ class ApiTests(unittest.TestCase):
         self.assertEquals(json.dumps(self.test_messages), response.get_data())
         self.assert_data_load(sort=u'sender')
 
+    def test_get_page_given_unknown_sort_option(self):
+        response = self.app.get('/emails?sort=content')
+        self.assertEquals(400, response.status_code)
+
     def test_get_page_given_no_page_size(self):
         response = self.app.get('/emails')
         self.assertEquals(200, response.status_code)
@@ -120,6 +320,78 @@ class ApiTests(unittest.TestCase):
         response = self.app.get('/emails?body=')
         self.assertEquals(400, response.status_code)
 
+    def test_get_page_given_a_cursor(self):
+        response = self.app.get('/emails?cursor=abc')
+        self.assertEquals(200, response.status_code)
+        self.assert_data_load(cursor=u'abc')
+
+    def test_get_page_given_unspecified_cursor(self):
+        response = self.app.get('/emails?cursor=')
+        self.assertEquals(400, response.status_code)
+
+    def test_get_page_given_invalid_cursor(self):
+        self.facade.load_page.side_effect = ValueError('Invalid cursor.')
+        response = self.app.get('/emails?cursor=abc')
+        self.assertEquals(400, response.status_code)
+
+    def test_get_page_given_tampered_cursor(self):
+        self.facade.load_page.side_effect = lambda collection, **kwargs: decode_cursor(kwargs['cursor'])
+        response = self.app.get('/emails?cursor=' + base64.urlsafe_b64encode('{"after": 5}'))
+        self.assertEquals(400, response.status_code)
+
+    def test_page_with_following_page_returns_next_cursor(self):
+        self.facade.load_page.return_value = (self.test_messages, 'abc')
+        response = self.app.get('/emails?page_size=5&sort=sender')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('abc', response.headers['X-Next-Cursor'])
+        self.assert_data_load(page_size=5, sort=u'sender')
+
+    def test_last_page_returns_no_next_cursor(self):
+        response = self.app.get('/emails?page_size=5')
+        self.assertEquals(200, response.status_code)
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+    def test_get_page_given_fields(self):
+        response = self.app.get('/emails?fields=subject, body')
+        self.assertEquals(200, response.status_code)
+        self.assert_data_load(fields=[u'subject', u'body'])
+
+    def test_get_page_given_unknown_fields(self):
+        response = self.app.get('/emails?fields=subject,password')
+        self.assertEquals(400, response.status_code)
+
+    def test_get_page_given_unspecified_fields(self):
+        response = self.app.get('/emails?fields=')
+        self.assertEquals(400, response.status_code)
+
+    def test_get_empty_page_of_emails(self):
+        self.facade.load_page.return_value = ([], None)
+        response = self.app.get('/emails')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('[]', response.get_data())
+
+    def test_page_of_emails_is_streamed(self):
+        response = self.app.get('/emails')
+        self.assertTrue(response.is_streamed)
+        self.assertEquals(json.dumps(self.test_messages), response.get_data())
+
+    def test_page_of_emails_is_streamed_from_an_iterator(self):
+        self.facade.load_page.return_value = (iter(self.test_messages), 'next')
+        response = self.app.get('/emails')
+        self.assertEquals('next', response.headers['X-Next-Cursor'])
+        self.assertEquals(json.dumps(self.test_messages), response.get_data())
+        self.assertEquals(json.dumps(self.test_messages), self.app.get('/emails').get_data())
+        self.assertEquals(1, self.facade.load_page.call_count)
+
+    def test_get_page_given_substring_search(self):
+        response = self.app.get('/emails?body=foobar&search=substring')
+        self.assertEquals(200, response.status_code)
+        self.assert_data_load(body=u'foobar', search=u'substring')
+
+    def test_get_page_given_unknown_search(self):
+        response = self.app.get('/emails?body=foobar&search=fuzzy')
+        self.assertEquals(400, response.status_code)
+
     def get_sample_message(self):
         return EmailMessage(**{
             u'sender': u"me",
@@ -129,8 +401,9 @@ class ApiTests(unittest.TestCase):
             u'body': u"stuff thaangs"
         })
 
-    def assert_data_load(self, page=1, page_size=10, **kwargs):
-        self.facade.load.assert_called_once_with(AppConfig.email_collection, page=page, page_size=page_size, **kwargs)
+    def assert_data_load(self, page=1, page_size=10, fields=list(SUMMARY_FIELDS), **kwargs):
+        self.facade.load_page.assert_called_once_with(AppConfig.email_collection, page=page, page_size=page_size,
+                                                      fields=fields, **kwargs)
 
 if __name__ == '__main__':
     loader = unittest.TestLoader()
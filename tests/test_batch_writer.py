@@ -0,0 +1,79 @@
+import unittest
+from data_import.batch_writer import BatchWriter
+from data_import.metrics import ImportMetrics
+from pymongo.errors import BulkWriteError
+from mock import Mock
+
+
+class BatchWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.collection = Mock()
+        self.collection.insert_many.side_effect = lambda documents, ordered: Mock(inserted_ids=[d['_id'] for d in documents])
+
+    def test_documents_are_buffered_until_batch_is_full(self):
+        writer = BatchWriter(self.collection, batch_size=3, flush_interval=60)
+        writer.add({'_id': 1})
+        writer.add({'_id': 2})
+        self.assertFalse(self.collection.insert_many.called)
+        writer.add({'_id': 3})
+        self.collection.insert_many.assert_called_once_with([{'_id': 1}, {'_id': 2}, {'_id': 3}], ordered=False)
+        self.assertEqual(3, writer.inserted_count)
+
+    def test_stale_buffer_is_flushed_on_add(self):
+        writer = BatchWriter(self.collection, batch_size=100, flush_interval=0)
+        writer.add({'_id': 1})
+        self.collection.insert_many.assert_called_once_with([{'_id': 1}], ordered=False)
+
+    def test_flush_with_empty_buffer_does_not_write(self):
+        writer = BatchWriter(self.collection)
+        self.assertEqual((0, 0), writer.flush())
+        self.assertFalse(self.collection.insert_many.called)
+
+    def test_duplicates_are_counted_from_bulk_write_errors(self):
+        self.collection.insert_many.side_effect = BulkWriteError({
+            'nInserted': 2,
+            'writeErrors': [{'code': 11000, 'index': 1}, {'code': 11000, 'index': 3}],
+            'writeConcernErrors': []
+        })
+        writer = BatchWriter(self.collection, batch_size=100, flush_interval=60)
+        for i in range(4):
+            writer.add({'_id': i})
+        self.assertEqual((2, 2), writer.flush())
+        self.assertEqual(2, writer.inserted_count)
+        self.assertEqual(2, writer.duplicate_count)
+
+    def test_other_bulk_write_errors_are_raised(self):
+        self.collection.insert_many.side_effect = BulkWriteError({
+            'nInserted': 0,
+            'writeErrors': [{'code': 11000, 'index': 0}, {'code': 121, 'index': 1}],
+            'writeConcernErrors': []
+        })
+        writer = BatchWriter(self.collection, batch_size=100, flush_interval=60)
+        writer.add({'_id': 1})
+        writer.add({'_id': 2})
+        with self.assertRaises(BulkWriteError):
+            writer.flush()
+
+    def test_upserts_count_existing_documents_as_duplicates(self):
+        self.collection.bulk_write.return_value = Mock(upserted_count=1)
+        writer = BatchWriter(self.collection, batch_size=100, flush_interval=60, upsert=True)
+        writer.add({'_id': 1})
+        writer.add({'_id': 2})
+        self.assertEqual((1, 1), writer.flush())
+        requests = self.collection.bulk_write.call_args[0][0]
+        self.assertEqual([{'_id': 1}, {'_id': 2}], [request._filter for request in requests])
+        self.assertFalse(self.collection.insert_many.called)
+
+    def test_flush_time_is_recorded(self):
+        metrics = ImportMetrics()
+        writer = BatchWriter(self.collection, batch_size=100, flush_interval=60, metrics=metrics, stage='email_write')
+        writer.add({'_id': 1})
+        writer.flush()
+        writer.flush()
+        self.assertEqual(1, metrics.histogram('email_write').count)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(BatchWriterTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
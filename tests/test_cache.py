@@ -0,0 +1,49 @@
+import unittest
+from web.cache import ByteSizedLRUCache
+
+
+class ByteSizedLRUCacheTests(unittest.TestCase):
+    def test_get_missing_key(self):
+        cache = ByteSizedLRUCache(100)
+        self.assertIsNone(cache.get('foo'))
+
+    def test_put_and_get(self):
+        cache = ByteSizedLRUCache(100)
+        self.assertTrue(cache.put('foo', 'bar', 3))
+        self.assertEqual('bar', cache.get('foo'))
+        self.assertEqual(3, cache.size)
+
+    def test_oversized_value_is_not_cached(self):
+        cache = ByteSizedLRUCache(10)
+        self.assertFalse(cache.put('foo', 'x' * 11, 11))
+        self.assertIsNone(cache.get('foo'))
+
+    def test_least_recently_used_value_is_evicted(self):
+        cache = ByteSizedLRUCache(10)
+        cache.put('a', 'aaaa', 4)
+        cache.put('b', 'bbbb', 4)
+        cache.get('a')
+        cache.put('c', 'cccc', 4)
+        self.assertEqual('aaaa', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(8, cache.size)
+
+    def test_replacing_a_value_updates_size(self):
+        cache = ByteSizedLRUCache(10)
+        cache.put('a', 'aaaa', 4)
+        cache.put('a', 'aa', 2)
+        self.assertEqual(2, cache.size)
+        self.assertEqual(1, len(cache))
+
+    def test_clear(self):
+        cache = ByteSizedLRUCache(10)
+        cache.put('a', 'aaaa', 4)
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, cache.size)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(ByteSizedLRUCacheTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
@@ -0,0 +1,54 @@
+import unittest
+from mock import patch
+from pymongo.read_preferences import ReadPreference
+from common import connection
+from common.config import AppConfig
+
+
+class ConnectionTests(unittest.TestCase):
+    def tearDown(self):
+        connection.close_clients()
+
+    def test_client_is_shared_within_a_process(self):
+        self.assertIs(connection.get_client(), connection.get_client(AppConfig.mongo_uri))
+
+    def test_client_is_not_shared_across_read_preferences(self):
+        primary = connection.get_client()
+        secondary = connection.get_client(read_preference_name='SECONDARY_PREFERRED')
+        self.assertIsNot(primary, secondary)
+        self.assertEqual(ReadPreference.SECONDARY_PREFERRED, secondary.read_preference)
+
+    def test_forked_process_gets_its_own_client(self):
+        parent_client = connection.get_client()
+        with patch('common.connection.os.getpid', return_value=-1):
+            child_client = connection.get_client()
+        self.assertIsNot(parent_client, child_client)
+        child_client.close()
+
+    def test_client_uses_configured_settings(self):
+        client = connection.get_client()
+        self.assertEqual(AppConfig.mongo_max_pool_size, client.max_pool_size)
+        self.assertEqual({'w': AppConfig.mongo_write_concern}, client.write_concern.document)
+        self.assertEqual(connection.read_preference(), client.read_preference)
+
+    def test_unknown_read_preference(self):
+        with self.assertRaises(ValueError):
+            connection.read_preference('fastest')
+
+    def test_flask_options(self):
+        options = connection.flask_options('SECONDARY_PREFERRED')
+        self.assertTrue(options['MONGO_HOST'].startswith(AppConfig.mongo_uri))
+        self.assertIn('maxPoolSize={}'.format(AppConfig.mongo_max_pool_size), options['MONGO_HOST'])
+        self.assertEqual(ReadPreference.SECONDARY_PREFERRED, options['MONGO_READ_PREFERENCE'])
+        self.assertFalse(options['MONGO_CONNECT'])
+
+    def test_uri_with_options(self):
+        self.assertEqual('mongodb://db:27017/?w=1', connection.uri_with_options('mongodb://db:27017', {'w': 1}))
+        self.assertEqual('mongodb://db/topsecret?w=1', connection.uri_with_options('mongodb://db/topsecret', {'w': 1}))
+        self.assertEqual('mongodb://db/?ssl=true&w=1', connection.uri_with_options('mongodb://db/?ssl=true', {'w': 1}))
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(ConnectionTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
@@ -1,8 +1,13 @@
 from common.email_message import EmailMessage
-from common.data_facade import DataFacade
+from common.data_facade import DataFacade, EMAIL_INDEXES, SUMMARY_FIELDS, SNIPPET_LENGTH, encode_cursor, \
+    set_instrumentation, summarize_explain, attachment_bucket_label, pipeline_shape, decode_cursor
 from common.config import AppConfig
 from flask import Flask
+from mock import patch, MagicMock
+from pymongo import ReadPreference
 import unittest
+import time
+import base64
 
 
 class DataFacadeTests(unittest.TestCase):
@@ -45,6 +50,71 @@ class DataFacadeTests(unittest.TestCase):
         for num, email in zip(range(67, 72), [EmailMessage(**message) for message in loaded_messages]):
             self.assertEqual(email.subject, 'foo{}'.format(num))
 
+    def test_load_page_with_next_cursor(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        for i in range(0, 12):
+            message = EmailMessage(subject='foo{}'.format(i % 4), body='bar{}'.format(i), sender='baz', recipient='bip', date='2016-07-07')
+            document = message.to_dict()
+            document['_id'] = document['content_hash']
+            self.facade.store(self.email_collection, document)
+        expected_messages = self.facade.load(self.email_collection, page_size=12, sort='subject')
+        first_page, next_cursor = self.facade.load_page(self.email_collection, page_size=8, sort='subject', fields=['body'])
+        first_page = list(first_page)
+        self.assertEqual([message['_id'] for message in expected_messages[:8]], [message['_id'] for message in first_page])
+        self.assertEqual([['_id', 'body']] * 8, [sorted(message.keys()) for message in first_page])
+        last_page, last_cursor = self.facade.load_page(self.email_collection, page_size=8, sort='subject', cursor=next_cursor)
+        self.assertEqual(expected_messages[8:], list(last_page))
+        self.assertIsNone(last_cursor)
+
+    def test_count_with_facets(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        for i in range(0, 12):
+            message = EmailMessage(subject='foo', body='bar{}'.format(i), sender='baz{}'.format(i % 3), recipient='bip',
+                                   date='2016-0{}-07'.format(i % 2 + 6))
+            self.facade.store(self.email_collection, message.to_dict())
+        counts = self.facade.count(self.email_collection, facet_limit=2)
+        self.assertEqual(12, counts['total'])
+        self.assertEqual([{'value': 'baz0', 'count': 4}, {'value': 'baz1', 'count': 4}], counts['sender'])
+        self.assertEqual([{'value': 'bip', 'count': 12}], counts['recipient'])
+        self.assertEqual([{'value': '2016-06', 'count': 6}, {'value': '2016-07', 'count': 6}], counts['month'])
+        self.assertEqual({'value': '0', 'count': 12}, counts['attachments'][0])
+        self.assertEqual(4, self.facade.count(self.email_collection, sender='BAZ2')['total'])
+
+    def test_load_pages_by_cursor(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        for i in range(0, 30):
+            message = EmailMessage(subject='foo{}'.format(i % 3), body='bar{}'.format(i), sender='baz', recipient='bip', date='2016-07-07')
+            document = message.to_dict()
+            document['_id'] = document['content_hash']
+            self.facade.store(self.email_collection, document)
+        expected_messages = self.facade.load(self.email_collection, page_size=30, sort='subject')
+        loaded_messages = []
+        cursor = None
+        while True:
+            page = self.facade.load(self.email_collection, page_size=7, sort='subject', cursor=cursor)
+            loaded_messages += page
+            if len(page) < 7:
+                break
+            cursor = encode_cursor(page[-1], 'subject')
+        self.assertEqual([m['_id'] for m in expected_messages], [m['_id'] for m in loaded_messages])
+
+    def test_load_rejects_cursor_for_other_sort(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        cursor = encode_cursor({'_id': 'abc', 'subject': 'foo'}, 'subject')
+        with self.assertRaises(ValueError):
+            self.facade.load(self.email_collection, sort='sender', cursor=cursor)
+
+    def test_load_summary_fields(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        message = EmailMessage(subject='foo', body='bar' * 100, sender='baz', recipient='bip', date='2016-07-07')
+        message.add_attachment('content', 'text/plain', filename='a.txt')
+        self.facade.store(self.email_collection, message.to_dict())
+        loaded_messages = self.facade.load(self.email_collection, fields=SUMMARY_FIELDS)
+        self.assertEqual(1, len(loaded_messages))
+        self.assertEqual(set(SUMMARY_FIELDS) | {'_id'}, set(loaded_messages[0].keys()))
+        self.assertEqual(1, loaded_messages[0]['total_attachments'])
+        self.assertEqual(message.body[:SNIPPET_LENGTH], loaded_messages[0]['snippet'])
+
     def test_filter_by_field(self):
         self.facade.bind(AppConfig.mongo_uri)
         for i in range(1, 100):
@@ -55,6 +125,45 @@ class DataFacadeTests(unittest.TestCase):
         for email in [EmailMessage(**message) for message in loaded_messages]:
             self.assertTrue('1' in email.subject)
 
+    def test_search_sender_by_prefix(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        self.facade.ensure_indexes(self.email_collection)
+        for sender in ['Ben Peterson <killthrush@hotmail.com>', 'Mary Anne Lee <simitatores@yahoo.com>']:
+            message = EmailMessage(subject='foo', body='bar', sender=sender, recipient='bip', date='2016-07-07')
+            self.facade.store(self.email_collection, message.to_dict())
+        loaded_messages = self.facade.load(self.email_collection, sender='KILLTHR')
+        self.assertEqual(1, len(loaded_messages))
+        self.assertEqual('Ben Peterson <killthrush@hotmail.com>', loaded_messages[0]['sender'])
+        self.assertEqual(0, len(self.facade.load(self.email_collection, sender='peterson <killthrush')))
+        self.assertEqual(1, len(self.facade.load(self.email_collection, sender='ben peterson <killthrush')))
+
+    def test_search_body_with_text_index(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        self.facade.ensure_indexes(self.email_collection)
+        for body in ['the quick brown fox', 'jumped over the lazy dog']:
+            message = EmailMessage(subject='foo', body=body, sender='baz', recipient='bip', date='2016-07-07')
+            self.facade.store(self.email_collection, message.to_dict())
+        loaded_messages = self.facade.load(self.email_collection, body='fox')
+        self.assertEqual(1, len(loaded_messages))
+        self.assertEqual('the quick brown fox', loaded_messages[0]['body'])
+
+    def test_search_body_by_substring(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        for body in ['the quick brown fox', 'jumped over the lazy dog']:
+            message = EmailMessage(subject='foo', body=body, sender='baz', recipient='bip', date='2016-07-07')
+            self.facade.store(self.email_collection, message.to_dict())
+        loaded_messages = self.facade.load(self.email_collection, body='azy d', search='substring')
+        self.assertEqual(1, len(loaded_messages))
+
+    def test_ensure_indexes_creates_missing_indexes(self):
+        self.facade.bind(AppConfig.mongo_uri)
+        self.facade.store(self.email_collection, {'subject': 'foo'})
+        self.facade.db[self.email_collection].drop_indexes()
+        self.assertEqual([index['name'] for index in EMAIL_INDEXES], self.facade.missing_indexes(self.email_collection))
+        self.assertEqual([index['name'] for index in EMAIL_INDEXES], self.facade.ensure_indexes(self.email_collection))
+        self.assertEqual([], self.facade.missing_indexes(self.email_collection))
+        self.assertEqual([], self.facade.ensure_indexes(self.email_collection))
+
     def test_sorting(self):
         self.facade.bind(AppConfig.mongo_uri)
         test_messages = []
@@ -131,6 +240,152 @@ class DataFacadeTests(unittest.TestCase):
             broken_facade = DataFacade()
             broken_facade.clear_collection(self.email_collection, foo='bar')
 
+    def test_summarize_explain(self):
+        explain = {'stages': [
+            {'$cursor': {'queryPlanner': {'winningPlan': {
+                'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'sort_date'}}}}},
+            {'$project': {}},
+            {'$limit': 10}
+        ]}
+        self.assertEqual('plan: IXSCAN(sort_date) <- FETCH; stages: $cursor, $project, $limit',
+                         summarize_explain(explain))
+
+    def wait_for_explain(self, slow_query_logger):
+        for _ in range(100):
+            if slow_query_logger.warning.call_count >= 2:
+                return
+            time.sleep(0.01)
+
+    @patch('common.data_facade.slow_query_logger')
+    def test_slow_queries_are_logged_with_their_plan(self, slow_query_logger):
+        self.facade._client = MagicMock()
+        collection = self.facade._client.db[self.email_collection]
+        collection.database.command.return_value = {'stages': [{'$sort': {}}]}
+        self.facade.slow_query_ms = 0
+        self.facade.iter_load(self.email_collection, page=1)
+        self.wait_for_explain(slow_query_logger)
+        self.assertTrue(collection.database.command.call_args[1]['explain'])
+        self.assertIs(collection.read_preference, collection.database.command.call_args[1]['read_preference'])
+        self.assertIn('Slow query', slow_query_logger.warning.call_args_list[0][0][0])
+        self.assertIn('stages: $sort', slow_query_logger.warning.call_args_list[1][0][-1])
+
+    @patch('common.data_facade.explain_slow_query')
+    @patch('common.data_facade.slow_query_logger')
+    def test_slow_query_explains_are_rate_limited_by_shape(self, slow_query_logger, explain_slow_query):
+        self.facade._client = MagicMock()
+        self.facade.slow_query_ms = 0
+        self.facade.load(self.email_collection, page=1, sender=u'ben')
+        self.facade.load(self.email_collection, page=2, sender=u'mary')
+        self.facade.load(self.email_collection, page=1, sort='date')
+        for _ in range(100):
+            if explain_slow_query.call_count >= 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(3, slow_query_logger.warning.call_count)
+        self.assertEqual(2, explain_slow_query.call_count)
+
+    def test_decode_cursor(self):
+        cursor = encode_cursor({'_id': 'b', 'sender': 'y'}, 'sender')
+        self.assertEqual(['y', 'b'], decode_cursor(cursor, 'sender'))
+
+    def test_decode_tampered_cursor(self):
+        for key in ('{"after": 5}', '{"after": "ab"}', '{"after": null}', '[1, 2]', '5', '{}', 'not json'):
+            with self.assertRaises(ValueError):
+                decode_cursor(base64.urlsafe_b64encode(key))
+
+    def test_decode_cursor_for_other_sort(self):
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor({'_id': 'b', 'sender': 'y'}, 'sender'), 'date')
+
+    def test_pipeline_shape_ignores_values(self):
+        self.assertEqual(pipeline_shape([{'$match': {'sender': u'ben'}}, {'$limit': 10}]),
+                         pipeline_shape([{'$match': {'sender': u'mary'}}, {'$limit': 20}]))
+        self.assertNotEqual(pipeline_shape([{'$match': {'sender': u'ben'}}]),
+                            pipeline_shape([{'$match': {'recipient': u'ben'}}]))
+
+    @patch('common.data_facade.slow_query_logger')
+    def test_slow_query_logging_is_off_by_default(self, slow_query_logger):
+        self.facade._client = MagicMock()
+        self.facade.iter_load(self.email_collection, page=1)
+        self.assertFalse(slow_query_logger.warning.called)
+
+    def test_load_page_fetches_one_extra_document_for_the_cursor(self):
+        self.facade._client = MagicMock()
+        collection = self.facade._client.db[self.email_collection]
+        collection.aggregate.return_value = iter([{'_id': 'a', '_sort_value': 'x'}, {'_id': 'b', '_sort_value': 'y'},
+                                                  {'_id': 'c', '_sort_value': 'z'}])
+        documents, next_cursor = self.facade.load_page(self.email_collection, page_size=2, sort='sender', fields=['body'])
+        pipe = collection.aggregate.call_args[1]['pipeline']
+        self.assertIn({'$limit': 3}, pipe)
+        self.assertEqual('$sender', pipe[-1]['$project']['_sort_value'])
+        self.assertEqual([{'_id': 'a'}, {'_id': 'b'}], list(documents))
+        self.assertEqual(encode_cursor({'_id': 'b', 'sender': 'y'}, 'sender'), next_cursor)
+        self.assertEqual(1, collection.aggregate.call_count)
+
+    def test_load_page_without_following_page(self):
+        self.facade._client = MagicMock()
+        collection = self.facade._client.db[self.email_collection]
+        collection.aggregate.return_value = iter([{'_id': 'a', 'sender': 'x'}])
+        documents, next_cursor = self.facade.load_page(self.email_collection, page_size=2, sort='sender', fields=['sender'])
+        self.assertNotIn('_sort_value', collection.aggregate.call_args[1]['pipeline'][-1]['$project'])
+        self.assertEqual([{'_id': 'a', 'sender': 'x'}], list(documents))
+        self.assertIsNone(next_cursor)
+
+    def test_load_page_returns_an_iterator(self):
+        self.facade._client = MagicMock()
+        collection = self.facade._client.db[self.email_collection]
+        collection.aggregate.return_value = iter([{'_id': 'a'}, {'_id': 'b'}, {'_id': 'c'}])
+        documents, next_cursor = self.facade.load_page(self.email_collection, page_size=2)
+        self.assertIs(documents, iter(documents))
+        self.assertEqual([{'_id': 'a'}, {'_id': 'b'}], list(documents))
+        self.assertEqual([], list(documents))
+
+    def test_import_generation_is_read_from_the_primary(self):
+        self.facade._client = MagicMock()
+        meta = self.facade._client.db[AppConfig.meta_collection]
+        meta.with_options.return_value.find_one.return_value = {'_id': 'import', 'generation': 4}
+        self.assertEqual(4, self.facade.import_generation())
+        meta.with_options.assert_called_once_with(read_preference=ReadPreference.PRIMARY)
+
+    def test_count_runs_one_facet_aggregation(self):
+        self.facade._client = MagicMock()
+        collection = self.facade._client.db[self.email_collection]
+        collection.aggregate.return_value = iter([{
+            'total': [{'count': 3}],
+            'sender': [{'_id': 'baz', 'count': 3}],
+            'recipient': [{'_id': 'bip', 'count': 3}],
+            'month': [{'_id': '2016-07', 'count': 3}],
+            'attachments': [{'_id': 0, 'count': 2}, {'_id': 2, 'count': 1}]
+        }])
+        counts = self.facade.count(self.email_collection, sender='baz')
+        pipe = collection.aggregate.call_args[1]['pipeline']
+        self.assertEqual(['$match', '$facet'], [stage.keys()[0] for stage in pipe])
+        self.assertEqual(3, counts['total'])
+        self.assertEqual([{'value': 'baz', 'count': 3}], counts['sender'])
+        self.assertEqual([('0', 2), ('1', 0), ('2-4', 1), ('5-9', 0), ('10+', 0)],
+                         [(bucket['value'], bucket['count']) for bucket in counts['attachments']])
+
+    def test_count_of_empty_collection(self):
+        self.facade._client = MagicMock()
+        collection = self.facade._client.db[self.email_collection]
+        collection.aggregate.return_value = iter([{
+            'total': [], 'sender': [], 'recipient': [], 'month': [], 'attachments': []
+        }])
+        self.assertEqual(0, self.facade.count(self.email_collection)['total'])
+
+    def test_server_version(self):
+        self.facade._client = MagicMock()
+        self.facade._client.db.command.return_value = {'version': '3.2.11', 'versionArray': [3, 2, 11, 0]}
+        self.assertEqual((3, 2, 11), self.facade.server_version())
+        self.facade._client.db.command.assert_called_once_with('buildInfo')
+
+    def test_attachment_bucket_labels(self):
+        self.assertEqual(['0', '1', '2-4', '5-9', '10+'], [attachment_bucket_label(lower) for lower in (0, 1, 2, 5, 10)])
+
+    def test_set_unknown_instrumentation_setting(self):
+        with self.assertRaises(ValueError):
+            set_instrumentation(MagicMock(), slow_queries=True)
+
 if __name__ == '__main__':
     loader = unittest.TestLoader()
     user_tests = loader.loadTestsFromTestCase(DataFacadeTests)
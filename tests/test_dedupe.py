@@ -0,0 +1,51 @@
+import hashlib
+import unittest
+from data_import.dedupe import SeenHashes, SeenHashesFilter
+
+
+def content_hash(i):
+    return hashlib.md5(str(i)).hexdigest()
+
+
+class SeenHashesTests(unittest.TestCase):
+    def test_new_hash_is_added(self):
+        seen = SeenHashes()
+        self.assertTrue(seen.add(content_hash(1)))
+        self.assertEqual(1, len(seen))
+
+    def test_repeated_hash_is_a_duplicate(self):
+        seen = SeenHashes()
+        seen.add(content_hash(1))
+        self.assertFalse(seen.add(content_hash(1)))
+        self.assertEqual(1, len(seen))
+
+    def test_contains(self):
+        seen = SeenHashes()
+        seen.add(content_hash(1))
+        self.assertIn(content_hash(1), seen)
+        self.assertNotIn(content_hash(2), seen)
+
+    def test_preloaded_hash_is_a_duplicate(self):
+        seen = SeenHashes()
+        seen.preload(content_hash(i) for i in range(10))
+        self.assertFalse(seen.add(content_hash(5)))
+        self.assertTrue(seen.add(content_hash(10)))
+
+
+class SeenHashesFilterTests(unittest.TestCase):
+    def test_repeated_hash_is_a_probable_duplicate(self):
+        seen = SeenHashesFilter(expected=1000)
+        self.assertTrue(seen.add(content_hash(1)))
+        self.assertFalse(seen.add(content_hash(1)))
+
+    def test_false_positive_rate_is_near_target(self):
+        seen = SeenHashesFilter(expected=10000, error_rate=0.01)
+        seen.preload(content_hash(i) for i in range(10000))
+        false_positives = len([i for i in range(10000, 20000) if content_hash(i) in seen])
+        self.assertLess(false_positives, 200)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite([loader.loadTestsFromTestCase(SeenHashesTests),
+                                loader.loadTestsFromTestCase(SeenHashesFilterTests)])
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
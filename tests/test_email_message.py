@@ -0,0 +1,151 @@
+import unittest
+from datetime import datetime
+from dateutil.tz import tzoffset
+from common.email_message import EmailMessage
+from common.attachment import Attachment
+
+
+class EmailMessageTests(unittest.TestCase):
+    def get_sample_message(self):
+        return EmailMessage(subject=u're:', body=u'stuff thaangs', sender=u'me', recipient=u'you',
+                            date=u'2003-07-31T06:44:38-04:00')
+
+    def test_content_hash_is_memoized(self):
+        message = self.get_sample_message()
+        self.assertIsNone(message._content_hash)
+        content_hash = message.content_hash
+        self.assertEqual(content_hash, message._content_hash)
+        self.assertEqual(content_hash, message.content_hash)
+
+    def test_setting_a_hashed_field_invalidates_the_hash(self):
+        for name, value in (('subject', u'fwd:'), ('body', u'other stuff'), ('sender', u'him'),
+                            ('recipient', u'her'), ('date', u'2004-01-01T00:00:00')):
+            message = self.get_sample_message()
+            content_hash = message.content_hash
+            setattr(message, name, value)
+            self.assertIsNone(message._content_hash, name)
+            self.assertNotEqual(content_hash, message.content_hash, name)
+
+    def test_setting_an_unhashed_field_keeps_the_hash(self):
+        message = self.get_sample_message()
+        content_hash = message.content_hash
+        message.ordinal_number = 7
+        message.source = u'somewhere'
+        self.assertEqual(content_hash, message._content_hash)
+
+    def test_appending_body_text_invalidates_the_hash(self):
+        message = self.get_sample_message()
+        content_hash = message.content_hash
+        message.append_body(u'more')
+        self.assertNotEqual(content_hash, message.content_hash)
+
+    def test_hash_covers_attachment_digests(self):
+        first = self.get_sample_message()
+        second = self.get_sample_message()
+        first.add_attachment('first content', 'text/plain', filename='notes.txt')
+        second.add_attachment('other content', 'text/plain', filename='notes.txt')
+        self.assertNotEqual(first.content_hash, second.content_hash)
+
+    def test_adding_an_attachment_invalidates_the_hash(self):
+        message = self.get_sample_message()
+        content_hash = message.content_hash
+        message.add_attachment('content', 'text/plain', filename='notes.txt')
+        self.assertNotEqual(content_hash, message.content_hash)
+
+    def test_equal_content_gives_equal_hashes(self):
+        first = self.get_sample_message()
+        second = self.get_sample_message()
+        first.add_attachment('content', 'text/plain', filename='notes.txt')
+        second.add_attachment(u'content', 'text/plain', filename='notes.txt')
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(first, second)
+        self.assertEqual(first.content_hash, first.to_dict()['content_hash'])
+
+    def test_date_is_parsed_from_strings(self):
+        message = EmailMessage()
+        expected = datetime(2003, 7, 31, 6, 44, 38, tzinfo=tzoffset(None, -4 * 3600))
+        message.date = '2003-07-31T06:44:38-04:00'
+        self.assertEqual(expected, message.date)
+        message.date = u'Thu, 31 Jul 2003 06:44:38 -0400'
+        self.assertEqual(expected, message.date)
+
+    def test_date_accepts_datetimes_and_none(self):
+        message = EmailMessage()
+        date = datetime(2003, 7, 31)
+        message.date = date
+        self.assertIs(date, message.date)
+        message.date = None
+        self.assertIsNone(message.date)
+
+    def test_date_rejects_unsupported_types(self):
+        message = EmailMessage()
+        for value in (20030731, 2003.0731, ['2003-07-31']):
+            with self.assertRaises(ValueError):
+                message.date = value
+
+    def test_unknown_attribute_cannot_be_set(self):
+        message = EmailMessage()
+        with self.assertRaises(AttributeError):
+            message.cc = u'them'
+
+    def test_append_body_drops_junk_footer(self):
+        message = EmailMessage(body=u'')
+        message.append_body(u'hello\r\nthere\r\nDo You Yahoo!?\r\nad stuff')
+        self.assertEqual(u'hello\nthere', message.body)
+
+    def test_append_body_drops_junk_footer_after_any_line_break(self):
+        for line_break in (u'\r', u'\n', u'\r\n', u'\x0b', u'\x0c', u'\x1c', u'\x1d', u'\x1e', u'\x85',
+                           u'\u2028', u'\u2029'):
+            message = EmailMessage(body=u'')
+            message.append_body(u'hello{0}Do You Yahoo!?{0}ad stuff'.format(line_break))
+            self.assertEqual(u'hello', message.body, repr(line_break))
+
+    def test_append_body_splits_byte_strings_like_splitlines(self):
+        message = EmailMessage()
+        message.body = ''
+        message.append_body('hello\x85Do You Yahoo!?\rad stuff')
+        self.assertEqual('hello\x85Do You Yahoo!?\nad stuff', message.body)
+
+    def test_append_body_only_drops_whole_marker_lines(self):
+        message = EmailMessage(body=u'')
+        message.append_body(u'hello\nDo You Yahoo!? yes\n  -----Original Message-----\nbye')
+        self.assertEqual(u'hello\nDo You Yahoo!? yes\n  -----Original Message-----\nbye', message.body)
+
+    def test_append_body_drops_text_starting_with_marker(self):
+        message = EmailMessage(body=u'')
+        message.append_body(u'-----Original Message-----\nquoted')
+        self.assertEqual(u'', message.body)
+
+    def test_body_is_assembled_like_appending_and_stripping(self):
+        message = EmailMessage(body=u'')
+        expected = u''
+        for text in (u'  first part \n', u'\n', u'second\npart  \n\n', u'   ', u'third'):
+            message.append_body(text)
+            expected = (expected + u'\n'.join(text.splitlines())).strip()
+        self.assertEqual(expected, message.body)
+        self.assertEqual(u'first partsecond\npartthird', message.body)
+
+    def test_body_setter_discards_appended_parts(self):
+        message = EmailMessage(body=u'')
+        message.append_body(u'appended')
+        message.body = u'replaced'
+        self.assertEqual(u'replaced', message.body)
+
+
+class AttachmentTests(unittest.TestCase):
+    def test_unknown_attribute_cannot_be_set(self):
+        attachment = Attachment('content', 'text/plain', filename='notes.txt')
+        with self.assertRaises(AttributeError):
+            attachment.size = 7
+
+    def test_unicode_content_is_stored_as_utf8(self):
+        attachment = Attachment(u'caf\xe9', 'text/plain')
+        self.assertEqual('caf\xc3\xa9', attachment.content)
+        self.assertEqual(Attachment('caf\xc3\xa9', 'text/plain').digest, attachment.digest)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    message_tests = loader.loadTestsFromTestCase(EmailMessageTests)
+    attachment_tests = loader.loadTestsFromTestCase(AttachmentTests)
+    suite = unittest.TestSuite([message_tests, attachment_tests])
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
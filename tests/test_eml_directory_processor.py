@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from data_import.eml_directory_processor import EMLDirectoryProcessor, _parse_eml_file
+from mock import Mock
+
+TIMEZONE = 'US/Eastern'
+
+EML_FILE = ('Subject: subject {0}\r\n'
+            'From: Ben Peterson <killthrush@hotmail.com>\r\n'
+            'To: Mary Anne Lee <simitatores@yahoo.com>\r\n'
+            'Date: Wed, 1 Jan 2003 10:{0:02d}:00 -0500\r\n'
+            '\r\n'
+            'body {0}\r\n')
+
+
+class EMLDirectoryProcessorTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for number in range(20):
+            with open(os.path.join(self.directory, '{}.eml'.format(number)), 'w') as eml_file:
+                eml_file.write(EML_FILE.format(number))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def sources(self, processor):
+        return [message.source for message in processor.iter_messages()]
+
+    def test_pooled_order_matches_serial_order(self):
+        serial = self.sources(EMLDirectoryProcessor(self.directory, TIMEZONE))
+        pooled = self.sources(EMLDirectoryProcessor(self.directory, TIMEZONE, workers=2))
+        self.assertEqual(20, len(serial))
+        self.assertEqual(serial, pooled)
+
+    def test_shared_pool_order_matches_serial_order(self):
+        serial = self.sources(EMLDirectoryProcessor(self.directory, TIMEZONE))
+        pool = multiprocessing.Pool(2)
+        try:
+            pooled = self.sources(EMLDirectoryProcessor(self.directory, TIMEZONE, pool=pool))
+        finally:
+            pool.terminate()
+            pool.join()
+        self.assertEqual(serial, pooled)
+
+    def test_pooled_results_are_streamed(self):
+        consumed = []
+
+        def results(function, tasks, chunk_size):
+            for task in tasks:
+                consumed.append(task)
+                yield function(task)
+        pool = Mock()
+        pool.imap.side_effect = results
+        messages = EMLDirectoryProcessor(self.directory, TIMEZONE, pool=pool).iter_messages()
+        next(messages)
+        self.assertEqual(1, len(consumed))
+
+    def test_parsed_message_fields(self):
+        message, timings = _parse_eml_file((os.path.join(self.directory, '3.eml'), TIMEZONE))
+        self.assertEqual(u'subject 3', message.subject)
+        self.assertTrue(message.body.endswith(u'body 3'))
+        self.assertIn('mime_parse', timings)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(EMLDirectoryProcessorTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+from data_import.manifest import SourceManifest
+from pymongo import InsertOne
+from mock import Mock, patch
+
+
+class SourceManifestTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'source.eml')
+        self.write_file('first')
+        self.collection = Mock()
+        self.collection.find.return_value = []
+        self.node_collection = Mock()
+        self.node_collection.find.return_value = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, content):
+        with open(self.path, 'w') as output_file:
+            output_file.write(content)
+
+    def saved_records(self):
+        requests = self.collection.bulk_write.call_args[0][0]
+        return [request._doc for request in requests]
+
+    def saved_node_requests(self):
+        return self.node_collection.bulk_write.call_args[0][0]
+
+    def saved_node_documents(self):
+        return [request._doc for request in self.saved_node_requests() if isinstance(request, InsertOne)]
+
+    def manifest(self, record_digests=True):
+        return SourceManifest(self.collection, self.node_collection, record_digests)
+
+    def reloaded_manifest(self, record_digests=True):
+        self.collection.find.return_value = self.saved_records()
+        if self.node_collection.bulk_write.called:
+            self.node_collection.find.return_value = self.saved_node_documents()
+        return self.manifest(record_digests)
+
+    def record_nodes(self, manifest, nodes):
+        manifest.check_file(self.path)
+        node_filter = manifest.node_filter(self.path)
+        results = [node_filter(i, node) for i, node in enumerate(nodes)]
+        manifest.save()
+        return results
+
+    def test_new_file_is_changed(self):
+        manifest = self.manifest()
+        self.assertFalse(manifest.check_file(self.path))
+
+    def test_recorded_file_is_unchanged(self):
+        manifest = self.manifest()
+        manifest.check_file(self.path)
+        manifest.save()
+        self.assertTrue(self.reloaded_manifest().check_file(self.path))
+
+    def test_modified_file_is_changed(self):
+        manifest = self.manifest()
+        manifest.check_file(self.path)
+        manifest.save()
+        self.write_file('second file')
+        self.assertFalse(self.reloaded_manifest().check_file(self.path))
+
+    def test_touched_file_with_same_content_is_unchanged(self):
+        manifest = self.manifest()
+        manifest.check_file(self.path)
+        manifest.save()
+        os.utime(self.path, (0, 0))
+        self.assertTrue(self.reloaded_manifest().check_file(self.path))
+
+    def test_file_filter_processes_everything_when_not_skipping(self):
+        manifest = self.manifest()
+        manifest.check_file(self.path)
+        manifest.save()
+        self.assertTrue(self.reloaded_manifest().file_filter(skip_unchanged=False)(self.path))
+        self.assertFalse(self.reloaded_manifest().file_filter()(self.path))
+
+    def test_node_filter_skips_unchanged_nodes(self):
+        nodes = [ElementTree.fromstring('<message><text>{}</text></message>'.format(i)) for i in range(3)]
+        manifest = self.manifest()
+        manifest.check_file(self.path)
+        node_filter = manifest.node_filter(self.path)
+        self.assertEqual([True, True, True], [node_filter(i, node) for i, node in enumerate(nodes)])
+        manifest.save()
+
+        self.write_file('appended to')
+        manifest = self.reloaded_manifest()
+        manifest.check_file(self.path)
+        node_filter = manifest.node_filter(self.path)
+        nodes.append(ElementTree.fromstring('<message><text>new</text></message>'))
+        self.assertEqual([False, False, False, True], [node_filter(i, node) for i, node in enumerate(nodes)])
+
+    def test_node_digests_are_kept_out_of_file_records(self):
+        nodes = [ElementTree.fromstring('<message><text>{}</text></message>'.format(i)) for i in range(3)]
+        self.record_nodes(self.manifest(), nodes)
+        self.assertNotIn('node_digests', self.saved_records()[0])
+        self.assertEqual([self.path], [document['path'] for document in self.saved_node_documents()])
+
+    def test_node_digests_are_split_across_documents(self):
+        nodes = [ElementTree.fromstring('<message><text>{}</text></message>'.format(i)) for i in range(5)]
+        with patch('data_import.manifest._node_digests_per_document', 2):
+            self.record_nodes(self.manifest(), nodes)
+            documents = self.saved_node_documents()
+            self.assertEqual([0, 1, 2], [document['chunk'] for document in documents])
+            self.assertEqual([32, 32, 16], [len(document['digests']) for document in documents])
+
+            self.write_file('appended to')
+            nodes.append(ElementTree.fromstring('<message><text>new</text></message>'))
+            self.assertEqual([False] * 5 + [True], self.record_nodes(self.reloaded_manifest(), nodes))
+
+    def test_old_node_digests_are_deleted_before_new_ones_are_written(self):
+        nodes = [ElementTree.fromstring('<message><text>{}</text></message>'.format(i)) for i in range(2)]
+        self.record_nodes(self.manifest(), nodes)
+        requests = self.saved_node_requests()
+        self.assertEqual({'path': self.path}, requests[0]._filter)
+        self.assertEqual(2, len(requests))
+
+    def test_clear_removes_node_digests(self):
+        self.manifest().clear()
+        self.collection.delete_many.assert_called_once_with({})
+        self.node_collection.delete_many.assert_called_once_with({})
+
+    def test_files_are_not_digested_when_digests_are_not_recorded(self):
+        manifest = self.manifest(record_digests=False)
+        with patch('data_import.manifest.file_digest') as file_digest:
+            manifest.check_file(self.path)
+            manifest.save()
+        self.assertFalse(file_digest.called)
+        self.assertIsNone(self.saved_records()[0]['digest'])
+
+    def test_touched_file_without_digest_is_changed(self):
+        manifest = self.manifest(record_digests=False)
+        manifest.check_file(self.path)
+        manifest.save()
+        os.utime(self.path, (0, 0))
+        self.assertFalse(self.reloaded_manifest().check_file(self.path))
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(SourceManifestTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
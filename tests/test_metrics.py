@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from data_import.metrics import ImportMetrics, Histogram, StageTimings
+
+
+class HistogramTests(unittest.TestCase):
+    def test_observe(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(4.25, histogram.sum)
+        self.assertEqual([(0.1, 1), (1.0, 3)], histogram.cumulative_counts())
+
+
+class StageTimingsTests(unittest.TestCase):
+    def test_stage_time_accumulates(self):
+        timings = StageTimings()
+        with timings.stage('mime_parse'):
+            pass
+        with timings.stage('mime_parse'):
+            pass
+        self.assertEqual(['mime_parse'], timings.keys())
+        self.assertGreaterEqual(timings['mime_parse'], 0)
+
+
+class ImportMetricsTests(unittest.TestCase):
+    def test_timer_observes_stage(self):
+        metrics = ImportMetrics()
+        with metrics.timer('hashing'):
+            pass
+        self.assertEqual(1, metrics.histogram('hashing').count)
+
+    def test_timer_observes_stage_that_raises(self):
+        metrics = ImportMetrics()
+        with self.assertRaises(ValueError):
+            with metrics.timer('mime_parse'):
+                raise ValueError()
+        self.assertEqual(1, metrics.histogram('mime_parse').count)
+
+    def test_record_timings(self):
+        metrics = ImportMetrics()
+        metrics.record(StageTimings(file_read=0.5, header_repair=0.25))
+        self.assertEqual(0.5, metrics.histogram('file_read').sum)
+        self.assertEqual(0.25, metrics.histogram('header_repair').sum)
+
+    def test_counters(self):
+        metrics = ImportMetrics()
+        metrics.increment('messages')
+        metrics.increment('messages', 2)
+        self.assertEqual(3, metrics.counter('messages'))
+        self.assertEqual(0, metrics.counter('duplicates_dropped'))
+
+    def test_to_prometheus(self):
+        metrics = ImportMetrics(buckets=(0.1, 1.0))
+        metrics.observe('mime_parse', 0.5)
+        metrics.increment('messages', 7)
+        metrics.set_gauge('eta_seconds', 12.5)
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE topsecret_import_stage_seconds histogram', text)
+        self.assertIn('topsecret_import_stage_seconds_bucket{stage="mime_parse",le="0.1"} 0', text)
+        self.assertIn('topsecret_import_stage_seconds_bucket{stage="mime_parse",le="1.0"} 1', text)
+        self.assertIn('topsecret_import_stage_seconds_bucket{stage="mime_parse",le="+Inf"} 1', text)
+        self.assertIn('topsecret_import_stage_seconds_sum{stage="mime_parse"} 0.5', text)
+        self.assertIn('topsecret_import_stage_seconds_count{stage="mime_parse"} 1', text)
+        self.assertIn('topsecret_import_messages_total 7', text)
+        self.assertIn('topsecret_import_eta_seconds 12.5', text)
+
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'import.prom')
+            metrics = ImportMetrics()
+            metrics.increment('messages')
+            metrics.write(path)
+            with open(path) as metrics_file:
+                self.assertEqual(metrics.to_prometheus(), metrics_file.read())
+            self.assertEqual(['import.prom'], os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite([loader.loadTestsFromTestCase(HistogramTests),
+                                loader.loadTestsFromTestCase(StageTimingsTests),
+                                loader.loadTestsFromTestCase(ImportMetricsTests)])
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
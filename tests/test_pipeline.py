@@ -0,0 +1,86 @@
+import time
+import random
+import threading
+import unittest
+from data_import.pipeline import merged
+
+
+def jittery(items, rng):
+    for item in items:
+        time.sleep(rng.random() * 0.002)
+        yield item
+
+
+def failing(items, error):
+    for item in items:
+        yield item
+    raise error
+
+
+class MergedTests(unittest.TestCase):
+    def test_items_keep_their_order_within_each_source(self):
+        rng = random.Random(0)
+        sources = [[(source, number) for number in range(rng.randint(0, 30))] for source in range(8)]
+        items = list(merged([jittery(source, rng) for source in sources], workers=4, buffer_size=3))
+        self.assertEqual(sorted(item for source in sources for item in source), sorted(items))
+        for number, source in enumerate(sources):
+            self.assertEqual(source, [item for item in items if item[0] == number])
+
+    def test_slow_source_does_not_block_others(self):
+        others_consumed = threading.Event()
+
+        def slow():
+            yield 'slow'
+            others_consumed.wait(5)
+            yield 'slow again'
+        received = []
+        for item in merged([slow(), range(20)], workers=2, buffer_size=1):
+            received.append(item)
+            if len([item for item in received if item != 'slow']) == 20:
+                others_consumed.set()
+        self.assertTrue(others_consumed.is_set())
+        self.assertEqual('slow again', received[-1])
+        self.assertEqual(range(20), [item for item in received if item not in ('slow', 'slow again')])
+
+    def test_stopping_early_releases_blocked_producers(self):
+        items = merged([range(100), range(100)], workers=2, buffer_size=1)
+        next(items)
+        items.close()
+        time.sleep(0.3)
+        self.assertEqual([], [thread for thread in threading.enumerate() if thread.name.startswith('import-producer')])
+
+    def test_empty_input(self):
+        self.assertEqual([], list(merged([])))
+
+    def test_more_workers_than_sources(self):
+        self.assertEqual([1, 2, 3], list(merged([[1], [2, 3]], workers=8)))
+
+    def test_error_is_raised_in_consumer(self):
+        items = merged([[1, 2], failing([3], ValueError('bad source')), [4]], workers=2)
+        with self.assertRaises(ValueError):
+            list(items)
+
+    def test_error_stops_the_merge_before_later_sources(self):
+        received = []
+        with self.assertRaises(ValueError):
+            for item in merged([failing([1, 2], ValueError('bad source')), [3, 4]], workers=1):
+                received.append(item)
+        self.assertEqual([], [item for item in received if item in (3, 4)])
+
+    def test_error_in_later_source_stops_the_merge_early(self):
+        received = []
+
+        def slow():
+            for number in range(1000):
+                time.sleep(0.001)
+                yield number
+        with self.assertRaises(ValueError):
+            for item in merged([slow(), failing([], ValueError('bad source'))], workers=2):
+                received.append(item)
+        self.assertLess(len(received), 1000)
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(MergedTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+from data_import.process import Processor
+from mock import patch, MagicMock, Mock
+
+TIMEZONE = 'US/Eastern'
+
+MESSAGE_NODE = ('<message id="{0}"><subject>{1} {0}</subject>'
+                '<from><name>Ben Peterson</name><email>killthrush@hotmail.com</email></from>'
+                '<to><name>Mary Anne Lee</name><email>simitatores@yahoo.com</email></to>'
+                '<receivedat><date>1/2/2003</date><time>10:{0:02d} AM</time></receivedat>'
+                '<text>{1} body {0}</text></message>')
+
+EML_FILE = ('Subject: eml {0}\r\n'
+            'Date: Wed, 1 Jan 2003 10:{0:02d}:00 -0500\r\n'
+            '\r\n'
+            'eml body {0}\r\n')
+
+
+class ProcessorTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sources = [
+            ('xml', self.write_dump('first.xml', 'first', 25), TIMEZONE),
+            ('eml', self.write_eml_directory('eml', 10), TIMEZONE),
+            ('xml', self.write_dump('second.xml', 'second', 25), TIMEZONE)
+        ]
+        self.patchers = [patch('data_import.process.' + name) for name in
+                         ('get_client', 'AttachmentStore', 'mark_import_finished', 'ensure_indexes')]
+        get_client, _, _, ensure_indexes = [patcher.start() for patcher in self.patchers]
+        get_client.return_value = {'topsecret': defaultdict(MagicMock)}
+        ensure_indexes.return_value = []
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.directory)
+
+    def write_dump(self, file_name, name, count):
+        path = os.path.join(self.directory, file_name)
+        with open(path, 'w') as dump_file:
+            dump_file.write('<?xml version="1.0" encoding="utf-8"?>\n<messages>{}</messages>\n'.format(
+                ''.join(MESSAGE_NODE.format(number, name) for number in range(count))))
+        return path
+
+    def write_eml_directory(self, directory_name, count):
+        path = os.path.join(self.directory, directory_name)
+        os.makedirs(path)
+        for number in range(count):
+            with open(os.path.join(path, '{:02d}.eml'.format(number)), 'w') as eml_file:
+                eml_file.write(EML_FILE.format(number))
+        return path
+
+    def numbered_sources(self):
+        processor = Processor(os.path.join(self.directory, 'processed'), eml_workers=1, source_workers=3,
+                              buffer_size=2)
+        source_collection = processor._source_collection
+        source_collection.reset_mock()
+        source_collection.insert_many.side_effect = lambda documents, ordered: Mock(inserted_ids=documents)
+        with patch('sys.stdout'):
+            processor.process_all(self.sources)
+        documents = [document for call in source_collection.insert_many.call_args_list for document in call[0][0]]
+        return sorted((document['source_number'], document['number'], document['source']) for document in documents)
+
+    def test_messages_are_numbered_by_source_and_position(self):
+        numbered = self.numbered_sources()
+        self.assertEqual([(0, number) for number in range(1, 26)] + [(1, number) for number in range(1, 11)] +
+                         [(2, number) for number in range(1, 26)],
+                         [(source_number, number) for source_number, number, source in numbered])
+        for source_number, number, source in numbered:
+            self.assertIn(self.sources[source_number][1], source)
+        for source_number, number, source in numbered:
+            if source_number != 1:
+                self.assertIn("'id': '{}'".format(number - 1), source)
+
+    def test_numbering_is_repeatable(self):
+        self.assertEqual(self.numbered_sources(), self.numbered_sources())
+
+    def test_files_are_named_by_source_and_position(self):
+        self.numbered_sources()
+        file_names = sorted(os.listdir(os.path.join(self.directory, 'processed')))
+        self.assertEqual(60, len(file_names))
+        self.assertEqual(u'00_0001_', file_names[0][:8])
+        self.assertEqual(u'02_0025_', file_names[-1][:8])
+
+    def test_full_import_clears_attachment_store(self):
+        processor = Processor(os.path.join(self.directory, 'processed'), eml_workers=1)
+        processor._attachment_store.clear.assert_called_once_with()
+
+    def test_incremental_import_keeps_attachment_store(self):
+        processor = Processor(os.path.join(self.directory, 'processed'), eml_workers=1, incremental=True)
+        self.assertFalse(processor._attachment_store.clear.called)
+
+    def test_flush_reports_run_totals(self):
+        processor = Processor(os.path.join(self.directory, 'processed'), eml_workers=1)
+        processor._email_writer = Mock(inserted_count=40, duplicate_count=3)
+        processor._email_writer.flush.return_value = (2, 1)
+        processor._dropped_duplicate_counter = 5
+        with patch('sys.stdout') as stdout:
+            processor.flush()
+        self.assertIn('Wrote 40 documents, skipped 8 duplicates.', ''.join(call[0][0] for call in stdout.write.call_args_list))
+
+    def test_incremental_numbering_carries_on_per_source(self):
+        processor = Processor(os.path.join(self.directory, 'processed'), eml_workers=1, incremental=True)
+        processor._source_collection.count.side_effect = lambda query=None: 3 if query == {'source_number': 1} else 0
+        message = Mock()
+        processor.number_message(1, message)
+        processor.number_message(0, message)
+        processor.number_message(1, message)
+        self.assertEqual((1, 5), (message.source_number, message.ordinal_number))
+        self.assertEqual(1, processor._source_counters[0])
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(ProcessorTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+from web.profiling import RequestTimings, SamplingProfiler
+
+
+class RequestTimingsTests(unittest.TestCase):
+    def test_phases_are_summarized_in_order(self):
+        timings = RequestTimings()
+        with timings.phase('validate'):
+            pass
+        timings.add('query', 0.0125)
+        summary = timings.summary()
+        self.assertTrue(summary.startswith('validate=0.0ms query=12.5ms total='))
+
+    def test_phase_time_accumulates(self):
+        timings = RequestTimings()
+        timings.add('fetch', 0.001)
+        timings.add('fetch', 0.002)
+        self.assertAlmostEqual(0.003, timings.phases['fetch'])
+
+    def test_iterate_times_each_step(self):
+        timings = RequestTimings()
+        self.assertEqual([1, 2, 3], list(timings.iterate([1, 2, 3], 'fetch')))
+        self.assertIn('fetch', timings.phases)
+
+    def test_timed_function(self):
+        timings = RequestTimings()
+        self.assertEqual('[1]', timings.timed(lambda value: str([value]), 'serialize')(1))
+        self.assertIn('serialize', timings.phases)
+
+
+class SamplingProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_no_requests_are_sampled_by_default(self):
+        self.assertIsNone(SamplingProfiler(self.directory).start())
+
+    def test_sampled_profile_is_written(self):
+        profiler = SamplingProfiler(os.path.join(self.directory, 'profiles'), sample_rate=1.0)
+        profile = profiler.start()
+        path = profiler.finish(profile, 'emails_all')
+        self.assertTrue(os.path.isfile(path))
+        self.assertTrue(path.endswith('_1_emails_all.prof'))
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    timing_tests = loader.loadTestsFromTestCase(RequestTimingsTests)
+    profiler_tests = loader.loadTestsFromTestCase(SamplingProfilerTests)
+    suite = unittest.TestSuite([timing_tests, profiler_tests])
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
@@ -0,0 +1,48 @@
+import unittest
+from mock import patch
+from data_import.progress import SourceProgress, ImportProgress
+
+
+class ImportProgressTests(unittest.TestCase):
+    @patch('data_import.progress.time.time')
+    def test_eta_from_input_read(self, now):
+        now.return_value = 100.0
+        progress = ImportProgress(interval=10)
+        first, second = SourceProgress('a', 600), SourceProgress('b', 400)
+        progress.add_source(first)
+        progress.add_source(second)
+        first.message_processed(250)
+        now.return_value = 120.0
+        self.assertEqual(0.25, progress.fraction_done)
+        self.assertEqual(60.0, progress.eta())
+
+    def test_eta_unknown_before_any_input_is_read(self):
+        progress = ImportProgress()
+        progress.add_source(SourceProgress('a', 600))
+        self.assertIsNone(progress.eta())
+        self.assertIn('ETA unknown', progress.report())
+
+    def test_finished_source_counts_as_fully_read(self):
+        progress = ImportProgress()
+        source = SourceProgress('a', 600)
+        progress.add_source(source)
+        source.message_processed()
+        source.finish()
+        self.assertEqual(1.0, progress.fraction_done)
+        self.assertEqual(1, progress.message_count)
+
+    @patch('data_import.progress.time.time')
+    def test_report_due_after_interval(self, now):
+        now.return_value = 100.0
+        progress = ImportProgress(interval=10)
+        self.assertFalse(progress.report_due())
+        now.return_value = 110.0
+        self.assertTrue(progress.report_due())
+        progress.report()
+        self.assertFalse(progress.report_due())
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(ImportProgressTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
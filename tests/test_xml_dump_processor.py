@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from dateutil.parser import parse
+from data_import.xml_dump_processor import XMLDumpProcessor
+from data_import.email_parsing_helpers import normalize_to_utc
+
+TIMEZONE = 'US/Eastern'
+
+MESSAGE_NODE = ('<message id="{0}"><subject>subject {0}</subject>'
+                '<from><name>Ben Peterson</name><email>killthrush@hotmail.com</email></from>'
+                '<to><name>Mary Anne Lee</name><email>simitatores@yahoo.com</email></to>'
+                '<receivedat><date>1/{1}/2003</date><time>10:{1:02d} AM</time></receivedat>'
+                '<text>body {0}</text></message>')
+
+
+class XMLDumpProcessorTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dump.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_dump(self, content):
+        with open(self.path, 'w') as dump_file:
+            dump_file.write('<?xml version="1.0" encoding="utf-8"?>\n<messages>{}</messages>\n'.format(content))
+
+    def messages(self, count):
+        return ''.join(MESSAGE_NODE.format(number, number + 1) for number in range(count))
+
+    def test_consecutive_messages_are_all_yielded(self):
+        self.write_dump(self.messages(3))
+        messages = list(XMLDumpProcessor(self.path, TIMEZONE).iter_messages())
+        self.assertEqual([u'subject 0', u'subject 1', u'subject 2'], [message.subject for message in messages])
+
+    def test_messages_nested_in_folders_are_all_yielded(self):
+        self.write_dump('<folder name="inbox">{}<folder name="old">{}</folder></folder>{}'.format(
+            MESSAGE_NODE.format(0, 1), MESSAGE_NODE.format(1, 2), MESSAGE_NODE.format(2, 3)))
+        messages = list(XMLDumpProcessor(self.path, TIMEZONE).iter_messages())
+        self.assertEqual([u'subject 0', u'subject 1', u'subject 2'], [message.subject for message in messages])
+
+    def test_node_filter_skips_nodes(self):
+        self.write_dump(self.messages(4))
+        seen = []
+
+        def node_filter(position, node):
+            seen.append((position, node.get('id')))
+            return position % 2 == 0
+        messages = list(XMLDumpProcessor(self.path, TIMEZONE, node_filter=node_filter).iter_messages())
+        self.assertEqual([u'subject 0', u'subject 2'], [message.subject for message in messages])
+        self.assertEqual([(0, '0'), (1, '1'), (2, '2'), (3, '3')], seen)
+
+    def test_skipped_nodes_do_not_trigger_callbacks(self):
+        self.write_dump(self.messages(2))
+        extracted = []
+        processor = XMLDumpProcessor(self.path, TIMEZONE, node_filter=lambda position, node: position == 1)
+        processor.add_callback('test', extracted.append)
+        list(processor.iter_messages())
+        self.assertEqual([u'subject 1'], [message.subject for message in extracted])
+
+    def test_fields_survive_clearing_of_processed_nodes(self):
+        self.write_dump(self.messages(3))
+        messages = list(XMLDumpProcessor(self.path, TIMEZONE).iter_messages())
+        for number, message in enumerate(messages):
+            expected_date = normalize_to_utc(parse('1/{0}/2003 10:{0:02d} AM'.format(number + 1)), TIMEZONE)
+            self.assertEqual(u'subject {}'.format(number), message.subject)
+            self.assertTrue(message.body.endswith(u'body {}'.format(number)))
+            self.assertEqual(expected_date, message.date)
+            self.assertIn("'id': '{}'".format(number), message.source)
+
+    def test_bytes_read_reaches_end_of_file(self):
+        self.write_dump(self.messages(3))
+        processor = XMLDumpProcessor(self.path, TIMEZONE)
+        list(processor.iter_messages())
+        self.assertGreater(processor.bytes_read, 0)
+        self.assertLessEqual(processor.bytes_read, os.path.getsize(self.path))
+
+if __name__ == '__main__':
+    loader = unittest.TestLoader()
+    user_tests = loader.loadTestsFromTestCase(XMLDumpProcessorTests)
+    suite = unittest.TestSuite(user_tests)
+    unittest.TextTestRunner(descriptions=True, verbosity=2).run(suite)
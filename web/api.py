@@ -1,10 +1,57 @@
 import json
-from flask import Flask, request, Response
-from voluptuous import Schema, Required, All, Length, Range, Invalid, Coerce
-from common.data_facade import DataFacade, DEFAULT_PAGE_SIZE
+import time
+import logging
+import hashlib
+from contextlib import contextmanager
+from flask import Flask, request, Response, abort, g
+from gridfs.errors import NoFile
+from voluptuous import Schema, Required, All, Length, Range, Invalid, Coerce, In
+from pymongo.errors import PyMongoError
+from common.config import AppConfig
+from common.data_facade import (
+    DataFacade,
+    DEFAULT_PAGE_SIZE,
+    INDEXED_SEARCH,
+    SUBSTRING_SEARCH,
+    SORTABLE_FIELDS,
+    SUMMARY_FIELDS,
+    FIELD_EXPRESSIONS,
+    DEFAULT_FACET_LIMIT,
+    MINIMUM_SERVER_VERSION
+)
+from common.email_message import normalize_search_value
+from web.cache import ByteSizedLRUCache
+from web.profiling import RequestTimings, SamplingProfiler
 
 app = Flask('topsecret')
-data_facade = DataFacade(app)
+data_facade = DataFacade(app, read_preference_name=AppConfig.api_read_preference)
+
+# Serialized single emails, keyed by ID, serialized list pages, keyed by their normalized query,
+# and serialized counts, keyed by their normalized filter
+email_cache = ByteSizedLRUCache(AppConfig.email_cache_bytes)
+page_cache = ByteSizedLRUCache(AppConfig.page_cache_bytes)
+facet_cache = ByteSizedLRUCache(AppConfig.facet_cache_bytes)
+_cache_state = {'generation': None, 'checked': 0}
+
+# Request timing, slow query logging and profiling start out as configured, and can then be
+# changed for every process at once with data_facade.set_instrumentation()
+request_logger = logging.getLogger(AppConfig.app_name + '.requests')
+profiler = SamplingProfiler(AppConfig.profile_directory, AppConfig.profile_sample_rate)
+data_facade.slow_query_ms = AppConfig.slow_query_ms
+_instrumentation = {'request_timing': AppConfig.request_timing, 'checked': 0}
+
+
+def field_list(value):
+    """
+    Validates a comma-separated list of field names
+    :param value: The raw parameter value
+    :return: A list of field names
+    """
+    fields = [field.strip() for field in unicode(value).split(',')]
+    unknown = [field for field in fields if field not in FIELD_EXPRESSIONS]
+    if unknown:
+        raise Invalid("Unknown field(s): {}".format(', '.join(unknown)))
+    return fields
 
 validate_get_page = Schema({
     Required('page', default=1): All(Coerce(int), Range(min=1), msg='Page must be an integer >= 1'),
@@ -12,28 +59,298 @@ validate_get_page = Schema({
     'body': All(unicode, Length(min=1), msg="Body search must be a nonzero-length string if specified"),
     'sender': All(unicode, Length(min=1), msg="Sender search must be a nonzero-length string if specified"),
     'recipient': All(unicode, Length(min=1), msg="Recipient search must be a nonzero-length string if specified"),
-    'sort': All(unicode, Length(min=1), msg="Sort attribute must be a nonzero-length string if specified")
+    'sort': All(unicode, In(SORTABLE_FIELDS), msg="Sort attribute must be one of {} if specified".format(', '.join(SORTABLE_FIELDS))),
+    'cursor': All(unicode, Length(min=1), msg="Cursor must be a nonzero-length string if specified"),
+    'search': All(unicode, In([INDEXED_SEARCH, SUBSTRING_SEARCH]), msg="Search must be 'indexed' or 'substring' if specified"),
+    Required('fields', default=list(SUMMARY_FIELDS)): All(field_list, msg="Fields must be a comma-separated list of {}".format(', '.join(sorted(FIELD_EXPRESSIONS))))
 })
 
+validate_get_facets = Schema({
+    'body': All(unicode, Length(min=1), msg="Body search must be a nonzero-length string if specified"),
+    'sender': All(unicode, Length(min=1), msg="Sender search must be a nonzero-length string if specified"),
+    'recipient': All(unicode, Length(min=1), msg="Recipient search must be a nonzero-length string if specified"),
+    'search': All(unicode, In([INDEXED_SEARCH, SUBSTRING_SEARCH]), msg="Search must be 'indexed' or 'substring' if specified"),
+    Required('facet_limit', default=DEFAULT_FACET_LIMIT): All(Coerce(int), Range(min=1, max=100), msg='Facet limit must be an integer >= 1 and <= 100')
+})
+
+
+@app.before_first_request
+def ensure_indexes():
+    """
+    Make sure the email collection has every index the API's queries rely on
+    :return: None
+    """
+    try:
+        created = data_facade.ensure_indexes(AppConfig.email_collection)
+    except PyMongoError as e:
+        app.logger.error('Could not ensure indexes: %s', e)
+        return
+    if created:
+        app.logger.warning('Created missing indexes: %s', ', '.join(created))
+
+
+def check_server_version():
+    """
+    Warn if the MongoDB server is too old for the API's queries, which would otherwise only fail once they run
+    :return: None
+    """
+    try:
+        version = data_facade.server_version()
+    except PyMongoError as e:
+        app.logger.error('Could not check the MongoDB server version: %s', e)
+        return
+    if version < MINIMUM_SERVER_VERSION:
+        app.logger.error('MongoDB %s is older than %s; /emails and /emails/facets will fail.',
+                         '.'.join(str(part) for part in version), '.'.join(str(part) for part in MINIMUM_SERVER_VERSION))
+
+app.before_first_request(check_server_version)
+
+
+@app.before_request
+def refresh_instrumentation():
+    """
+    Pick up instrumentation settings changed at runtime.
+    The settings are checked at most once every cache_check_interval seconds.
+    :return: None
+    """
+    now = time.time()
+    if now - _instrumentation['checked'] < AppConfig.cache_check_interval:
+        return
+    _instrumentation['checked'] = now
+    try:
+        settings = data_facade.instrumentation_settings()
+    except PyMongoError as e:
+        app.logger.error('Could not check instrumentation settings: %s', e)
+        return
+    apply_instrumentation(settings)
+
+
+def apply_instrumentation(settings):
+    """
+    Switch request timing, slow query logging and profiling on or off.  Settings
+    that are missing go back to their configured values.
+    :param settings: A dict of instrumentation settings, as stored by set_instrumentation()
+    :return: None
+    """
+    _instrumentation['request_timing'] = settings.get('request_timing', AppConfig.request_timing)
+    data_facade.slow_query_ms = settings.get('slow_query_ms', AppConfig.slow_query_ms)
+    profiler.sample_rate = settings.get('profile_sample_rate', AppConfig.profile_sample_rate)
+
+
+@app.before_request
+def start_instrumentation():
+    """
+    Start timing the request's phases and, if it is sampled, profiling it
+    :return: None
+    """
+    g.timings = RequestTimings() if _instrumentation['request_timing'] else None
+    g.profile = profiler.start()
+
+
+@app.after_request
+def finish_instrumentation(response):
+    """
+    Log the request's phase timings and write out its profile.  For streamed responses this
+    happens once the body has been sent, so that fetching and serializing are included.
+    :param response: The response to the request
+    :return: The response
+    """
+    timings = g.get('timings')
+    profile = g.get('profile')
+    if timings is None and profile is None:
+        return response
+    description = (request.method, request.full_path.rstrip('?'), request.endpoint)
+    if response.is_streamed:
+        response.response = _finishing(response.response, timings, profile, description, response.status_code)
+    else:
+        _finish_request(timings, profile, description, response.status_code)
+    return response
+
+
+@app.teardown_request
+def stop_failed_profile(exception):
+    """
+    Stop profiling a request that failed before its response was made, so the profile
+    doesn't carry on into later requests on the same thread
+    :param exception: The unhandled exception, if any
+    :return: None
+    """
+    profile = g.get('profile')
+    if exception is not None and profile is not None:
+        profile.disable()
+
+
+def _finishing(chunks, timings, profile, description, status_code):
+    """
+    Passes streamed chunks through, finishing the request's instrumentation once they are sent
+    or the client goes away
+    :param chunks: The response's chunks
+    :param timings: The request's RequestTimings, or None
+    :param profile: The request's profile, or None
+    :param description: A tuple of the request's method, path and endpoint
+    :param status_code: The response's status code
+    :return: A generator of the chunks
+    """
+    try:
+        for chunk in chunks:
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        _finish_request(timings, profile, description, status_code)
+
+
+def _finish_request(timings, profile, description, status_code):
+    method, path, endpoint = description
+    if timings is not None:
+        request_logger.info('%s %s %s %s', method, path, status_code, timings.summary())
+    if profile is not None:
+        profile_path = profiler.finish(profile, endpoint or 'unknown')
+        request_logger.info('Wrote profile of %s %s to %s', method, path, profile_path)
+
+
+@contextmanager
+def _untimed():
+    yield
+
+
+def _phase(name):
+    """
+    Time a block of code as a phase of the current request, if request timing is on
+    :param name: The name of the phase
+    :return: A context manager
+    """
+    timings = g.get('timings')
+    return timings.phase(name) if timings is not None else _untimed()
+
+
+@app.before_request
+def invalidate_stale_caches():
+    """
+    Drop cached responses once an import run has finished since they were cached.
+    The import status is checked at most once every cache_check_interval seconds.
+    :return: None
+    """
+    now = time.time()
+    if now - _cache_state['checked'] < AppConfig.cache_check_interval:
+        return
+    _cache_state['checked'] = now
+    try:
+        generation = data_facade.import_generation()
+    except PyMongoError as e:
+        app.logger.error('Could not check import status: %s', e)
+        return
+    if generation != _cache_state['generation']:
+        invalidate_caches()
+        _cache_state['generation'] = generation
+
+
+def invalidate_caches():
+    """
+    Drop every cached response
+    :return: None
+    """
+    email_cache.clear()
+    page_cache.clear()
+    facet_cache.clear()
+
+
+def reset_connections():
+    """
+    Drop any Mongo connections and cached responses inherited from a parent process.
+    Serving workers call this right after they are forked.
+    :return: None
+    """
+    with app.app_context():
+        data_facade.close()
+    invalidate_caches()
+    _cache_state['checked'] = 0
+    _instrumentation['checked'] = 0
+
+
 @app.route('/emails/<id>', methods=['GET'])
 def emails_by_id(id):
     """
-    Load an email by its unique ID/hash
+    Load an email by its unique ID/hash.  IDs are content hashes, so they double as strong ETags,
+    but the email is still looked up before a client's copy is confirmed, in case it has since been removed.
     :param id: the ID/hash of the email to load
-    :return: A json object containing the email (200), 404 if not found, or 400 if id is invalid.
+    :return: A json object containing the email (200), 304 if the client's copy is current,
+    404 if not found, or 400 if id is invalid.
     """
-    email = data_facade.db.email.find_one_or_404({'_id': id})
-    return json.dumps(email)
+    with _phase('cache'):
+        json_data = email_cache.get(id)
+    if json_data is None:
+        with _phase('query'):
+            email = data_facade.db.email.find_one_or_404({'_id': id})
+        with _phase('serialize'):
+            json_data = json.dumps(email)
+        email_cache.put(id, json_data, len(json_data))
+    response = Response(json_data, mimetype='application/json')
+    response.set_etag(id)
+    return response.make_conditional(request)
+
+
+@app.route('/attachments/<digest>', methods=['GET'])
+def attachment_by_digest(digest):
+    """
+    Download the content of an attachment, streamed from the attachment store chunk by chunk
+    :param digest: the digest of the attachment, as referenced by an email's attachment list
+    :return: The attachment content (200) or 404 if not found.
+    """
+    try:
+        attachment = data_facade.open_attachment(digest)
+    except NoFile:
+        abort(404)
+    response = Response(attachment, mimetype=attachment.content_type or 'application/octet-stream')
+    response.headers['Content-Length'] = str(attachment.length)
+    return response
+
+
+@app.route('/emails/facets', methods=['GET'])
+def emails_facets():
+    """
+    Count the emails matching the same query parameters as /emails, so clients can render pagers
+    and filter sidebars without paging through every result.  Along with the total, the most common
+    senders and recipients, the number of emails per month (YYYY-MM) and a histogram of attachment
+    counts are returned, each as a list of {"value": ..., "count": ...} objects.
+    :return: A json object containing the counts (200) or 400 if one or more parameters are invalid.
+    """
+    try:
+        with _phase('validate'):
+            querystring = validate_get_facets(request.args)
+    except Invalid as e:
+        return e.error_message, 400
+
+    cache_key = _facet_cache_key(querystring)
+    with _phase('cache'):
+        json_data = facet_cache.get(cache_key)
+    if json_data is None:
+        try:
+            with _phase('query'):
+                counts = data_facade.count(AppConfig.email_collection, **querystring)
+        except ValueError as e:
+            return e.message, 400
+        with _phase('serialize'):
+            json_data = json.dumps(counts)
+        facet_cache.put(cache_key, json_data, len(json_data))
+    response = Response(json_data, mimetype='application/json')
+    response.set_etag(hashlib.md5(json_data).hexdigest())
+    return response.make_conditional(request)
 
 
 @app.route('/emails', methods=['GET'])
 def emails_all():
     """
-    Load a group of multiple emails using optional query parameters
+    Load a group of multiple emails using optional query parameters.
+    Emails are returned as summaries unless other fields are requested; /emails/<id> returns the whole email.
+    The page is loaded with a single query and serialized one document at a time.  Its ETag comes from the import generation and the normalized
+    query, so a client's copy is confirmed without loading the page.  When there is a following page,
+    an X-Next-Cursor header carries a cursor that loads it.
     :return: A json array containing matching emails (200) or 400 if one or more parameters are invalid.
     """
     try:
-        querystring = validate_get_page(request.args)
+        with _phase('validate'):
+            querystring = validate_get_page(request.args)
     except Invalid as e:
         return e.error_message, 400
 
@@ -54,10 +371,111 @@ def emails_all():
     # page = querystring.get('page')
     # page_size = querystring.get('page_size')
 
-    emails = data_facade.load('email', **querystring)
+    cache_key = _page_cache_key(querystring)
+    etag = _page_etag(cache_key)
+    if etag is not None and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    with _phase('cache'):
+        cached_page = page_cache.get(cache_key)
+    if cached_page is not None:
+        json_data, next_cursor = cached_page
+    else:
+        try:
+            with _phase('query'):
+                emails, next_cursor = data_facade.load_page(AppConfig.email_collection, **querystring)
+        except ValueError as e:
+            return e.message, 400
+        json_data = _caching_page(_iter_json_array(emails, g.timings), cache_key, next_cursor)
+
+    response = Response(json_data, mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 
-    json_data = json.dumps([email for email in emails])
-    return Response(json_data, mimetype='application/json')
+def _page_etag(cache_key):
+    """
+    Builds the ETag of a list page.  Pages only change when an import run finishes, so the import
+    generation and the normalized query identify a page's content without loading it.
+    :param cache_key: The page's cache key, from _page_cache_key()
+    :return: An ETag string, or None if the import generation hasn't been read yet
+    """
+    generation = _cache_state['generation']
+    if generation is None:
+        return None
+    return hashlib.md5(repr((generation, cache_key))).hexdigest()
+
+
+def _page_cache_key(querystring):
+    """
+    Builds a cache key for a list query that doesn't depend on parameter order
+    :param querystring: The validated query parameters
+    :return: A hashable key
+    """
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in querystring.items()))
+
+
+def _facet_cache_key(querystring):
+    """
+    Builds a cache key for a count query.  Indexed sender and recipient searches match
+    normalized prefixes, so filters that differ only in case or spacing share an entry.
+    :param querystring: The validated query parameters
+    :return: A hashable key
+    """
+    normalized = dict(querystring)
+    if normalized.get('search', INDEXED_SEARCH) == INDEXED_SEARCH:
+        normalized.pop('search', None)
+        for name in ('sender', 'recipient'):
+            if name in normalized:
+                normalized[name] = normalize_search_value(normalized[name])
+    return _page_cache_key(normalized)
+
+
+def _caching_page(chunks, cache_key, next_cursor):
+    """
+    Passes streamed json chunks through, caching the complete page afterwards
+    if it is small enough to be worth keeping
+    :param chunks: The json text chunks of the page
+    :param cache_key: The key to cache the page under
+    :param next_cursor: The cursor of the following page, cached along with the page
+    :return: A generator of json text chunks
+    """
+    collected = []
+    size = 0
+    for chunk in chunks:
+        yield chunk
+        if collected is not None:
+            size += len(chunk)
+            collected.append(chunk)
+            if size > AppConfig.page_cache_entry_bytes:
+                collected = None  # too large to cache, stop holding on to it
+    if collected is not None:
+        page_cache.put(cache_key, (''.join(collected), next_cursor), size)
+
+
+def _iter_json_array(documents, timings=None):
+    """
+    Serializes documents into a json array one document at a time, so that
+    a response can be streamed as the page is consumed
+    :param documents: An iterable of json-serializable documents
+    :param timings: Optional RequestTimings that fetching and serializing are recorded in
+    :return: A generator of json text chunks
+    """
+    dumps = json.dumps
+    if timings is not None:
+        documents = timings.iterate(documents, 'fetch')
+        dumps = timings.timed(json.dumps, 'serialize')
+    yield '['
+    separator = ''
+    for document in documents:
+        yield separator + dumps(document)
+        separator = ', '
+    yield ']'
 
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+
+class ByteSizedLRUCache(object):
+    """
+    Thread-safe least-recently-used cache of serialized responses,
+    bounded by the total size in bytes of the values it holds
+    """
+    def __init__(self, max_bytes):
+        """
+        Initializer for the ByteSizedLRUCache class
+        :param max_bytes: The maximum total size of cached values.  Larger values are never cached.
+        :return: None
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a cached value, marking it as recently used
+        :param key: The cache key
+        :return: The cached value, or None if it isn't cached
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+            return entry[1]
+
+    def put(self, key, value, size):
+        """
+        Cache a value, evicting the least recently used values until it fits
+        :param key: The cache key
+        :param value: The value to cache
+        :param size: The size of the value in bytes
+        :return: True if the value was cached, else False
+        """
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[0]
+            while self._entries and self._size + size > self.max_bytes:
+                evicted_size, _ = self._entries.popitem(last=False)[1]
+                self._size -= evicted_size
+            self._entries[key] = (size, value)
+            self._size += size
+            return True
+
+    def clear(self):
+        """
+        Remove every cached value
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        """
+        The total size in bytes of the cached values
+        :return: int
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
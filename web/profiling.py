@@ -0,0 +1,138 @@
+import os
+import time
+import random
+import cProfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RequestTimings(object):
+    """
+    Records how long each phase of handling a single request takes
+    """
+    def __init__(self):
+        """
+        Initializer for the RequestTimings class
+        :return: None
+        """
+        self.phases = OrderedDict()
+        self._started = time.time()
+
+    def add(self, name, seconds):
+        """
+        Add time to a phase
+        :param name: The name of the phase
+        :param seconds: The time to add
+        :return: None
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block of code as part of a phase
+        :param name: The name of the phase
+        :return: A context manager
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def iterate(self, iterable, name):
+        """
+        Time each step of an iteration as part of a phase, e.g. fetching from a database cursor
+        :param iterable: The iterable to step through
+        :param name: The name of the phase
+        :return: A generator of the iterable's items
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.time() - start)
+                return
+            self.add(name, time.time() - start)
+            yield item
+
+    def timed(self, function, name):
+        """
+        Wrap a function so that every call is timed as part of a phase
+        :param function: The function to wrap
+        :param name: The name of the phase
+        :return: The wrapped function
+        """
+        def timed_function(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return timed_function
+
+    @property
+    def total(self):
+        """
+        The number of seconds since the request started
+        :return: float
+        """
+        return time.time() - self._started
+
+    def summary(self):
+        """
+        Returns the phase timings on one line, e.g. 'validate=0.2ms query=10.4ms total=12.9ms'
+        :return: string
+        """
+        phases = ['{}={:.1f}ms'.format(name, seconds * 1000) for name, seconds in self.phases.items()]
+        return ' '.join(phases + ['total={:.1f}ms'.format(self.total * 1000)])
+
+
+class SamplingProfiler(object):
+    """
+    Profiles a random sample of requests with cProfile, writing each profile to its own file.
+    The sample rate can be changed at any time; a rate of 0 turns profiling off.
+    """
+    def __init__(self, output_directory, sample_rate=0.0):
+        """
+        Initializer for the SamplingProfiler class
+        :param output_directory: The directory profiles are written to
+        :param sample_rate: The share of requests to profile, between 0 and 1
+        :return: None
+        """
+        self.output_directory = output_directory
+        self.sample_rate = sample_rate
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Decide whether to profile the current request, and if so start profiling its thread
+        :return: An enabled cProfile.Profile, or None if the request is not sampled
+        """
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile, name):
+        """
+        Stop a profile and write it out, for reading with pstats or snakeviz
+        :param profile: The profile returned by start()
+        :param name: A name for the profiled request, used in the file name
+        :return: The path of the written profile
+        """
+        profile.disable()
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        if not os.path.exists(self.output_directory):
+            try:
+                os.makedirs(self.output_directory)
+            except OSError:
+                pass  # another thread or worker created it first
+        file_name = '{}_{}_{}_{}.prof'.format(int(time.time()), os.getpid(), counter, name)
+        path = os.path.join(self.output_directory, file_name)
+        profile.dump_stats(path)
+        return path
@@ -0,0 +1,14 @@
+"""
+WSGI entry point for serving the API in production, e.g.
+
+    gunicorn -c gunicorn_config.py wsgi:application
+
+Only the web modules are imported here; the importer is never loaded by the server.
+"""
+import logging
+from web.api import app
+
+# request timings and slow queries are logged at INFO and WARNING; gunicorn captures stderr
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+
+application = app